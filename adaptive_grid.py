@@ -0,0 +1,108 @@
+# Builds a non-uniform wavelength grid that is only fine where the
+# curves in a prescription have structure (dichroic edges, grating
+# blazes) and coarse where they are smooth (most coatings)
+#
+# The grid is a subset of the uniform output grid and is refined until
+# any product of the curves (a section or a whole path), linearly
+# interpolated from the adaptive grid back onto the uniform grid, is
+# within tol. Two things are checked on every interval between nodes:
+# - each curve on its own. Curves are piecewise linear between their
+#   source wavelengths, so their largest interpolation error is at one
+#   of those. Half of tol is shared between the curves
+# - the product. Each factor is (close to) linear on an interval, so the
+#   product's curvature comes from pairs of slopes. With P and N the summed
+#   rises and falls of all curves over an interval, any product's error is
+#   at most max(P**2, N**2, 2*P*N) / 8, which is kept below the other half
+#   of tol
+# Both bounds assume transmissions of at most 1
+import numpy as np
+
+from resample import Resampler
+
+
+def adaptive_grid(wave, curves, tol=1e-3, weights=None, n_start=64,
+                  extrapolate='linear', fill_value=np.nan):
+    """
+    pick the grid points of wave needed to represent curves, and any
+    product of them, within tol
+
+    inputs
+    ------
+    wave - array [nm]
+        uniform (or any sorted) output grid
+    curves - list
+        (x [nm], y) source curves, e.g. read_curve(...).wave and .values
+    tol - float (default: 1e-3)
+        largest allowed absolute error of a product of the curves when
+        linearly interpolated from the adaptive grid back onto wave
+    weights - list (default: None)
+        number of times each curve appears in the prescription, e.g. a
+        coating used on 4 surfaces. None counts each curve once
+    n_start - int (default: 64)
+        number of evenly spaced intervals to start refining from
+    extrapolate - str (default: 'linear')
+        extrapolation policy of the curves outside their range, see Resampler
+    fill_value - float (default: nan)
+        value outside the curve range for extrapolate='constant'
+
+    outputs
+    -------
+    idx - array
+        sorted indices into wave of the adaptive grid, always includes
+        the first and last point
+    """
+    n = len(wave)
+    idx = np.unique(np.linspace(0, n - 1, min(n_start, n - 1) + 1).astype(int))
+    weights = np.ones(len(curves)) if weights is None else np.asarray(weights, dtype=float)
+
+    tol_curve = tol / (2 * max(weights.sum(), 1))
+
+    # source wavelengths inside the grid are where each curve's error can peak
+    knots = []
+    for x, y in curves:
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        inside = (x > wave[0]) & (x < wave[-1])
+        knots.append((x, y, x[inside], y[inside]))
+
+    while True:
+        new = []
+        nodes = wave[idx]
+        left, right = idx[:-1], idx[1:]
+        resampler = Resampler(nodes, extrapolate=extrapolate, fill_value=fill_value)
+
+        rise, fall = np.zeros(len(nodes) - 1), np.zeros(len(nodes) - 1)
+        for (x, y, kx, ky), w in zip(knots, weights):
+            node_y = resampler(x, y)
+            dy = np.nan_to_num(np.diff(node_y), nan=np.inf)
+            rise += w * np.clip(dy, 0, None)
+            fall -= w * np.clip(dy, None, 0)
+            if len(kx) == 0:
+                continue
+
+            err = np.abs(np.interp(kx, nodes, node_y) - ky)
+            err[np.isnan(err)] = np.inf
+            bad = np.where(err > tol_curve)[0]
+            if len(bad) == 0:
+                continue
+
+            # worst knot in each interval (right hand node j) that is too far off
+            j = np.searchsorted(nodes, kx[bad])
+            order = np.lexsort((-err[bad], j))
+            first = np.r_[True, j[order][1:] != j[order][:-1]]
+            worst, j = bad[order[first]], j[order[first]]
+
+            # split at the grid point nearest that knot, if there is one between the nodes
+            g = np.clip(np.searchsorted(wave, kx[worst]), 1, n - 1)
+            g = np.where(kx[worst] - wave[g - 1] < wave[g] - kx[worst], g - 1, g)
+            ok = idx[j] - idx[j - 1] > 1
+            new.append(np.clip(g, idx[j - 1] + 1, idx[j] - 1)[ok])
+
+        # split intervals where the curves change too much together
+        cross = np.maximum(np.maximum(rise**2, fall**2), 2 * rise * fall) / 8
+        split = (cross > tol / 2) & (right - left > 1)
+        new.append((left[split] + right[split]) // 2)
+
+        new = np.concatenate(new)
+        if len(new) == 0:
+            return idx
+        idx = np.union1d(idx, new)
@@ -0,0 +1,138 @@
+# Band-integrated summaries of throughput curves
+#
+# The index range and wavelength weights of each band (e.g. yJ, HK or
+# a spectrograph order) are worked out once for a grid. Means for any
+# number of curves are then one matrix product, and min/percentiles
+# are computed per band across all curves at once
+import numpy as np
+
+
+class BandSummary():
+    """
+    Precomputed band ranges and weights on a wavelength grid
+
+    """
+    def __init__(self, wave, bands):
+        """
+        inputs
+        ------
+        wave - array [nm]
+            sorted wavelength grid the curves are sampled on, need not be uniform
+        bands - dict
+            band name -> [start, end] in nm, e.g. {'yJ': [980,1327], 'HK': [1490,2460]}.
+            Spectrograph orders can be passed the same way
+        """
+        self.wave  = np.asarray(wave, dtype=float)
+        self.names = list(bands.keys())
+        self.edges = np.array([bands[name] for name in self.names], dtype=float).reshape(-1, 2)
+
+        # wavelength each grid point stands for (trapezoid rule), so
+        # means and percentiles are right on non-uniform grids too
+        dw = np.diff(self.wave)
+        cell = np.r_[dw[0], dw[:-1] + dw[1:], dw[-1]] / 2 if len(self.wave) > 1 else np.ones(1)
+
+        self.slices  = []
+        self.weights = np.zeros((len(self.names), len(self.wave)))
+        for b, (start, end) in enumerate(self.edges):
+            i0 = np.searchsorted(self.wave, start, side='left')
+            i1 = np.searchsorted(self.wave, end, side='right')
+            if i1 <= i0:
+                raise ValueError('band %s [%s, %s] has no points on the grid' % (self.names[b], start, end))
+            self.slices.append(slice(i0, i1))
+            self.weights[b, i0:i1] = cell[i0:i1] / cell[i0:i1].sum()
+
+    def mean(self, t):
+        """
+        wavelength weighted mean in each band
+
+        inputs
+        ------
+        t - array
+            (curves x wavelength) or a single curve
+
+        outputs
+        -------
+        mean - array
+            (curves x bands)
+        """
+        return np.atleast_2d(t) @ self.weights.T
+
+    def min(self, t):
+        """minimum in each band, (curves x bands)"""
+        t = np.atleast_2d(t)
+        return np.stack([t[:, sl].min(axis=1) for sl in self.slices], axis=1)
+
+    def max(self, t):
+        """maximum in each band, (curves x bands)"""
+        t = np.atleast_2d(t)
+        return np.stack([t[:, sl].max(axis=1) for sl in self.slices], axis=1)
+
+    def percentile(self, t, q):
+        """
+        wavelength weighted percentiles in each band, the smallest value
+        with at least q percent of the band (by wavelength) at or below it
+
+        inputs
+        ------
+        t - array
+            (curves x wavelength) or a single curve
+        q - list
+            percentiles to compute, 0 to 100
+
+        outputs
+        -------
+        p - array
+            (curves x bands x len(q))
+        """
+        t = np.atleast_2d(t)
+        q = np.asarray(q, dtype=float) / 100
+        out = np.empty((len(t), len(self.slices), len(q)))
+        for b, sl in enumerate(self.slices):
+            vals  = t[:, sl]
+            order = np.argsort(vals, axis=1)
+            cum   = np.cumsum(self.weights[b, sl][order], axis=1)
+            for k, qk in enumerate(q):
+                # first sorted point where the cumulative weight reaches q
+                j = np.minimum((cum < qk - 1e-12).sum(axis=1), vals.shape[1] - 1)
+                pick = np.take_along_axis(order, j[:, None], axis=1)
+                out[:, b, k] = np.take_along_axis(vals, pick, axis=1)[:, 0]
+
+        return out
+
+    def summarize(self, t, names=None, percentiles=(5, 50, 95)):
+        """
+        mean, min, max and percentiles of every curve in every band
+
+        inputs
+        ------
+        t - array
+            (curves x wavelength)
+        names - list (default: None)
+            label of each curve, e.g. path or section names
+        percentiles - list (default: (5, 50, 95))
+            percentiles to compute
+
+        outputs
+        -------
+        summary - dictionary
+            'names', 'bands', 'percentiles' labels and 'mean', 'min', 'max'
+            (curves x bands) and 'percentile' (curves x bands x percentiles) arrays
+        """
+        t = np.atleast_2d(t)
+        return {'names'      : list(names) if names is not None else list(range(len(t))),
+                'bands'      : self.names,
+                'percentiles': list(percentiles),
+                'mean'       : self.mean(t),
+                'min'        : self.min(t),
+                'max'        : self.max(t),
+                'percentile' : self.percentile(t, percentiles)}
+
+
+def concat_summaries(summaries):
+    """join BandSummary.summarize outputs for the same bands row-wise, e.g. chunks of paths"""
+    out = dict(summaries[0])
+    out['names'] = [name for s in summaries for name in s['names']]
+    for key in ('mean', 'min', 'max', 'percentile'):
+        out[key] = np.concatenate([s[key] for s in summaries], axis=0)
+
+    return out
@@ -0,0 +1,322 @@
+# Benchmarks for the load-resample-combine pipeline
+#
+# Times each stage on its own, on the bundled inputs/ for both
+# spreadsheets and grids from 1k to 1M points, and records the peak
+# memory (tracemalloc, which sees numpy arrays) of each stage:
+# - excel_parse      : _loadThroughputFile
+# - file_parse       : read_curve of every distinct datafile
+# - resample         : every datafile row onto the grid
+# - section_assembly : element curves into the log store and section products
+# - path_combine     : run and run_many for the calc_throughput.py paths
+# - output_write     : text (np.savetxt) and npz results of those paths
+# Datafiles the spreadsheet points to that are not in inputs/ are left
+# out and listed under 'missing'. Each stage is run `repeat` times and
+# the fastest kept, then once more under tracemalloc for its memory.
+#
+# The time to import cThroughput in a fresh interpreter is measured as
+# well, and which of the plotting and spreadsheet packages
+# (HEAVY_MODULES) that pulled in; headless jobs should get none of them.
+#
+# Results are saved as JSON so later runs on the same machine can be
+# compared against them:
+#   python benchmark.py --save outputs/benchmark_baseline.json
+#   python benchmark.py --compare outputs/benchmark_baseline.json
+#   python benchmark.py --import-only --import-budget 0.3
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from cThroughput import CalcThroughput, NO_FILE_TYPES, datafile_path, power_ratio
+from curve_reader import read_curve
+from logspace import LogTransmissionStore
+from resample import Resampler
+from throughput_output import open_writer
+
+STAGES = ('excel_parse', 'file_parse', 'resample', 'section_assembly', 'path_combine', 'output_write')
+EXCEL_FILES = ('HISPEC_allsubs.xlsx', 'HISPEC_gary_version.xlsx')
+GRID_SIZES = (1000, 10000, 100000, 1000000)
+# packages importing cThroughput should not pull in
+HEAVY_MODULES = ('matplotlib', 'pandas', 'scipy')
+
+# same paths as calc_throughput.py
+PATHS = {'bspec'      : ['TELESCOPE', 'AO', 'FEI COMMON', 'FEI BLUE', 'COUPLING NGS', 'FIBER TRANSMISSION BLUE', 'BSPEC'],
+         'rspec'      : ['TELESCOPE', 'AO', 'FEI COMMON', 'FEI RED', 'COUPLING NGS', 'FIBER TRANSMISSION RED', 'RSPEC'],
+         'ATC'        : ['TELESCOPE', 'AO', 'FEI COMMON', 'FEI ATC'],
+         'FEI_Rinject': ['FEI COMMON', 'FEI RED', 'COUPLING PERFECT', 'FIBER TRANSMISSION RED', 'RSPEC'],
+         'FEI_Binject': ['FEI COMMON', 'FEI BLUE', 'COUPLING PERFECT', 'FIBER TRANSMISSION BLUE', 'BSPEC'],
+         'AO_Rinject' : ['AO', 'FEI COMMON', 'FEI RED', 'COUPLING NGS', 'FIBER TRANSMISSION RED', 'RSPEC'],
+         'AO_Binject' : ['AO', 'FEI COMMON', 'FEI BLUE', 'COUPLING NGS', 'FIBER TRANSMISSION BLUE', 'BSPEC']}
+
+
+def run_benchmarks(excel_files=EXCEL_FILES, grid_sizes=GRID_SIZES, data_path='./inputs/', repeat=3):
+    """
+    time every stage for every spreadsheet and grid size
+
+    inputs
+    ------
+    excel_files - list (default: both HISPEC spreadsheets)
+        spreadsheets in the folder above data_path
+    grid_sizes - list (default: 1k, 10k, 100k, 1M)
+        number of points in the 800-2550 nm grid
+    data_path - str (default: './inputs/')
+        folder with the datafiles
+    repeat - int (default: 3)
+        timing runs per stage, the fastest is kept
+
+    outputs
+    -------
+    results - dictionary
+        'machine' description and 'results'[excel file][grid size][stage]
+        -> {'time': seconds, 'peak_bytes': bytes}, plus the datafiles
+        that were 'missing' for each excel file
+    """
+    results, missing = {}, {}
+    for excel_file in excel_files:
+        results[excel_file], missing[excel_file] = {}, []
+        for n in grid_sizes:
+            wave = np.linspace(800, 2550, n)
+            stages, missing[excel_file] = _benchmark_grid(wave, '../' + excel_file, data_path, repeat)
+            results[excel_file][str(n)] = stages
+            print('%s %8d points  %s' % (excel_file, n, '  '.join('%s %.4fs' % (stage, stages[stage]['time'])
+                                                                  for stage in STAGES)))
+
+    return {'machine': _machine(), 'results': results, 'missing': missing, 'import': import_time()}
+
+
+def import_time(module='cThroughput', repeat=5):
+    """
+    time importing module in fresh interpreters
+
+    inputs
+    ------
+    module - str (default: 'cThroughput')
+        module to import
+    repeat - int (default: 5)
+        interpreters to start, the fastest import is kept
+
+    outputs
+    -------
+    result - dictionary
+        'time' [s] of the import, of which 'numpy' [s] is importing numpy,
+        and the 'heavy' modules of HEAVY_MODULES it imported
+    """
+    code = ('import json, sys, time; t0 = time.perf_counter(); import numpy; t1 = time.perf_counter(); '
+            'import %s; t2 = time.perf_counter(); '
+            'print(json.dumps([t2 - t0, t1 - t0, [m for m in %r if m in sys.modules]]))' % (module, HEAVY_MODULES))
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    t, t_numpy, heavy = min(runs)
+
+    return {'time': t, 'numpy': t_numpy, 'heavy': heavy}
+
+
+def check_import(result, budget=0.5):
+    """
+    problems with an import_time result
+
+    inputs
+    ------
+    result - dict
+        output of import_time
+    budget - float [s] (default: 0.5)
+        longest acceptable import
+
+    outputs
+    -------
+    problems - list
+        descriptions of what is wrong, empty if nothing is
+    """
+    problems = []
+    if result['time'] > budget:
+        problems.append('import took %.3f s, over the %.3f s budget' % (result['time'], budget))
+    if result['heavy']:
+        problems.append('import pulled in %s' % ', '.join(result['heavy']))
+
+    return problems
+
+
+def compare(baseline, results, threshold=1.2, min_time=1e-3):
+    """
+    compare results against a baseline from the same machine
+
+    inputs
+    ------
+    baseline - dict
+        output of run_benchmarks, e.g. loaded from a saved file
+    results - dict
+        output of run_benchmarks to check
+    threshold - float (default: 1.2)
+        a stage is a regression if it is this many times slower (or uses
+        this many times more memory) than the baseline
+    min_time - float [s] (default: 1e-3)
+        stages faster than this in both runs are too noisy to compare
+
+    outputs
+    -------
+    regressions - list
+        (excel file, grid size, stage, quantity, baseline value, new value)
+    """
+    regressions = []
+    if 'import' in baseline and 'import' in results:
+        old, new = baseline['import']['time'], results['import']['time']
+        if new > threshold * old and new - old > min_time:
+            regressions.append(('', '', 'import', 'time', old, new))
+    for excel_file, grids in results['results'].items():
+        for n, stages in grids.items():
+            for stage, new in stages.items():
+                old = baseline['results'].get(excel_file, {}).get(n, {}).get(stage)
+                if old is None:
+                    continue
+                if max(old['time'], new['time']) > min_time and new['time'] > threshold * old['time']:
+                    regressions.append((excel_file, n, stage, 'time', old['time'], new['time']))
+                if new['peak_bytes'] > threshold * max(old['peak_bytes'], 1):
+                    regressions.append((excel_file, n, stage, 'peak_bytes', old['peak_bytes'], new['peak_bytes']))
+
+    return regressions
+
+
+def _benchmark_grid(wave, excel_file, data_path, repeat):
+    """all stages for one spreadsheet on one grid"""
+    ct = CalcThroughput(wave, excel_file, data_path=data_path)
+    includes, types, values, filenames, elements = ct.prescription
+
+    # leave out rows whose datafiles are not here so the rest can still be timed
+    missing = []
+    for i, include in enumerate(includes):
+        if include == 1 and types[i] not in NO_FILE_TYPES:
+            path = datafile_path(data_path, filenames[i])
+            if not os.path.exists(path):
+                includes[i] = False
+                missing.append(filenames[i])
+    rows = [i for i, include in enumerate(includes) if include == 1 and types[i] not in NO_FILE_TYPES]
+    paths = sorted(set(datafile_path(data_path, filenames[i]) for i in rows))
+    configs = {name: keys for name, keys in PATHS.items() if all(key in ct.transmission_dic for key in keys)}
+
+    curves = {}
+    def parse():
+        curves.update({path: read_curve(path) for path in paths})
+
+    loaded = {}
+    def resample():
+        resampler = Resampler(wave)
+        for i in rows:
+            curve = curves[datafile_path(data_path, filenames[i])]
+            loaded[i] = resampler(curve.wave, curve.values) ** power_ratio(types[i], values[i], curve)
+
+    def assemble():
+        # start from an empty store so every section is put together again
+        ct._store = LogTransmissionStore(len(wave))
+        for key in ct.transmission_dic:
+            ct.transmission_dic[key] = ct._loadSection(key, loaded)
+
+    def combine():
+        ct._section_logs = {} # or run_many reuses the logs of the last repeat
+        for name, keys in configs.items():
+            ct.run(keys)
+        ct.run_many(configs)
+
+    out = tempfile.mkdtemp()
+    def write():
+        t = ct.run_many(configs)
+        for name, row in zip(configs, t):
+            np.savetxt(os.path.join(out, 'transmission_total_%s.txt' % name), np.vstack((ct.output_wave, row)).T,
+                       delimiter=',', header='wavelength (nm),transmission (I/F) ')
+        file_name = os.path.join(out, 'paths.npz')
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        with open_writer(file_name, ct.output_wave) as w:
+            w.write(list(configs), t, sections=list(configs.values()))
+
+    stages = {'excel_parse'     : lambda: ct._loadThroughputFile(data_path + excel_file),
+              'file_parse'      : parse,
+              'resample'        : resample,
+              'section_assembly': assemble,
+              'path_combine'    : combine,
+              'output_write'    : write}
+
+    return {stage: _measure(stages[stage], repeat) for stage in STAGES}, missing
+
+
+def _measure(func, repeat):
+    """fastest wall time of repeat calls and peak traced memory of one more"""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'time': min(times), 'peak_bytes': peak}
+
+
+def _machine():
+    """what the benchmark ran on, results are only comparable on the same machine"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {'date'     : datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit'   : commit,
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'platform' : platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus'     : os.cpu_count()}
+
+
+if __name__=='__main__':
+	parser = argparse.ArgumentParser(description='time the throughput pipeline stage by stage')
+	parser.add_argument('--sizes', type=int, nargs='+', default=GRID_SIZES, help='grid sizes to run')
+	parser.add_argument('--repeat', type=int, default=3, help='timing runs per stage')
+	parser.add_argument('--save', help='write results to this json file')
+	parser.add_argument('--compare', help='baseline json file to compare against')
+	parser.add_argument('--threshold', type=float, default=1.2, help='slowdown that counts as a regression')
+	parser.add_argument('--import-budget', type=float, default=0.5, help='seconds importing cThroughput may take')
+	parser.add_argument('--import-only', action='store_true', help='only check the import')
+	args = parser.parse_args()
+
+	if args.import_only:
+		result = import_time()
+		problems = check_import(result, budget=args.import_budget)
+		print('import cThroughput %.3f s (numpy %.3f s)' % (result['time'], result['numpy']))
+		for problem in problems:
+			print('IMPORT %s' % problem)
+		sys.exit(1 if problems else 0)
+
+	results = run_benchmarks(grid_sizes=args.sizes, repeat=args.repeat)
+	print('import cThroughput %.3f s (numpy %.3f s)' % (results['import']['time'], results['import']['numpy']))
+	problems = check_import(results['import'], budget=args.import_budget)
+	for problem in problems:
+		print('IMPORT %s' % problem)
+	for excel_file, files in results['missing'].items():
+		if files:
+			print('%s: left out rows with missing datafiles: %s' % (excel_file, sorted(set(files))))
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump(results, f, indent=1)
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		regressions = compare(baseline, results, threshold=args.threshold)
+		for excel_file, n, stage, quantity, old, new in regressions:
+			print('REGRESSION %s %s points %s %s: %.4g -> %.4g' % (excel_file, n, stage, quantity, old, new))
+		sys.exit(1 if regressions or problems else 0)
+	sys.exit(1 if problems else 0)
@@ -0,0 +1,116 @@
+# Reads and writes "budget bundles", a single binary file holding an
+# Excel prescription and all the datafiles it points to already
+# resampled onto a wavelength grid. Bundles are made with
+# CalcThroughput.compile_bundle and loaded with CalcThroughput.from_bundle
+#
+# File layout
+# -----------
+# - 8 byte magic b'TPBUNDLE'
+# - uint32 format version, uint64 header length (little endian)
+# - utf-8 JSON header with the prescription rows and section names, and
+#   the output grid results are resampled onto if the budget was made
+#   with adaptive_tol (row 0 is then the adaptive grid)
+# - zero padding to a 64 byte boundary
+# - float64 array of shape (n_arrays, n_wave), row 0 is the wavelength
+#   grid, then one row per section product, then one row per datafile
+#   entry. The header stores the row each entry lives in
+#
+# The array block is memory-mapped on load so many processes reading
+# the same bundle share one copy of the curves in the page cache
+import json
+import struct
+import numpy as np
+
+MAGIC   = b'TPBUNDLE'
+VERSION = 1
+ALIGN   = 64
+
+
+def write_bundle(bundle_file, header, arrays):
+    """
+    write a bundle to disk
+
+    inputs
+    ------
+    bundle_file - str
+        path of the bundle to write
+    header - dict
+        JSON serializable metadata, must have 'rows' and 'sections'
+    arrays - array
+        2D float array (n_arrays, n_wave), row 0 must be the wavelength grid
+    """
+    arrays = np.ascontiguousarray(arrays, dtype='<f8')
+    header = dict(header, shape=list(arrays.shape), dtype='<f8')
+    blob   = json.dumps(header).encode('utf-8')
+
+    # pad so the arrays start on an aligned boundary for mmap
+    start = len(MAGIC) + 12 + len(blob)
+    pad   = (-start) % ALIGN
+
+    with open(bundle_file, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<IQ', VERSION, len(blob)))
+        f.write(blob)
+        f.write(b'\0' * pad)
+        f.write(arrays.tobytes())
+
+
+def read_bundle(bundle_file, mmap=True):
+    """
+    read a bundle from disk
+
+    inputs
+    ------
+    bundle_file - str
+        path of the bundle to read
+    mmap - bool (default: True)
+        memory-map the arrays (read only) instead of reading them into memory
+
+    outputs
+    -------
+    header - dict
+        bundle metadata
+    arrays - array
+        2D float array (n_arrays, n_wave), row 0 is the wavelength grid
+    """
+    with open(bundle_file, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a throughput bundle' % bundle_file)
+        version, n = struct.unpack('<IQ', f.read(12))
+        if version != VERSION:
+            raise ValueError('unsupported bundle version %s in %s' % (version, bundle_file))
+        header = json.loads(f.read(n).decode('utf-8'))
+
+    start = len(MAGIC) + 12 + n
+    start += (-start) % ALIGN
+    shape = tuple(header['shape'])
+
+    if mmap:
+        arrays = np.memmap(bundle_file, dtype=header['dtype'], mode='r',
+                           offset=start, shape=shape)
+    else:
+        arrays = np.fromfile(bundle_file, dtype=header['dtype'],
+                             offset=start).reshape(shape)
+
+    return header, arrays
+
+
+def to_json_value(value):
+    """convert an excel cell value to something JSON can store (nan -> None)"""
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+if __name__=='__main__':
+	# example compiling the HISPEC prescription into a bundle
+	from cThroughput import CalcThroughput
+
+	x  = np.arange(800, 2550, 0.05)
+	ct = CalcThroughput(x, '../HISPEC_allsubs.xlsx',data_path='./inputs/')
+	ct.compile_bundle('./HISPEC_allsubs.tpb')
+
+	# workers can then start without touching excel or the inputs/ folder
+	ct = CalcThroughput.from_bundle('./HISPEC_allsubs.tpb')
@@ -11,8 +11,8 @@
 # - Section labels start with "FALSE, Note, NAME_OF_SECTION"
 # - Throughput will be computed for sections as well 
 #   as the total
-# - Under 'Type' options are 'Coating', 'Constant', or 
-#   'Internal Transmission'
+# - Under 'Type' options are 'Coating', 'Constant', 
+#   'Internal Transmission', 'Fiber Length Scaled' or 'Strehl'
 #   - 'Coating' loads a file as is
 #   - 'Constant' assumes the constant value in the 'value'
 #      column
@@ -20,28 +20,50 @@
 #      thickness in mm and loads a file that has wavelength,
 #      transmission, and thickness in mm as the columns.
 #      The code then scales the values to the thickness value
+#   - 'Fiber Length Scaled' uses value entry as fiber length
+#      in m and loads a fiber transmission file measured at
+#      the length in its third column (65 m if it has none),
+#      then scales the values to the length value
+#   - 'Strehl' uses value entry as the HO wavefront error in
+#      nm and computes calc_strehl on the grid, no file needed
 #########################################################
-import matplotlib.pylab as plt
+import copy
+import hashlib
+import json
 import numpy as np
-import pandas as pd
-import csv,os
-from scipy import interpolate
-from matplotlib.ticker import MultipleLocator
+import os
 
-import matplotlib
-font = {'size'   : 14}
-matplotlib.rc('font', **font)
+from curve_cache import CurveCache
+from curve_reader import read_curve
+from resample import Resampler
+from adaptive_grid import adaptive_grid
+from budget_bundle import read_bundle, write_bundle, to_json_value
+from logspace import to_log, from_log, after_logs, LogTransmissionStore
+from band_summary import BandSummary, concat_summaries
+from lazy_sections import LazySections
+from throughput_output import open_writer, StreamWriter, EXTENSIONS
+from monte_carlo import read_error_model, check_error, perturb
+from thermal import read_thermal_model, check_thermal, photon_radiance, AUTO
+from profiling import make_profiler, NO_PROFILE
+from spectral_output import SpectralOutput
 
 yJ = [980,1327]
 HK = [1490,2460]
 
+# entry types that do not read a datafile
+NO_FILE_TYPES = ('Note', 'Constant', 'constant', 'Strehl')
+# fiber length the raw fiber curves were measured at, when the file does not say
+FIBER_REFERENCE_LENGTH = 65 # m
+
 ###### NEW CLASS WHO DIS
 class CalcThroughput():
     """
     Uses Excel throughput tracker for loading throughput for hispec and modhis options
 
     """
-    def __init__(self,wave,excel_file, data_path='./data/throughput/hispec_subsystems/'):  
+    def __init__(self,wave,excel_file, data_path='./data/throughput/hispec_subsystems/',cache_dir=None,
+                 workers=None,pool='thread',extrapolate='linear',adaptive_tol=None,lazy=True,
+                 profile=False,shared_curves=None):  
         """    
         inputs
         ------
@@ -51,6 +73,32 @@ class CalcThroughput():
             name of the excel file. Assumes location is data_path
         data_path - str
             path to excel_file and the throughput coatings data that are pointed to in the excel_file
+        cache_dir - str (default: None)
+            directory to cache datafiles resampled onto wave in, so repeat
+            runs skip parsing unchanged files. If None, no caching is done
+        workers - int (default: None)
+            number of workers to load datafiles with in parallel. If None
+            files are loaded one after another. Results are identical either way
+        pool - str (default: 'thread')
+            'thread' or 'process', the kind of pool used when workers is set
+        extrapolate - str (default: 'linear')
+            how datafiles are extended outside their wavelength range,
+            'linear', 'clamp' (hold the end values) or 'constant' (nan)
+        adaptive_tol - float (default: None)
+            if set, compute everything on a non-uniform subset of wave that is
+            only fine where datafiles have structure, keeping any section or
+            path within this absolute tolerance. self.wave is then that grid,
+            and run and run_many return results resampled onto wave (self.output_wave)
+        lazy - bool (default: True)
+            only load the datafiles of a section the first time it is used.
+            If False every section is loaded now
+        profile - bool, function or Profiler (default: False)
+            record the time, bytes read and arrays made by each stage of
+            loading each element, see profiling.py and profile_report. A
+            function is called with each StageRecord as it is made
+        shared_curves - SharedCurves (default: None)
+            in-memory store of parsed and resampled datafiles shared with
+            other instances, used instead of cache_dir, see prescriptions.py
 
         outputs
         -------
@@ -60,15 +108,141 @@ class CalcThroughput():
             contains individual surface data
         """
         self.wave = wave
+        self.output_wave = wave
+        self.adaptive_tol = adaptive_tol
         self.excel_file = excel_file
         self.data_path = data_path
+        self.cache = CurveCache(cache_dir) if cache_dir is not None else None
+        self.workers = workers
+        self.pool = pool
+        self.resampler = Resampler(wave, extrapolate=extrapolate)
+        self.profiler = make_profiler(profile)
+        self._initCaches()
+        if shared_curves is not None:
+            self.cache = shared_curves
+            self._curves = shared_curves.parsed
         
         # load dictionary of transmission data for each subsection then combine
         self.transmission_dic = self._loadTransmissionData(wave,excel_file,data_path)
+        if not lazy:
+            self.load()
         
 		#you can then call runThroughputCalc with the set of keys to compute throughput for
+
+    def profile_report(self):
+        """ProfileReport of the stages recorded since profiling started,
+        see profiling.py. Empty unless profile was set"""
+        return self.profiler.report()
+
+    def _initCaches(self):
+        """start the derived data and memos kept between calls"""
+        self._curves = {} # parsed datafiles, so files used on many rows are read once
+        self._output_resampler = None # adaptive grid -> output_wave
+        self._section_logs = {} # log parts of each section for run_many
+        self._band_summaries = {} # band weights for summarize, per set of bands
+        self._error_model = None # spreadsheet error columns, read on first monte_carlo
+        self._thermal_model = None # spreadsheet emissivity columns, read on first thermal_background
+        self._run_keys = None # keys of the last run, recomputed by update_element
+        self._bundle_curves = {} # filled when loaded from a bundle
+        self.parse_times = {} # seconds spent parsing each datafile
+
+    @classmethod
+    def from_bundle(cls,bundle_file):
+        """Load a budget compiled with compile_bundle without touching
+        the excel file or the datafiles. The curves are memory-mapped
+        from the bundle so they are shared between processes
+
+        inputs
+        ------
+        bundle_file - str
+            path to the bundle made by compile_bundle
+
+        outputs
+        -------
+        ct - CalcThroughput
+            instance sampled on the wavelength grid stored in the bundle,
+            with results resampled onto the output grid stored with it if
+            the budget was compiled on an adaptive grid
+        """
+        header, arrays = read_bundle(bundle_file)
+        rows = header['rows']
+
+        self = cls.__new__(cls)
+        self.wave = np.asarray(arrays[0])
+        self.output_wave = np.asarray(header['output_wave']) if 'output_wave' in header else self.wave
+        self.adaptive_tol = header.get('adaptive_tol')
+        self.excel_file = header['excel_file']
+        self.data_path = header['data_path']
+        self.cache = None
+        self.workers = None
+        self.pool = 'thread'
+        self.resampler = Resampler(self.wave)
+        self.profiler = NO_PROFILE
+        self._initCaches()
+        self.prescription = ([r['include'] for r in rows],
+                             [r['type'] for r in rows],
+                             [r['value'] for r in rows],
+                             [r['datafile'] for r in rows],
+                             [r['element'] for r in rows])
+
+        # element curves point into the mapped arrays, constants come from the header.
+        # the log store is only built from them if it is asked for
+        self._store = None
+        self._section_rows = {}
+        for i, r in enumerate(rows):
+            if r['type'] == 'Note':
+                self._section_rows[r['section']] = []
+                continue
+            self._section_rows[r['section']].append(i)
+            if r['include']:
+                self._bundle_curves[i] = np.asarray(arrays[r['array']]) \
+                        if r['array'] is not None else r['value']
+        self.transmission_dic = LazySections(self._section_rows, self._loadSection,
+                                             {key: np.asarray(arrays[j]) for key, j in header['sections']})
+
+        return self
+
+    def compile_bundle(self,bundle_file):
+        """Save the prescription, section products and every resampled
+        datafile into one binary bundle that from_bundle can memory-map
+
+        inputs
+        ------
+        bundle_file - str
+            path of the bundle to write
+        """
+        includes, types, values, filenames, elements = self.prescription
+
+        keys = list(self.transmission_dic.keys())
+        arrays = [self.wave] + [self.transmission_dic[key] for key in keys]
+        rows = []
+        for i, include in enumerate(includes):
+            if types[i] == 'Note':
+                key = elements[i]
+            # only included datafile entries need a curve, constants live in the header
+            array = None
+            if include == 1 and types[i] not in ('Constant', 'constant'):
+                array = len(arrays)
+                arrays.append(self._elementCurve(i))
+            rows.append({'section' : to_json_value(key),
+                         'element' : to_json_value(elements[i]),
+                         'include' : bool(include == 1),
+                         'type'    : to_json_value(types[i]),
+                         'value'   : to_json_value(values[i]),
+                         'datafile': to_json_value(filenames[i]),
+                         'array'   : array})
+
+        header = {'excel_file': self.excel_file,
+                  'data_path' : self.data_path,
+                  'sections'  : [[key, j + 1] for j, key in enumerate(keys)],
+                  'rows'      : rows}
+        if self.output_wave is not self.wave:
+            # curves are on the adaptive grid, results go back onto the requested one
+            header['output_wave']  = [float(w) for w in self.output_wave]
+            header['adaptive_tol'] = self.adaptive_tol
+        write_bundle(bundle_file, header, np.vstack(arrays))
         
-    def run(self,keys,save_path=None,label='test'):
+    def run(self,keys,save_path=None,label='test',fmt='text',writer=None):
         """Combine various sections into the throughputs we want 
         that are already loaded in __init__ into transmission_dic
         
@@ -82,6 +256,12 @@ class CalcThroughput():
 			path to where to save data, if none will not save data
         label - str (default: test)
 			label to add to the saved data name
+        fmt - str (default: text)
+            format of the saved data, 'text' for the comma separated file
+            or 'npz'/'hdf5' for a binary file with metadata (see throughput_output.py)
+        writer - writer (default: None)
+            open writer from throughput_output.open_writer to append the
+            result to under label, e.g. to collect a sweep in one file
 
         output
         ------
@@ -89,20 +269,491 @@ class CalcThroughput():
 	        final throughput array sampled on wave grid. 
             Also stored as self.total_throughput
         """
-        self.total_throughput = self._combineTransmission(self.wave,
-                                                           self.transmission_dic, 
-                                                           keys)
+        if save_path != None and fmt not in EXTENSIONS:
+            raise ValueError('fmt must be one of %s, not %s' % (list(EXTENSIONS), fmt))
+
+        self._run_keys = list(keys)
+        self.total_throughput = self.to_output(self._combineTransmission(self.wave,
+                                                                          self.transmission_dic, 
+                                                                          keys))
         # save
         if save_path != None:   
             if not os.path.exists(save_path):
                 os.makedirs(save_path)
 
-            np.savetxt(save_path + './transmission_total_%s.txt'%label, np.vstack((self.wave,self.total_throughput)).T,delimiter=',',header='wavelength (nm),transmission (I/F) ')
+            if fmt == 'text':
+                np.savetxt(save_path + './transmission_total_%s.txt'%label, np.vstack((self.output_wave,self.total_throughput)).T,delimiter=',',header='wavelength (nm),transmission (I/F) ')
+            else:
+                file_name = save_path + './transmission_total_%s%s'%(label, EXTENSIONS[fmt])
+                if os.path.exists(file_name):
+                    os.remove(file_name) # overwrite like the text file
+                with open_writer(file_name, self.output_wave, fmt=fmt, metadata=self.output_metadata()) as w:
+                    w.write([label], self.total_throughput, sections=[keys])
+
+        if writer is not None:
+            writer.write([label], self.total_throughput, sections=[keys])
 
         return self.total_throughput
+
+    def write_many(self,configs,file_name,fmt=None,chunk=256,dtype=float):
+        """Evaluate many paths with run_many and append them to one
+        file, chunk paths at a time
+
+        input
+        ------
+        configs - dict
+            path name -> list of section keys, as for run_many
+        file_name - str
+            file to write (.npz, .h5 or .txt), appended to if it exists
+        fmt - str (default: None)
+            'npz', 'hdf5' or 'text', None picks from the file extension
+        chunk - int (default: 256)
+            number of paths evaluated and written at once
+        dtype - type (default: float)
+            type the throughputs are stored as, e.g. np.float32
+
+        output
+        ------
+        names - list
+            path names written, in order
+        """
+        names = list(configs)
+        with open_writer(file_name, self.output_wave, fmt=fmt, metadata=self.output_metadata(),
+                         dtype=dtype) as w:
+            for j in range(0, len(names), chunk):
+                block = {name: configs[name] for name in names[j:j+chunk]}
+                w.write(list(block), self.run_many(block), sections=list(block.values()))
+
+        return names
+
+    def stream_many(self,configs,wave=None,chunk=2**16,dtype=float):
+        """Evaluate many paths one chunk of wavelengths at a time, for
+        grids too fine to hold every section on (e.g. 1e7 points for line
+        resolved telluric work). Each chunk is resampled straight from the
+        parsed datafiles and multiplied up in place, nothing is kept between
+        chunks, so memory depends on chunk and not on the grid
+
+        input
+        ------
+        configs - dict
+            path name -> list of section keys, as for run_many
+        wave - array or iterable (default: None)
+            wavelengths in nm, an array split into chunk points at a time or
+            an iterable of chunks such as wave_chunks(900, 2500, 1e-4).
+            None uses self.output_wave. Independent of the grid ct was made
+            with, and never adaptive
+        chunk - int (default: 2**16)
+            wavelengths per chunk when wave is an array
+        dtype - type (default: float)
+            type the sections and paths are accumulated in, e.g. np.float32
+            to halve the memory. Element curves are resampled in float64
+
+        output
+        ------
+        generator of (wave, t) - array [nm] and (paths x chunk) array
+            throughput of each path in the order of configs, as run gives
+            for the same sections
+        """
+        names = list(configs)
+        keys = list(dict.fromkeys(key for name in names for key in configs[name]))
+        for key in keys:
+            if key not in self._section_rows:
+                raise KeyError('%s is not a section' % key)
+        if wave is None:
+            wave = self.output_wave
+        chunks = wave
+        if isinstance(wave, np.ndarray):
+            chunks = (wave[i:i+chunk] for i in range(0, len(wave), chunk))
+
+        for w, sections in self._streamSections(chunks, keys, dtype):
+            t = np.ones((len(names), len(w)), dtype=dtype)
+            for j, name in enumerate(names):
+                for key in configs[name]:
+                    t[j] *= sections[key]
+            yield w, t
+
+    def write_stream(self,configs,file_name,wave=None,chunk=2**16,fmt=None,dtype=float):
+        """Evaluate many paths with stream_many and write each chunk of
+        wavelengths as soon as it is done
+
+        input
+        ------
+        configs - dict
+            path name -> list of section keys, as for run_many
+        file_name - str
+            file to write (.npz, .h5 or .txt), overwritten if it exists
+        wave, chunk - see stream_many
+        fmt - str (default: None)
+            'npz', 'hdf5' or 'text', None picks from the file extension
+        dtype - type (default: float)
+            type the throughputs are computed and stored as
+
+        output
+        ------
+        n_wave - int
+            number of wavelengths written
+        """
+        n_wave = 0
+        with StreamWriter(file_name, list(configs), fmt=fmt, metadata=self.output_metadata(),
+                          dtype=dtype, sections=list(configs.values())) as w:
+            for wave_chunk, t in self.stream_many(configs, wave=wave, chunk=chunk, dtype=dtype):
+                w.write(wave_chunk, t)
+                n_wave += len(wave_chunk)
+
+        return n_wave
+
+    def _streamSections(self,chunks,keys,dtype):
+        """yield (wave, {key: section transmission}) for each chunk of wavelengths"""
+        includes, types, values, filenames, elements = self.prescription
+        for w in chunks:
+            w = np.asarray(w, dtype=float)
+            sections = {}
+            for key in keys:
+                transmission = np.ones(len(w), dtype=dtype)
+                for i in self._section_rows[key]:
+                    if includes[i] == 1:
+                        np.multiply(transmission, self._streamInput(w, i), out=transmission,
+                                    casting='same_kind')
+                sections[key] = transmission
+            yield w, sections
+
+    def _streamInput(self,wave,i):
+        """row i sampled on a chunk of wavelengths, like _setInput but
+        without the curve cache or the grid's resampler"""
+        includes, types, values, filenames, elements = self.prescription
+        if types[i] == 'Constant' or types[i] == 'constant':
+            return values[i]
+        if types[i] == 'Strehl':
+            return calc_strehl(float(values[i]), wave)
+
+        # a new resampler per row so no interpolation tables pile up
+        resampler = Resampler(wave, extrapolate=self.resampler.extrapolate,
+                              fill_value=self.resampler.fill_value)
+        path = datafile_path(self.data_path, filenames[i])
+        f_interp, self.parse_times[path] = resample_datafile(wave, types[i], values[i], path,
+                                                             resampler, self._curves)
+        return f_interp
+
+    def output_metadata(self):
+        """information stored with written results: the prescription,
+        its hash and the sections"""
+        rows = [[to_json_value(v) for v in row] for row in zip(*self.prescription)]
+        return {'excel_file'        : self.excel_file,
+                'data_path'         : self.data_path,
+                'prescription_hash' : hashlib.sha1(json.dumps(rows).encode('utf-8')).hexdigest(),
+                'sections'          : list(self.transmission_dic.keys()),
+                'adaptive_tol'      : self.adaptive_tol}
+
+    def run_many(self,configs):
+        """Combine sections for many optical paths at once. Section
+        transmissions are stacked into a (sections x wavelength) log array
+        once, then every path is a row of a mask matrix product
+
+        input
+        ------
+        configs - dict
+            path name -> list of section keys, e.g.
+                configs['ATC'] = ['TELESCOPE', 'AO', 'FEI COMMON', 'FEI ATC']
+
+        output
+        ------
+        throughputs - array
+            (paths x wavelength) throughput sampled on output_wave, rows in 
+            the order of configs
+        """
+        return self.to_output(self._runMany(configs))
+
+    def spectral_output(self,resolution=None,pixel_wave=None,edges=False):
+        """Convolution to a resolving power and binning onto spectrograph
+        pixels for results on output_wave, see spectral_output.py. Make it
+        once and apply it to any number of paths or sweep samples, e.g.
+            out = ct.spectral_output(resolution=100000, pixel_wave=order_map)
+            pixels = out(ct.run_many(configs))
+
+        input
+        ------
+        resolution - float, array or function (default: None)
+            resolving power lambda / FWHM, constant, on output_wave or a
+            function of wavelength in nm. None to not convolve
+        pixel_wave - array [nm] (default: None)
+            (..., pixels) central wavelength of each pixel, e.g. a (orders x
+            pixels) map. None to stay on output_wave
+        edges - bool (default: False)
+            pixel_wave are the (..., pixels + 1) pixel edges instead
+
+        output
+        ------
+        output - SpectralOutput
+            call it on (..., wavelength) arrays
+        """
+        return SpectralOutput(self.output_wave, resolution=resolution, pixel_wave=pixel_wave, edges=edges)
+
+    def summarize(self,configs=None,bands=None,percentiles=(5,50,95),chunk=256):
+        """Band mean, min, max and percentiles of every section and every path,
+        without keeping the full curves. Paths are evaluated chunk at a time
+
+        input
+        ------
+        configs - dict (default: None)
+            path name -> list of section keys, as for run_many. If None only
+            sections are summarized
+        bands - dict (default: None)
+            band name -> [start, end] in nm, e.g. spectrograph orders.
+            Defaults to yJ and HK
+        percentiles - list (default: (5, 50, 95))
+            percentiles to compute in each band
+        chunk - int (default: 256)
+            number of paths evaluated at once, bounds the memory used
+
+        output
+        ------
+        summary - dictionary
+            'sections' and, if configs is given, 'paths' summaries. Each has
+            'names' and 'bands' labels and 'mean', 'min', 'max' (rows x bands)
+            and 'percentile' (rows x bands x percentiles) arrays, see BandSummary.
+            Empty configs give paths with no rows
+        """
+        if bands is None:
+            bands = {'yJ': yJ, 'HK': HK}
+        summary = self._bandSummary(bands)
+
+        keys = list(self.transmission_dic.keys())
+        out = {'sections': summary.summarize(np.vstack([self.transmission_dic[key] for key in keys]),
+                                             keys, percentiles)}
+        if configs is not None:
+            names = list(configs)
+            chunks = [summary.summarize(self._runMany({name: configs[name] for name in names[j:j+chunk]}),
+                                        names[j:j+chunk], percentiles)
+                      for j in range(0, len(names), chunk)]
+            # no paths gives an empty summary, (0 x bands) arrays
+            out['paths'] = concat_summaries(chunks) if chunks else \
+                    summary.summarize(np.empty((0, len(self.wave))), [], percentiles)
+
+        return out
+
+    def monte_carlo(self,configs,n_draws=1000,errors=None,percentiles=(2.5,16,50,84,97.5),
+                    seed=None,max_bytes=250e6,clip=True):
+        """Throughput envelopes of many paths from random realizations of the
+        element errors (see monte_carlo.py). All draws are evaluated at once
+        on a block of wavelengths, with blocks sized to fit in max_bytes
+
+        input
+        ------
+        configs - dict
+            path name -> list of section keys, as for run_many
+        n_draws - int (default: 1000)
+            number of realizations
+        errors - dict (default: None)
+            (section, element) -> (error type, 1 sigma error). None reads the
+            'Error' and 'Error Type' columns of the spreadsheet
+        percentiles - list (default: (2.5, 16, 50, 84, 97.5))
+            percentiles of the realizations to return at each wavelength
+        seed - int (default: None)
+            seed for the random draws
+        max_bytes - float (default: 250e6)
+            rough memory budget for the realizations held at once
+        clip - bool (default: True)
+            keep each perturbed element between 0 and max(1, nominal)
+
+        output
+        ------
+        results - dictionary
+            'names' and 'percentiles' labels, 'nominal' (paths x wavelength),
+            'mean' (paths x wavelength) and 'envelope' (paths x percentiles x
+            wavelength) sampled on output_wave
+        """
+        names = list(configs)
+        keys = list(dict.fromkeys(key for name in names for key in configs[name]))
+        self.load(keys)
+        errors = self._errorModel(errors)
+        perturbed = {key: [i for i in self.store.sections.get(key, []) if i in errors] for key in keys}
+
+        # draws only for the rows these paths use, in spreadsheet order, so
+        # rows added elsewhere in the spreadsheet do not change a seeded result
+        rng = np.random.default_rng(seed)
+        draws = {i: rng.standard_normal(n_draws) for i in sorted(set().union(*perturbed.values()))}
+        curves = {i: self.store.curve(i) for i in draws}
+
+        # each path is its unperturbed rows (summed in log space once) times
+        # the realizations of its perturbed rows, repeated as often as in run
+        fixed = {key: self.store.section_logs(key, exclude=perturbed[key]) for key in keys}
+        base, rows = [], []
+        for name in names:
+            logabs, neg, zero = 0, 0, 0
+            for key in configs[name]:
+                logabs, neg, zero = logabs + fixed[key][0], neg + fixed[key][1], zero + fixed[key][2]
+            base.append(from_log(logabs, neg, zero) if len(configs[name]) else np.ones(len(self.wave)))
+            rows.append([i for key in configs[name] for i in perturbed[key]])
+
+        # wavelength blocks small enough that every realization of the perturbed rows fits
+        n_wave = len(self.wave)
+        step = int(max(1, min(n_wave, max_bytes // (8 * n_draws * (len(draws) + 2)))))
+
+        mean = np.empty((len(names), n_wave))
+        envelope = np.empty((len(names), len(percentiles), n_wave))
+        for w0 in range(0, n_wave, step):
+            sl = slice(w0, w0 + step)
+            realized = {i: perturb(curves[i][sl] if np.ndim(curves[i]) else curves[i], *errors[i],
+                                   draws[i], clip=clip) for i in draws}
+            for p in range(len(names)):
+                t = base[p][None, sl]
+                for k, i in enumerate(rows[p]):
+                    t = t * realized[i] if k == 0 else np.multiply(t, realized[i], out=t)
+                mean[p, sl] = t.mean(axis=0)
+                envelope[p, :, sl] = np.percentile(t, percentiles, axis=0) if rows[p] \
+                                     else np.repeat(t, len(percentiles), axis=0)
+
+        return {'names'      : names,
+                'percentiles': list(percentiles),
+                'nominal'    : self.run_many(configs),
+                'mean'       : self.to_output(mean),
+                'envelope'   : self.to_output(envelope)}
+
+    def _errorModel(self,errors):
+        """row -> (error type, error) for included rows, from errors or the spreadsheet"""
+        if errors is None:
+            if self._error_model is None:
+                self._error_model = read_error_model(self.data_path + self.excel_file)
+            rows = self._error_model
+        else:
+            rows = {self._findRow(section, element): check_error(*model)
+                    for (section, element), model in errors.items()}
+
+        return {i: model for i, model in rows.items() if i in self.store}
+
+    def thermal_background(self,configs,temperature=None,thermal=None):
+        """Thermal background reaching the end of every path (its focal
+        plane): the emission of each element (see thermal.py) times the
+        transmission of everything after it. Each section's own emission
+        and the products downstream of each element are cumulative sums
+        of the stored logs, so the cost grows linearly with the surfaces
+
+        input
+        ------
+        configs - dict
+            path name -> list of section keys in the order light passes
+            them, as for run_many. Elements of a section are in spreadsheet order
+        temperature - float [K] (default: None)
+            temperature of the emitting elements without a 'Temperature' entry
+        thermal - dict (default: None)
+            (section, element) -> (emissivity or 'auto', temperature in K or
+            None). None reads the 'Emissivity' and 'Temperature' columns of
+            the spreadsheet
+
+        output
+        ------
+        results - dictionary
+            'names' of the paths, 'background' (paths x wavelength) and the
+            emission leaving each of the 'sections' (section -> wavelength),
+            in photons/s/m^2/sr/nm on output_wave
+        """
+        names = list(configs)
+        keys = list(dict.fromkeys(key for name in names for key in configs[name]))
+        self.load(keys)
+        model = self._thermalModel(thermal)
+
+        radiance = {}
+        emission = {key: self._sectionEmission(key, model, temperature, radiance) for key in keys}
+        logs = self._sectionLogs(keys)
+        index = {key: j for j, key in enumerate(keys)}
+
+        background = np.zeros((len(names), len(self.wave)))
+        for p, name in enumerate(names):
+            if len(configs[name]) == 0:
+                continue
+            # light leaving each section is transmitted by the sections after it
+            j = [index[key] for key in configs[name]]
+            downstream = from_log(*after_logs(*[part[j] for part in logs]))
+            background[p] = np.einsum('ij,ij->j', np.vstack([emission[key] for key in configs[name]]), downstream)
+
+        return {'names'     : names,
+                'background': self.to_output(background),
+                'sections'  : {key: self.to_output(emission[key]) for key in keys}}
+
+    def _sectionEmission(self,key,model,temperature,radiance):
+        """thermal emission leaving section key, radiance is a memo of
+        temperature -> blackbody photon radiance on wave"""
+        rows = list(self.store.sections.get(key, []))
+        emitting = [n for n, i in enumerate(rows) if i in model]
+        if len(emitting) == 0:
+            return np.zeros(len(self.wave))
+
+        # transmission after each emitting element, within the section
+        parts = [np.vstack([np.broadcast_to(self.store.parts(i)[k], self.wave.shape) for i in rows])
+                 for k in range(3)]
+        downstream = from_log(*[part[emitting] for part in after_logs(*parts)])
+
+        emission = np.zeros(len(self.wave))
+        for m, n in enumerate(emitting):
+            emissivity, t_surface = model[rows[n]]
+            t_surface = temperature if t_surface is None else t_surface
+            if t_surface is None:
+                raise ValueError('element %s of %s has no Temperature, pass temperature' % (rows[n], key))
+            if t_surface not in radiance:
+                radiance[t_surface] = photon_radiance(self.wave, t_surface)
+            if emissivity == AUTO:
+                # absorbed light is emitted, extrapolated curves can leave 0-1
+                emissivity = np.clip(1 - self.store.curve(rows[n]), 0, 1)
+            emission += emissivity * radiance[t_surface] * downstream[m]
+
+        return emission
+
+    def _thermalModel(self,thermal):
+        """row -> (emissivity, temperature) for included rows, from thermal or the spreadsheet"""
+        if thermal is None:
+            if self._thermal_model is None:
+                self._thermal_model = read_thermal_model(self.data_path + self.excel_file)
+            rows = self._thermal_model
+        else:
+            rows = {self._findRow(section, element): check_thermal(*model)
+                    for (section, element), model in thermal.items()}
+
+        return {i: model for i, model in rows.items() if i in self.store}
+
+    def _bandSummary(self,bands):
+        """BandSummary for bands on self.wave, made once per set of bands"""
+        key = tuple((name, tuple(edges)) for name, edges in bands.items())
+        if key not in self._band_summaries:
+            self._band_summaries[key] = BandSummary(self.wave, bands)
+
+        return self._band_summaries[key]
+
+    def _runMany(self,configs):
+        """run_many on self.wave, before resampling onto output_wave"""
+        keys = list(dict.fromkeys(key for name in configs for key in configs[name]))
+        logabs, neg, zero = self._sectionLogs(keys)
+        index = {key: j for j, key in enumerate(keys)}
+
+        # count of each section in each path, a section listed twice counts twice like in run
+        mask = np.zeros((len(configs), len(keys)))
+        for p, name in enumerate(configs):
+            for key in configs[name]:
+                mask[p, index[key]] += 1
+
+        return from_log(mask @ logabs, mask @ neg, mask @ zero)
+
+    def to_output(self,t):
+        """resample arrays on self.wave (last axis) onto output_wave, a no-op
+        unless adaptive_tol was used"""
+        if self.output_wave is self.wave:
+            return t
+        if self._output_resampler is None:
+            self._output_resampler = Resampler(self.output_wave)
+
+        return self._output_resampler(self.wave, t)
+
+    def _sectionLogs(self,keys):
+        """log parts of sections keys stacked into (sections x wavelength)
+        arrays, the logs of each section are made once and reused"""
+        for key in keys:
+            if key not in self._section_logs:
+                self._section_logs[key] = to_log(self.transmission_dic[key])
+
+        return [np.vstack([self._section_logs[key][k] for key in keys]) for k in range(3)]
     
     def _loadTransmissionData(self,wave,excel_file,data_path):
-        """ Load transmission data into dictionary
+        """ Read the prescription and set up the dictionary of section
+        transmissions. Sections are loaded the first time they are used
 
         inputs
         ------
@@ -113,26 +764,542 @@ class CalcThroughput():
 
         outputs
         -------
-        transmission : dictionary
+        transmission : LazySections
             dictionary with keys as section headers and values as 
             transmission arrays
         """
-        includes, types, values, filenames, elements = self._loadThroughputFile(data_path + excel_file)
+        with self.profiler.stage('excel', data_path + excel_file) as s:
+            includes, types, values, filenames, elements = self._loadThroughputFile(data_path + excel_file)
+            s.read(data_path + excel_file)
+        # keep rows as lists so update_element can edit them
+        self.prescription = (list(includes), list(types), list(values), list(filenames), list(elements))
 
-        transmission = {}
-        for i, include in enumerate(includes):
+        # swap to a coarser non-uniform grid before loading anything onto it
+        if self.adaptive_tol is not None:
+            with self.profiler.stage('adaptive_grid'):
+                wave = self._adaptiveGrid(wave,includes,types,values,filenames,data_path)
+
+        # keep each element curve (as logs) and the rows in each section so
+        # single rows can be updated without reloading everything
+        self._store = LogTransmissionStore(len(wave))
+        self._section_rows = {}
+        for i in range(len(includes)):
             # start a dictionary entry for new section
             if types[i] == 'Note':
                 key = elements[i]
-                transmission[key] = np.ones_like(wave)
-            # if include (first column) is 1, include it
-            if include == 1:
+                self._section_rows[key] = []
+            else:
+                self._section_rows[key].append(i)
+
+        return LazySections(self._section_rows, self._loadSection)
+
+    def load(self,keys=None):
+        """Load sections now rather than on first use. With workers set
+        the datafiles of all of them are loaded in one pool
+
+        inputs
+        ------
+        keys - list (default: None)
+            section keys to load, None for every section
+
+        outputs
+        -------
+        transmission_dic - LazySections
+            the section transmissions
+        """
+        includes, types, values, filenames, elements = self.prescription
+        keys = [key for key in (self._section_rows if keys is None else keys)
+                if not self.transmission_dic.is_loaded(key)]
+
+        loaded = {}
+        if self.workers is not None and self.workers > 1:
+            loaded = self._loadParallel([i for key in keys for i in self._section_rows[key] if includes[i] == 1])
+        for key in keys:
+            self.transmission_dic[key] = self._loadSection(key, loaded)
+
+        return self.transmission_dic
+
+    def _loadSection(self,key,loaded=None):
+        """Load the included rows of section key into the store and return
+        their product, the section transmission
+
+        inputs
+        ------
+        key : str
+            section key
+        loaded : dictionary (default: None)
+            row number -> transmission for rows already loaded by _loadParallel
+        """
+        includes, types, values, filenames, elements = self.prescription
+        rows = [i for i in self._section_rows[key] if includes[i] == 1]
+        if loaded is None and self.workers is not None and self.workers > 1:
+            loaded = self._loadParallel(rows)
+        loaded = loaded or {}
+
+        transmission = np.ones_like(self.wave)
+        for i in rows:
+            with self.profiler.element(key, elements[i], i):
                 # process input based on entry type and mulitply all together
-                transmission[key] *= self._setInput(wave,types[i], values[i], 
-                                                   filenames[i],data_path)
+                if i in loaded:
+                    t = loaded[i]
+                elif i in self._bundle_curves:
+                    t = self._bundle_curves[i]
+                else:
+                    t = self._setInput(self.wave,types[i], values[i], filenames[i],self.data_path)
+                with self.profiler.stage('assemble'):
+                    self.store.set(i, key, t)
+                    transmission *= t
 
         return transmission
 
+    def _adaptiveGrid(self,wave,includes,types,values,filenames,data_path):
+        """Build the adaptive grid from every included datafile and make it self.wave
+
+        outputs
+        -------
+        wave : array
+            the adaptive grid, a subset of the input wave
+        """
+        # each distinct curve, counted once per row that uses it
+        curves, weights = {}, {}
+        for i, include in enumerate(includes):
+            if include == 1 and types[i] == 'Strehl':
+                curves[('Strehl', values[i])] = (wave, calc_strehl(values[i], wave))
+                weights[('Strehl', values[i])] = weights.get(('Strehl', values[i]), 0) + 1
+            elif include == 1 and types[i] not in NO_FILE_TYPES:
+                path = datafile_path(data_path, filenames[i])
+                curve = read_curve_memo(path, self._curves)
+                # thickness scaling changes the shape so refine on the scaled curve
+                ratio = power_ratio(types[i], values[i], curve)
+                curves[(path, ratio)] = (curve.wave, curve.values ** ratio)
+                weights[(path, ratio)] = weights.get((path, ratio), 0) + 1
+
+        idx = adaptive_grid(wave, list(curves.values()), tol=self.adaptive_tol,
+                            weights=list(weights.values()),
+                            extrapolate=self.resampler.extrapolate, fill_value=self.resampler.fill_value)
+        self.wave = wave[idx]
+        self.resampler = Resampler(self.wave, extrapolate=self.resampler.extrapolate,
+                                   fill_value=self.resampler.fill_value)
+
+        return self.wave
+
+    def _loadParallel(self,rows):
+        """Load and resample the datafiles of rows in a pool of self.workers
+
+        outputs
+        -------
+        loaded : dictionary
+            row number -> transmission array for each datafile row
+        """
+        includes, types, values, filenames, elements = self.prescription
+        wave = self.wave
+
+        # each distinct (type, thickness, file) is only loaded once
+        jobs = {}
+        for i in rows:
+            if types[i] not in NO_FILE_TYPES:
+                path = datafile_path(self.data_path, filenames[i])
+                value = values[i] if types[i] in ('Internal Transmission', 'Fiber Length Scaled') else None
+                jobs.setdefault((types[i], value, path), []).append(i)
+
+        # resolve what we can from the cache before starting the pool
+        curves, keys = {}, {}
+        for job in jobs:
+            if self.cache is not None:
+                keys[job] = self.cache.make_key(job[2], job[0], job[1], wave, self.resampler.extrapolate)
+                curve = self.cache.get(keys[job])
+                if curve is not None:
+                    curves[job] = curve
+        todo = [job for job in jobs if job not in curves]
+
+        if len(todo) == 0:
+            return {i: curves[job] for job, rows in jobs.items() for i in rows}
+
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor # only needed with workers
+
+        Executor = ProcessPoolExecutor if self.pool == 'process' else ThreadPoolExecutor
+        with self.profiler.stage('pool') as s, Executor(max_workers=self.workers) as ex:
+            results = ex.map(resample_datafile, [wave] * len(todo), 
+                             [job[0] for job in todo], [job[1] for job in todo], [job[2] for job in todo],
+                             [self.resampler] * len(todo))
+            for job, (curve, parse_time) in zip(todo, results):
+                curves[job] = curve
+                self.parse_times[job[2]] = parse_time
+                if self.cache is not None:
+                    self.cache.put(keys[job], curve)
+                if self.profiler.enabled:
+                    # workers time their own parse, credited to the first row using the file
+                    i = jobs[job][0]
+                    section = next(key for key, r in self._section_rows.items() if i in r)
+                    self.profiler.add('parse', parse_time, job[2], os.path.getsize(job[2]),
+                                      element=(section, elements[i], i))
+                s.alloc(curve)
+
+        return {i: curves[job] for job, rows in jobs.items() for i in rows}
+
+    def update_element(self,section,element,include=None,value=None,datafile=None):
+        """Change one row of the prescription and recompute only that
+        element, its section and the total of the last run
+
+        inputs
+        ------
+        section - str
+            section the element is in e.g. 'FEI ATC'
+        element - str or int
+            name in the 'Element' column, or the row number in the
+            prescription if the name appears more than once in the section
+        include - bool (default: None)
+            new 'Include?' value, None leaves it unchanged
+        value - float (default: None)
+            new 'Value' (constant or thickness), None leaves it unchanged
+        datafile - str (default: None)
+            new 'Datafile' relative to data_path, None leaves it unchanged
+
+        outputs
+        -------
+        transmission - array
+            the recomputed transmission of section
+        """
+        includes, types, values, filenames, elements = self.prescription
+        i = self._findRow(section, element)
+
+        if include is not None:  includes[i]  = 1 if include else 0
+        if value is not None:    values[i]    = value
+        if datafile is not None: filenames[i] = datafile
+
+        self._bundle_curves.pop(i, None)
+        # a section not loaded yet just picks up the new row when it is
+        if self.transmission_dic.is_loaded(section):
+            self.store.remove(i)
+            if includes[i] == 1:
+                self.store.set(i, section, self._setInput(self.wave,types[i], values[i], 
+                                                          filenames[i],self.data_path))
+            self._updateSections([section])
+
+        return self.transmission_dic[section]
+
+    def update_from_excel(self,excel_file):
+        """Diff a new version of the excel file against the loaded one and
+        recompute only the rows that changed and the sections they are in
+
+        inputs
+        ------
+        excel_file - str
+            name of the new excel file. Assumes location is data_path
+
+        outputs
+        -------
+        changed - list
+            section keys that were recomputed, added or removed. If a row
+            cannot be loaded (e.g. its datafile is missing) the error is
+            raised and the budget is left as it was
+        """
+        old_rows = self._rowIndex()
+        old_store = self.store
+
+        # parse and load into locals, so a failure (e.g. a missing datafile)
+        # leaves the budget as it was
+        includes, types, values, filenames, elements = self._loadThroughputFile(self.data_path + excel_file)
+        prescription = (list(includes), list(types), list(values), list(filenames), list(elements))
+
+        # reuse the curve of any row that is identical in both versions
+        new_rows = self._rowIndex(prescription)
+        store = LogTransmissionStore(len(self.wave))
+        section_rows = {}
+        changed = set(self.transmission_dic.keys()) - set(k for k, _, _ in new_rows)
+        for (key, name, n), (i, row) in new_rows.items():
+            if types[i] == 'Note':
+                section_rows[key] = []
+                if key not in self.transmission_dic:
+                    changed.add(key)
+                continue
+            section_rows[key].append(i)
+
+            old = old_rows.get((key, name, n))
+            if old is None or old[1] != row:
+                changed.add(key)
+            # sections that were never loaded stay that way
+            if includes[i] == 1 and self.transmission_dic.is_loaded(key):
+                if old is not None and old[1] == row:
+                    store.copy_from(old_store, old[0], i, key)
+                else:
+                    store.set(i, key, self._setInput(self.wave,types[i], values[i], 
+                                                     filenames[i],self.data_path))
+
+        # sections that lost rows also changed
+        for (key, name, n) in old_rows:
+            if (key, name, n) not in new_rows:
+                changed.add(key)
+
+        # everything loaded, swap the new version in
+        self.prescription = prescription
+        self.excel_file = excel_file
+        self._error_model = None
+        self._thermal_model = None
+        self._store = store
+        self._bundle_curves = {}
+        self._section_rows = section_rows
+        self._updateSections(changed)
+
+        return sorted(changed)
+
+    def update_datafiles(self,paths):
+        """Reload the rows that use datafiles that changed on disk and
+        recompute only their sections
+
+        inputs
+        ------
+        paths - list
+            datafile paths as returned by datafile_path, e.g. from a file watcher
+
+        outputs
+        -------
+        changed - list
+            section keys that were recomputed
+        """
+        includes, types, values, filenames, elements = self.prescription
+        paths = set(paths)
+
+        changed = set()
+        for key, rows in self._section_rows.items():
+            if not self.transmission_dic.is_loaded(key):
+                continue # picks up the new file when it is loaded
+            for i in rows:
+                if includes[i] == 1 and types[i] not in NO_FILE_TYPES \
+                        and datafile_path(self.data_path, filenames[i]) in paths:
+                    self._bundle_curves.pop(i, None)
+                    self.store.set(i, key, self._setInput(self.wave,types[i], values[i],
+                                                          filenames[i],self.data_path))
+                    changed.add(key)
+
+        self._updateSections(changed)
+
+        return sorted(changed)
+
+    def copy(self):
+        """Independent copy to stage changes on, e.g. update_from_excel or
+        update_datafiles, leaving this budget untouched until the copy is
+        swapped in. Parsed datafiles, the curve cache and the arrays of
+        loaded sections are shared since they are never changed in place
+
+        outputs
+        -------
+        ct - CalcThroughput
+            the copy
+        """
+        new = copy.copy(self)
+        new.prescription = tuple(list(column) for column in self.prescription)
+        new._section_rows = {key: list(rows) for key, rows in self._section_rows.items()}
+        new._store = self._store.copy() if self._store is not None else None
+        new._bundle_curves = dict(self._bundle_curves)
+        new._section_logs = dict(self._section_logs)
+        new._band_summaries = dict(self._band_summaries)
+        new.parse_times = dict(self.parse_times)
+        new.transmission_dic = self.transmission_dic.copy(new._loadSection)
+
+        return new
+
+    @property
+    def store(self):
+        """LogTransmissionStore of every included element, built on first use for bundles"""
+        if self._store is None:
+            self._store = LogTransmissionStore(len(self.wave))
+            for key, rows in self._section_rows.items():
+                for i in rows:
+                    if i in self._bundle_curves:
+                        self._store.set(i, key, self._bundle_curves[i])
+
+        return self._store
+
+    def leave_one_out(self,section):
+        """Transmission of section with each included element left out in turn,
+        computed from the stored logs so zeros are never divided out
+
+        inputs
+        ------
+        section - str
+            section key e.g. 'FEI ATC'
+
+        outputs
+        -------
+        elements - list
+            element names, in spreadsheet order
+        totals - array
+            (elements x wavelength), totals[k] is section without elements[k]
+        """
+        includes, types, values, filenames, elements = self.prescription
+        self.load([section])
+        rows, totals = self.store.leave_one_out(section)
+
+        return [elements[i] for i in rows], totals
+
+    def swap_element(self,section,element,t):
+        """Transmission of section if element were replaced by t, without
+        changing anything loaded (use update_element for that)
+
+        inputs
+        ------
+        section - str
+            section key e.g. 'FEI ATC'
+        element - str or int
+            name in the 'Element' column or row number, see update_element
+        t - array or float
+            replacement transmission sampled on wave, or a constant
+
+        outputs
+        -------
+        transmission - array
+            section transmission with the swap
+        """
+        row = self._findRow(section, element)
+        self.load([section])
+
+        return self.store.swap(section, row, t)
+
+    def run_variants(self,configs,variants,max_bytes=250e6):
+        """Throughput of every path for every variant of the prescription,
+        where a variant replaces some elements with other curves, e.g.
+        dichroic designs. All variants and paths are evaluated together
+        from the stored element logs, nothing is divided out
+
+        input
+        ------
+        configs - dict
+            path name -> list of section keys, as for run_many
+        variants - dict
+            variant name -> list of swaps, each (section, element, curve) or
+            (section, element, curve, side):
+                element - name in the 'Element' column or row number, see update_element
+                curve - datafile relative to data_path (read with the element's
+                        Type and Value, once however many variants use it), an
+                        array sampled on wave or a constant
+                side - 'transmission' (default) to use curve as is or
+                       'reflection' to use 1 - curve, e.g. a dichroic's
+                       transmission curve for the element it reflects into
+            an empty list is the prescription as loaded. e.g.
+                variants['h'] = [('FEI ATC', 'ATC Dichroic', h_file, 'reflection'),
+                                 ('FEI RED', 'ATC Dichroic', h_file),
+                                 ('FEI BLUE', 'ATC Dichroic', h_file)]
+        max_bytes - float (default: 250e6)
+            rough size of the arrays evaluated at once
+
+        output
+        ------
+        variants - dictionary
+            'variants' and 'names' of the paths, 'wave' (output_wave) and
+            'throughput', a (variants x paths x wavelength) array
+        """
+        includes, types, values, filenames, elements = self.prescription
+        names, variant_names = list(configs), list(variants)
+        keys = list(dict.fromkeys(key for name in names for key in configs[name]))
+        self.load(keys)
+        counts = np.array([[configs[name].count(key) for key in keys] for name in names], dtype=float)
+
+        # log parts of each replacement, made once per distinct curve
+        swaps, parts = {}, {}
+        for v, variant in enumerate(variant_names):
+            for swap in variants[variant]:
+                section, element, curve = swap[:3]
+                side = swap[3] if len(swap) > 3 else 'transmission'
+                if side not in ('transmission', 'reflection'):
+                    raise ValueError("side must be 'transmission' or 'reflection', not %s" % side)
+                i = self._findRow(section, element)
+                if (section, i) in swaps.get(v, {}):
+                    raise ValueError('variant %s swaps row %s of %s twice' % (variant, i, section))
+
+                label = (i, curve, side) if isinstance(curve, str) else (i, id(curve), side)
+                if label not in parts:
+                    t = self._setInput(self.wave,types[i], values[i], curve, self.data_path) \
+                        if isinstance(curve, str) else curve
+                    parts[label] = to_log(1 - np.asarray(t, dtype=float) if side == 'reflection' else t)
+                swaps.setdefault(v, {})[(section, i)] = parts[label]
+
+        # paths without any swapped row, once
+        swapped = sorted(set(row for v in swaps for row in swaps[v] if row[0] in keys))
+        fixed = [self.store.section_logs(key, exclude=[i for section, i in swapped if section == key])
+                 for key in keys]
+        base = [counts @ np.vstack([np.broadcast_to(f[k], self.wave.shape) for f in fixed]) for k in range(3)]
+
+        block = int(max(1, max_bytes // (4 * 8 * len(names) * len(self.wave))))
+        out = []
+        for j in range(0, len(variant_names), block):
+            vs = range(j, min(j + block, len(variant_names)))
+            p = [np.repeat(base[k][None], len(vs), axis=0) for k in range(3)]
+            for section, i in swapped:
+                n = counts[:, keys.index(section)][None, :, None]
+                # each variant adds the replacement or the loaded element back
+                nominal = self.store.parts(i) if i in self.store else (0.0, 0, 0)
+                for k in range(3):
+                    row = np.array([np.broadcast_to(swaps.get(v, {}).get((section, i), nominal)[k], self.wave.shape)
+                                    for v in vs], dtype=float)
+                    p[k] += n * row[:, None, :]
+            out.append(from_log(*p))
+
+        throughput = np.concatenate(out, axis=0) if out else np.zeros((0, len(names), len(self.wave)))
+        return {'variants'  : variant_names,
+                'names'     : names,
+                'wave'      : self.output_wave,
+                'throughput': self.to_output(throughput)}
+
+    def _findRow(self,section,element):
+        """row number of element in section, element can also be a row number"""
+        includes, types, values, filenames, elements = self.prescription
+        if section not in self._section_rows:
+            raise KeyError('no section %s in %s' % (section, self.excel_file))
+
+        rows = self._section_rows[section]
+        if isinstance(element, (int, np.integer)):
+            if element not in rows:
+                raise KeyError('row %s is not in section %s' % (element, section))
+            return element
+
+        matches = [i for i in rows if elements[i] == element]
+        if len(matches) == 0:
+            raise KeyError('no element %s in section %s' % (element, section))
+        if len(matches) > 1:
+            raise ValueError('element %s appears in rows %s of section %s, pass the row number instead'
+                             % (element, matches, section))
+
+        return matches[0]
+
+    def _rowIndex(self,prescription=None):
+        """map (section, element, occurrence) -> (row number, row contents) for diffing,
+        of self.prescription or of the given one"""
+        includes, types, values, filenames, elements = prescription or self.prescription
+        index = {}
+        for i in range(len(includes)):
+            if types[i] == 'Note':
+                key = elements[i]
+            name = to_json_value(elements[i])
+            n = 0
+            while (key, name, n) in index:
+                n += 1
+            row = (includes[i] == 1, to_json_value(types[i]), to_json_value(values[i]),
+                   to_json_value(filenames[i]))
+            index[(key, name, n)] = (i, row)
+
+        return index
+
+    def _updateSections(self,keys):
+        """recompute the section products for keys and anything that depends on them"""
+        for key in keys:
+            self._section_logs.pop(key, None)
+            if key not in self._section_rows:
+                if key in self.transmission_dic:
+                    del self.transmission_dic[key]
+            elif self.transmission_dic.is_loaded(key):
+                self.transmission_dic[key] = self.store.section_total(key)
+
+        # keep sections in spreadsheet order, new ones are loaded when used
+        self.transmission_dic.set_keys(self._section_rows)
+
+        # and the total from the last run
+        if self._run_keys is not None and any(key in self._run_keys for key in keys) \
+                and all(key in self.transmission_dic for key in self._run_keys):
+            self.total_throughput = self.to_output(self._combineTransmission(self.wave,
+                                                                              self.transmission_dic,
+                                                                              self._run_keys))
+
     def _combineTransmission(self, x,transmission_dic, keys):
         """for key in keys, multiply all transmission entries together."""
         t_all = np.ones_like(x)
@@ -155,7 +1322,7 @@ class CalcThroughput():
         includes : array
             1 if include, 0 if not
         types : array
-            'Coating', 'Constant', or 'Internal Transmission'
+            'Coating', 'Constant', 'Internal Transmission', 'Fiber Length Scaled' or 'Strehl'
         values : array
             value of input
         filenames : array
@@ -163,6 +1330,8 @@ class CalcThroughput():
         elements : array
             section header
         """
+        import pandas as pd # only needed when loading from excel, not from a bundle
+
         # read in the efficiency excel file into a dataframe ('df')
         xl = pd.ExcelFile(excel_file)
         #xl.sheet_names
@@ -190,7 +1359,7 @@ class CalcThroughput():
         x : array
             wavelengths in nm
         tt : str
-            'Coating', 'Constant', or 'Internal Transmission'
+            'Coating', 'Constant', 'Internal Transmission', 'Fiber Length Scaled' or 'Strehl'
         value : float
             value of input
         filename : str
@@ -203,30 +1372,45 @@ class CalcThroughput():
         """
         if tt == 'Constant' or tt=='constant':
             return value
+        elif tt == 'Strehl':
+            # analytic, computed straight on the grid
+            with self.profiler.stage('analytic') as s:
+                strehl = calc_strehl(float(value), wave)
+                s.alloc(strehl)
+            return strehl
         else:
-            with open(data_path + file_name.replace('\\','/'),'r') as test:
-                lines = test.readlines()
-                delimiter= csv.Sniffer().sniff(lines[2]).delimiter
-            
-            f = pd.read_csv(data_path + file_name.replace('\\','/'),sep=delimiter,engine='python').values
-
-            if f[:,0][0] < 100:
-                f[:,0] *=1000 # convert micron to nm
-
-            # define thickness ratio if internal transmission
-            thickness_ratio = value / f[:,2][0]\
-                    if tt == 'Internal Transmission'\
-                    else 1.0
-
-            if np.nanmax(f[:,1]) > 1.05:
-                f_interp =  interpolate.interp1d(f[:,0], f[:,1]/100,bounds_error=False,fill_value='extrapolate')
-                return f_interp(wave) ** thickness_ratio
-            else:    
-                f_interp =  interpolate.interp1d(f[:,0], f[:,1],bounds_error=False,fill_value='extrapolate')
-                return f_interp(wave) ** thickness_ratio
+            path = datafile_path(data_path, file_name)
+
+            # use the resampled curve from a previous run if nothing changed
+            if self.cache is not None:
+                with self.profiler.stage('cache', path) as s:
+                    cache_key = self.cache.make_key(path, tt, value, wave, self.resampler.extrapolate)
+                    f_interp = self.cache.get(cache_key)
+                    s.alloc(f_interp)
+                if f_interp is not None:
+                    return f_interp
+
+            resampler = self.resampler if wave is self.wave else None
+            f_interp, self.parse_times[path] = resample_datafile(wave, tt, value, path, 
+                                                                 resampler, self._curves, self.profiler)
+
+            if self.cache is not None:
+                self.cache.put(cache_key, f_interp)
+
+            return f_interp
+
+    def _elementCurve(self, i):
+        """transmission of row i of the prescription, reusing the loaded curve if there is one"""
+        if self._store is not None and i in self._store:
+            return self._store.curve(i)
+        if i in self._bundle_curves:
+            return self._bundle_curves[i]
+
+        includes, types, values, filenames, elements = self.prescription
+        return self._setInput(self.wave,types[i], values[i], filenames[i],self.data_path)
 
     def plotTotalThroughput(self,label='test',ax=None,save_path=None):
-        """Plot self.total_throughput
+        """Plot self.total_throughput, see throughput_plots.plot_total_throughput
         inputs
         -----
         label - str
@@ -234,100 +1418,149 @@ class CalcThroughput():
         save_path - str (default None)
 			path to save the plot image and the total throughput arrays 
         """
-        if ax==None:    fig, ax = plt.subplots(1, 1, figsize=(9,4))
-        ax.fill_between(yJ,y1=0,y2=1,facecolor='blue',alpha=0.1,zorder=-100)
-        ax.fill_between(HK,y1=0,y2=1,facecolor='red',alpha=0.1)
-
-        #ax.text(385.1,0.041,'Requirement',fontsize=9)
-
-        ax.plot(self.wave,self.total_throughput,'k',label='Total Throughput')
-        ax.legend()
-        #ax.set_ylim(0,np.max(self.total_throughput) * 1.1)
-
-        # grids!
-        ax.yaxis.grid(True, which='both',alpha=0.5)
-        ax.yaxis.set_minor_locator(MultipleLocator(0.01))
-        ax.yaxis.set_major_locator(MultipleLocator(0.1))
-
-        ax.set_xlabel('Wavelength (nm)',fontsize=12)
-        ax.set_ylabel('Throughput',fontsize=12)
-        ax.grid()
-        
-        plt.title(label)
-        
-        if save_path != None:
-            if not os.path.exists(save_path):
-                os.makedirs(save_path)
-
-            plt.savefig(save_path + '/transmission_total_%s.png'%label,dpi=500)
+        from throughput_plots import plot_total_throughput # matplotlib is only imported to plot
+        return plot_total_throughput(self, label=label, ax=ax, save_path=save_path)
 
     def plotSubsectionComponents(self,key_name):
         """
-        plot subsystem components labeled by key
-        
-        Could be rewritten to avoid duplicate loading of excel file..
+        plot subsystem components labeled by key, see throughput_plots.plot_subsection_components
         """
-        includes, types, values, filenames, elements = self._loadThroughputFile(self.data_path + self.excel_file)
-
-        total = np.ones_like(self.wave)
-
-        fig, ax = plt.subplots(1, 1, figsize=(8,5))
-        for i, include in enumerate(includes):
-            # start a dictionary entry for new section
-            if types[i] == 'Note':
-                key = elements[i]
-            if key==key_name:
-                if include == 1:
-                    t = self._setInput(self.wave,types[i], values[i], filenames[i],self.data_path)
-                    if types[i]=='Coating' or types[i]=='coating':
-                        ax.plot(self.wave,t,label=elements[i])
-                    if types[i]=='Constant' or types[i]=='constant':
-                        ax.plot(self.wave,self.wave*0+t,label=elements[i])
-                    total*=t
-
-        ax.fill_between(yJ,y1=0,y2=1,facecolor='blue',alpha=0.1,zorder=-100)
-        ax.fill_between(HK,y1=0,y2=1,facecolor='red',alpha=0.1)
-        ax.set_xlabel('Wavelength [nm]')
-        ax.set_ylabel('Transmission')
-        
-        ax.plot(self.wave,total,'k',lw=2)
-        plt.legend(fontsize=8)
-        plt.grid()
+        from throughput_plots import plot_subsection_components
+        return plot_subsection_components(self, key_name)
 
     def plotSubsections(self,keys,ax=None,save_path=None,label='test'):
-        """ plot transmission for each subsystem
+        """ plot transmission for each subsystem, see throughput_plots.plot_subsections
         
         inputs
         -----
         keys - list
             list of subsystem keywords to include in the plot e.g. 'AO' or 'FEI COMMON'
          """
-        # define specific things
-        if ax==None: fig, ax = plt.subplots(1, 1, figsize=(9,4))
+        from throughput_plots import plot_subsections
+        return plot_subsections(self, keys, ax=ax, save_path=save_path, label=label)
 
-        for k in keys: 
-            # only plot if not ones
-            if np.any(self.transmission_dic[k]!=1): 
-                ax.plot(self.wave,self.transmission_dic[k],label=k) 
 
-        ax.fill_between(yJ,y1=0,y2=1,facecolor='blue',alpha=0.3)
-        ax.fill_between(HK,y1=0,y2=1,facecolor='red',alpha=0.3)
-        ax.set_ylim(0,1.1)
+def resample_datafile(wave, tt, value, path, resampler=None, curves=None, profiler=NO_PROFILE):
+    """
+    Read a datafile and interpolate it onto wave. Module level so it can
+    run in a process pool
 
-        ax.set_xlabel('Wavelength (nm)',fontsize=12)
-        ax.set_ylabel('Throughput',fontsize=12)
-        plt.title(label)
-        
-        ax.legend(fontsize=7)
-        ax.grid()
+    inputs
+    ------
+    wave : array
+        wavelengths in nm
+    tt : str
+        'Coating', 'Internal Transmission' or 'Fiber Length Scaled'
+    value : float
+        thickness in mm for 'Internal Transmission', length in m for
+        'Fiber Length Scaled', otherwise unused
+    path : str
+        path to the datafile
+    resampler : Resampler (default: None)
+        resampler for wave, reusing its tables between files with the
+        same wavelengths. If None a new linear one is made
+    curves : dictionary (default: None)
+        memo of parsed files shared between calls, so a file is only
+        parsed again if it changed on disk
+    profiler : Profiler (default: NO_PROFILE)
+        records the parse, resample and scale stages, see profiling.py
 
-        if save_path != None:   
-            if not os.path.exists(save_path):
-                os.makedirs(save_path)
+    outputs
+    -------
+    f_interp : array
+        transmission values interpolated onto wave
+    parse_time : float
+        seconds spent parsing the file
+    """
+    if resampler is None:
+        resampler = Resampler(wave)
+
+    # read file, converted to nm and fractional transmission
+    with profiler.stage('parse', path) as s:
+        memo = curves.get(path) if curves is not None else None
+        curve = read_curve_memo(path, curves)
+        if curves is None or curves[path] is not memo:
+            s.read(path)
+            s.alloc(curve.wave, curve.values)
+
+    # define thickness ratio if internal transmission or fiber
+    thickness_ratio = power_ratio(tt, value, curve)
+
+    with profiler.stage('resample', path) as s:
+        f_interp = resampler(curve.wave, curve.values)
+        s.alloc(f_interp)
+    if thickness_ratio != 1.0:
+        with profiler.stage('scale', path):
+            np.power(f_interp, thickness_ratio, out=f_interp)
+
+    return f_interp, curve.parse_time
 
-            np.savetxt(save_path + './transmission_%s.png'%label, np.vstack((self.wave,self.total_throughput)).T,delimiter=',',header='wavelength (nm),transmission (I/F) ')
 
-        return ax
+def power_ratio(tt, value, curve):
+    """power the datafile curve is raised to, the thickness (or fiber
+    length) of the row over the one the curve was measured at"""
+    if tt == 'Internal Transmission':
+        return value / curve.thickness
+    if tt == 'Fiber Length Scaled':
+        return float(value) / (curve.thickness if curve.thickness is not None else FIBER_REFERENCE_LENGTH)
+
+    return 1.0
+
+
+def datafile_path(data_path, file_name):
+    """path to a 'Datafile' entry on this machine. Entries are written with
+    Windows separators, and their case may not match the files on disk
+    since Windows and macOS ignore it, so missing parts are matched
+    ignoring case"""
+    path = data_path + file_name.replace('\\','/')
+    if os.path.exists(path):
+        return path
+
+    resolved = ''
+    for part in path.split('/'):
+        candidate = resolved + part
+        if part not in ('', '.', '..') and not os.path.exists(candidate) and os.path.isdir(resolved or '.'):
+            matches = [f for f in os.listdir(resolved or '.') if f.lower() == part.lower()]
+            if len(matches) == 1:
+                candidate = resolved + matches[0]
+        resolved = candidate + '/'
+
+    return resolved[:-1] if os.path.exists(resolved[:-1]) else path
+
+
+def read_curve_memo(path, curves=None):
+    """read_curve, reusing the parsed curve in memo dictionary curves
+    unless the file changed on disk"""
+    if curves is None:
+        return read_curve(path)
+
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    if curves.get(path, (None,))[0] != stamp:
+        curves[path] = (stamp, read_curve(path))
+
+    return curves[path][1]
+
+
+def wave_chunks(start,stop,step,chunk=2**16):
+    """
+    the grid np.arange(start, stop, step) (to rounding) a chunk at a time,
+    so a very fine grid is never held whole. See CalcThroughput.stream_many
+
+    inputs
+    ------
+    start, stop, step : float
+        wavelengths in nm, stop excluded
+    chunk : int (default: 2**16)
+        wavelengths per chunk
+
+    outputs
+    -------
+    generator of arrays [nm]
+    """
+    n = int(np.ceil((stop - start) / step))
+    for i in range(0, n, chunk):
+        yield start + step * np.arange(i, min(n, i + chunk))
 
 
 def calc_strehl(wfe,wavelength):
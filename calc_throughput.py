@@ -8,6 +8,7 @@ from scipy.interpolate import interp1d
 from matplotlib.ticker import MultipleLocator
 
 from cThroughput import CalcThroughput
+from plot_report import render_report
 
 import matplotlib
 font = {'size'   : 14}
@@ -23,7 +24,7 @@ x = np.arange(800, 2550, 0.05)
 yJ = [980,1327]
 HK = [1490,2460]
 
-ct = CalcThroughput(x, '../HISPEC_allsubs.xlsx',data_path='./inputs/')
+ct = CalcThroughput(x, '../HISPEC_allsubs.xlsx',data_path='./inputs/',cache_dir='./.throughput_cache/')
 
 if __name__=='__main__':	
 	#'TELESCOPE', 'AO', 'FEI  COMMON', 'FEI ATC', 'FEI BLUE', 'FEI RED', 'COUPLING', 'FIBER TRANSMISSION BLUE', 'FIBER TRANSMISSION RED', 'BSPEC ', 'RSPEC '
@@ -40,11 +41,12 @@ if __name__=='__main__':
 	# TODO add back injection option
 
 	
-	# combine subsystems to get full transmission and plot
+	# combine subsystems to get full transmission
 	for path in configs.keys(): #['bspec']:
 		throughput = ct.run(configs[path],save_path=save_path,label=path)
-		ax = ct.plotSubsections(configs[path],save_path=None,label=path)
-		ct.plotTotalThroughput(label=path,ax=ax,save_path=save_path)
+
+	# and plot every path at once, only redrawing figures whose curves changed
+	render_report(ct, configs, save_path, workers=4)
 
 	# can also plot the components of a subsection like this:
 	#ct.plotSubsectionComponents('FEI COMMON')
@@ -0,0 +1,220 @@
+# On-disk cache of datafiles that have been resampled onto a
+# wavelength grid, so repeat runs of the budget can skip the
+# parsing and interpolation done in CalcThroughput._setInput
+#
+# Entries are keyed on the datafile content hash, the entry type,
+# the value (thickness) and a fingerprint of the wavelength grid,
+# so a cache entry is automatically invalidated when any of those
+# change. Old entries are evicted least-recently-used first once
+# the cache grows past max_bytes.
+#
+# SharedCurves keeps resampled curves in memory instead, with the same
+# make_key, get and put, so several CalcThroughput (e.g. revisions of a
+# spreadsheet in prescriptions.py) resample each datafile only once
+import hashlib
+import os
+import numpy as np
+
+# bump when the parsing or resampling of datafiles changes so old entries are not reused
+KEY_VERSION = '2'
+
+
+class CurveCache():
+    """
+    Content-addressed cache of resampled curves stored as .npy files
+
+    """
+    def __init__(self, cache_dir='./.throughput_cache/', max_bytes=500e6):
+        """
+        inputs
+        ------
+        cache_dir - str
+            directory to store the cached curves in, made if it doesnt exist
+        max_bytes - float (default: 500 MB)
+            size limit of the cache directory, least recently used
+            entries are removed when this is exceeded
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # in-process memos so shared files (e.g. protected_au.csv used on
+        # many mirrors) and the grid are only hashed once
+        self._file_hashes = {}
+        self._grid_hashes = {}
+        self._size = sum(os.path.getsize(f) for f in self._entries())
+
+    def make_key(self, file_name, tt, value, wave, extrapolate='linear'):
+        """
+        build the cache key for a datafile entry
+
+        inputs
+        ------
+        file_name : str
+            path to the datafile
+        tt : str
+            entry type e.g. 'Coating' or 'Internal Transmission'
+        value : float or str
+            value column of the entry, only used for 'Internal Transmission'
+            and 'Fiber Length Scaled'
+        wave : array
+            wavelength grid the curve is resampled onto
+        extrapolate : str (default: 'linear')
+            extrapolation policy used when resampling
+
+        outputs
+        -------
+        key : str
+            hex digest identifying the resampled curve
+        """
+        # value only changes the curve for internal transmission (thickness) and fibers (length)
+        value = repr(value) if tt in ('Internal Transmission', 'Fiber Length Scaled') else ''
+        parts = [KEY_VERSION, self.file_hash(file_name), tt, value, self.grid_hash(wave), extrapolate]
+
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def file_hash(self, file_name):
+        """sha1 of the file contents, memoized on path, size and mtime"""
+        st = os.stat(file_name)
+        stamp = (file_name, st.st_size, st.st_mtime_ns)
+        if stamp not in self._file_hashes:
+            with open(file_name, 'rb') as f:
+                self._file_hashes[stamp] = hashlib.sha1(f.read()).hexdigest()
+
+        return self._file_hashes[stamp]
+
+    def grid_hash(self, wave):
+        """sha1 fingerprint of the wavelength grid"""
+        return grid_hash(wave, self._grid_hashes)
+
+    def get(self, key):
+        """return the cached curve for key, or None if it is not cached"""
+        path = self._path(key)
+        try:
+            curve = np.load(path)
+        except (OSError, ValueError):
+            return None
+
+        # touch the file so eviction is least-recently-used
+        os.utime(path)
+
+        return curve
+
+    def put(self, key, curve):
+        """store curve under key then evict old entries if over max_bytes"""
+        path = self._path(key)
+        tmp  = path + '.%s.tmp' % os.getpid()
+
+        # write to a temporary file and rename so readers never see a partial file
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(curve))
+        # a rewritten key (or another writer of it) replaces a file already counted
+        try:
+            self._size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+
+        self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def clear(self):
+        """remove all entries from the cache"""
+        for f in self._entries():
+            os.remove(f)
+        self._size = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def _entries(self):
+        return [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                if f.endswith('.npy')]
+
+    def _evict(self):
+        """remove least recently used entries until under max_bytes"""
+        entries = []
+        for f in self._entries():
+            st = os.stat(f)
+            entries.append((st.st_mtime, st.st_size, f))
+        entries.sort()
+
+        self._size = sum(e[1] for e in entries)
+        for _, size, f in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass # another process got to it first
+            self._size -= size
+
+
+class SharedCurves():
+    """
+    In-memory store of resampled curves shared between CalcThroughput
+    instances, passed as CalcThroughput(..., shared_curves=curves)
+
+    """
+    def __init__(self):
+        self.parsed = {} # parsed datafiles, shared as the memo of read_curve_memo
+        self.hits = 0
+        self.misses = 0
+        self._curves = {}
+        self._grid_hashes = {}
+
+    def make_key(self, file_name, tt, value, wave, extrapolate='linear'):
+        """key of a resampled datafile, see CurveCache.make_key. Files are
+        told apart by path, size and modification time"""
+        st = os.stat(file_name)
+        value = repr(value) if tt in ('Internal Transmission', 'Fiber Length Scaled') else ''
+
+        return (os.path.realpath(file_name), st.st_size, st.st_mtime_ns, tt, value,
+                grid_hash(wave, self._grid_hashes), extrapolate)
+
+    def get(self, key):
+        """return the stored curve for key, or None"""
+        curve = self._curves.get(key)
+        if curve is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return curve
+
+    def put(self, key, curve):
+        """store curve under key, read only since every budget shares it"""
+        curve = np.asarray(curve)
+        curve.setflags(write=False)
+        self._curves[key] = curve
+
+    def clear(self):
+        """forget every curve"""
+        self._curves = {}
+        self.parsed.clear()
+
+    def __len__(self):
+        return len(self._curves)
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self._curves.values())
+
+
+def grid_hash(wave, memo=None):
+    """sha1 fingerprint of a wavelength grid, memoized on the array in dict memo"""
+    if memo is not None:
+        m = memo.get(id(wave))
+        if m is not None and m[0] is wave:
+            return m[1]
+
+    w = np.ascontiguousarray(wave)
+    h = hashlib.sha1(str((w.dtype.str, w.shape)).encode())
+    h.update(w.tobytes())
+    if memo is not None:
+        memo[id(wave)] = (wave, h.hexdigest())
+
+    return h.hexdigest()
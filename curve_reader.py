@@ -0,0 +1,141 @@
+# Reader for the spectral curve datafiles in inputs/
+#
+# Each file is read once and parsed with np.loadtxt. Handles the
+# formats found in inputs/:
+# - comma, tab, semicolon or whitespace delimited columns
+# - header lines, including '#' comment headers and quoted headers that
+#   span two lines (e.g. telescope/Keck_refl_data_*.csv)
+# - files with no header at all (e.g. glass/*.txt, grating/echelle_canon.csv)
+# - utf-8 byte order marks (e.g. the Asahi csv files)
+# - empty trailing rows from excel exports (',,,,')
+#
+# Wavelengths below 100 are taken to be microns and converted to nm,
+# and transmissions with a maximum above 1.05 are taken to be percent
+import time
+import numpy as np
+
+
+class SpectralCurve():
+    """
+    Wavelength and transmission columns read from a datafile
+
+    """
+    def __init__(self, file_name, wave, values, thickness, units, scale,
+                 header, delimiter, parse_time):
+        """
+        inputs
+        ------
+        file_name - str
+            file the curve was read from
+        wave - array [nm]
+            wavelengths, converted to nm
+        values - array
+            transmission (or reflectance) as a fraction, i.e. scale applied
+        thickness - float or None
+            first value of the third column, the thickness in mm that an
+            'Internal Transmission' curve was measured at. None if there is
+            no third column
+        units - str
+            'um' or 'nm', units of the wavelength column in the file
+        scale - float
+            factor applied to the file values, 0.01 for percent otherwise 1
+        header - list
+            header lines skipped before the data
+        delimiter - str or None
+            column delimiter, None for whitespace
+        parse_time - float [s]
+            time taken to read and parse the file
+        """
+        self.file_name  = file_name
+        self.wave       = wave
+        self.values     = values
+        self.thickness  = thickness
+        self.units      = units
+        self.scale      = scale
+        self.header     = header
+        self.delimiter  = delimiter
+        self.parse_time = parse_time
+
+    def __repr__(self):
+        return 'SpectralCurve(%s, %s points, %s, scale=%s, %.1f ms)' % (
+            self.file_name, len(self.wave), self.units, self.scale, 1e3 * self.parse_time)
+
+
+def read_curve(file_name):
+    """
+    read a spectral curve datafile
+
+    inputs
+    ------
+    file_name - str
+        path to the datafile
+
+    outputs
+    -------
+    curve - SpectralCurve
+        parsed curve with wavelengths in nm and values as a fraction
+    """
+    t0 = time.perf_counter()
+    with open(file_name, 'rb') as f:
+        text = f.read().decode('utf-8-sig', errors='replace')
+    lines = text.splitlines()
+
+    # header is everything before the first line starting with a number
+    n_header = 0
+    while n_header < len(lines) and not _is_data(lines[n_header]):
+        n_header += 1
+    if n_header == len(lines):
+        raise ValueError('no numeric data found in %s' % file_name)
+
+    delimiter = _delimiter(lines[n_header])
+    # drop blank rows, including the ',,,,' rows excel leaves at the end
+    rows = [l for l in lines[n_header:] if _first_field(l, delimiter) != '']
+
+    fields  = _split(rows[0], delimiter)
+    usecols = (0, 1, 2) if len(fields) > 2 and fields[2].strip() != '' else (0, 1)
+    try:
+        f = np.loadtxt(rows, delimiter=delimiter, usecols=usecols, ndmin=2)
+    except ValueError as e:
+        raise ValueError('could not parse %s: %s' % (file_name, e))
+
+    wave, values = f[:,0], f[:,1]
+
+    # same unit guesses as always, micron if the first wavelength is small, percent if above 1
+    units = 'um' if wave[0] < 100 else 'nm'
+    if units == 'um':
+        wave = wave * 1000
+    scale = 0.01 if np.nanmax(values) > 1.05 else 1.0
+    if scale != 1.0:
+        values = values * scale
+
+    thickness = f[0,2] if len(usecols) == 3 else None
+
+    return SpectralCurve(file_name, wave, values, thickness, units, scale,
+                         lines[:n_header], delimiter, time.perf_counter() - t0)
+
+
+def _delimiter(line):
+    """guess the column delimiter from a data line, None means whitespace"""
+    for d in (',', '\t', ';'):
+        if d in line:
+            return d
+    return None
+
+
+def _split(line, delimiter):
+    return line.split(delimiter) if delimiter is not None else line.split()
+
+
+def _first_field(line, delimiter):
+    fields = _split(line, delimiter)
+    return fields[0].strip() if fields else ''
+
+
+def _is_data(line):
+    """True if the line starts with a number"""
+    field = _first_field(line, _delimiter(line))
+    try:
+        float(field)
+    except ValueError:
+        return False
+    return True
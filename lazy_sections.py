@@ -0,0 +1,78 @@
+# Section transmissions that are only computed when first used
+#
+# CalcThroughput reads the whole prescription up front but a script
+# running one path only needs the datafiles of that path's sections.
+# LazySections knows every section key from the start and calls a
+# loader the first time a section is looked up, keeping the result
+from collections.abc import MutableMapping
+
+
+class LazySections(MutableMapping):
+    """
+    Dictionary of section key -> transmission that loads each section on
+    first access. Iterating over values or items loads every section,
+    checking 'key in sections' or listing keys does not
+
+    """
+    def __init__(self, keys, load, data=None):
+        """
+        inputs
+        ------
+        keys - list
+            section keys, in spreadsheet order
+        load - function
+            load(key) -> transmission of section key
+        data - dict (default: None)
+            sections that are already computed
+        """
+        self._keys = list(keys)
+        self._load = load
+        self._data = dict(data or {})
+
+    def __getitem__(self, key):
+        if key not in self._data:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._data[key] = self._load(key)
+
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self._keys.remove(key)
+        self._data.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return 'LazySections(%s)' % ', '.join('%s%s' % (key, '' if key in self._data else ' (not loaded)')
+                                             for key in self._keys)
+
+    def is_loaded(self, key):
+        """True if section key has been computed"""
+        return key in self._data
+
+    def unload(self, key):
+        """forget section key so it is loaded again on next access"""
+        self._data.pop(key, None)
+
+    def set_keys(self, keys):
+        """change the section keys and their order, dropping sections no longer in keys"""
+        self._keys = list(keys)
+        self._data = {key: value for key, value in self._data.items() if key in self._keys}
+
+    def copy(self, load):
+        """copy with loader load, sharing the computed sections (they are
+        replaced, never changed in place)"""
+        return LazySections(self._keys, load, self._data)
@@ -0,0 +1,253 @@
+# Helpers for multiplying transmission curves in log space
+#
+# A product of curves becomes a sum of logs, which lets many products
+# be computed at once as a matrix product. Curves can contain zeros
+# and (from extrapolation) small negative values, so a curve t is
+# split into log|t| with zeros replaced by log(1), a negative mask
+# and a zero mask. Summing each part over the factors and recombining
+# with from_log gives back the exact product sign and zeros.
+import numpy as np
+
+
+def to_log(t):
+    """
+    split transmission into log magnitude, negative mask and zero mask
+
+    inputs
+    ------
+    t - array
+        transmission, any shape
+
+    outputs
+    -------
+    logabs - array
+        log(|t|), 0 where t is 0
+    neg - array
+        1.0 where t < 0 else 0.0
+    zero - array
+        1.0 where t == 0 else 0.0
+    """
+    t = np.asarray(t, dtype=float)
+    zero = (t == 0)
+    logabs = np.log(np.abs(np.where(zero, 1.0, t)))
+
+    return logabs, (t < 0).astype(float), zero.astype(float)
+
+
+def from_log(logabs, nneg, nzero):
+    """
+    recombine summed log parts into a product
+
+    inputs
+    ------
+    logabs - array
+        summed log magnitudes
+    nneg - array
+        number of negative factors
+    nzero - array
+        number of zero factors
+
+    outputs
+    -------
+    t - array
+        product of the factors
+    """
+    t = np.exp(logabs)
+    t[np.round(nneg) % 2 == 1] *= -1
+    t[nzero > 0.5] = 0
+
+    return t
+
+
+def after_logs(logabs, neg, zero):
+    """
+    summed log parts of the factors after each factor, i.e. the logs of
+    what transmits the light leaving each element of an ordered stack
+
+    inputs
+    ------
+    logabs, neg, zero - array
+        (factors x wavelength) log parts, in the order light meets them
+
+    outputs
+    -------
+    logabs, neg, zero - array
+        (factors x wavelength), row j summed over rows j+1 onwards (0 for the last)
+    """
+    after = []
+    for part in (logabs, neg, zero):
+        part = np.asarray(part, dtype=float)
+        suffix = np.zeros_like(part)
+        suffix[:-1] = np.cumsum(part[:0:-1], axis=0)[::-1]
+        after.append(suffix)
+
+    return tuple(after)
+
+
+class LogTransmissionStore():
+    """
+    Per-element log transmission kept as rows of one contiguous matrix,
+    indexed by prescription row and grouped by section. Section totals,
+    leave-one-out totals and element swaps are sums and differences of
+    rows, so no curve is ever reloaded or divided out
+
+    Constants are kept as scalars rather than full rows
+    """
+    def __init__(self, n_wave, capacity=64):
+        """
+        inputs
+        ------
+        n_wave - int
+            length of the wavelength grid
+        capacity - int (default: 64)
+            number of curve rows to allocate up front, grows as needed
+        """
+        self.n_wave = n_wave
+        self.logabs = np.zeros((capacity, n_wave))
+        self.neg    = np.zeros((capacity, n_wave), dtype=np.int8)
+        self.zero   = np.zeros((capacity, n_wave), dtype=np.int8)
+
+        self.index     = {} # prescription row -> matrix row for curves
+        self.constants = {} # prescription row -> (logabs, neg, zero) for constants
+        self.sections  = {} # section -> list of prescription rows
+        self._section  = {} # prescription row -> section
+        self._free     = list(range(capacity))[::-1]
+
+    def __contains__(self, row):
+        return row in self._section
+
+    def set(self, row, section, t):
+        """store transmission t (array on the grid, or a constant) for prescription row in section"""
+        self._assign(row, section, to_log(t))
+
+    def copy(self):
+        """independent copy, e.g. to stage updates on without touching this store"""
+        new = LogTransmissionStore.__new__(LogTransmissionStore)
+        new.n_wave = self.n_wave
+        new.logabs, new.neg, new.zero = self.logabs.copy(), self.neg.copy(), self.zero.copy()
+        new.index     = dict(self.index)
+        new.constants = dict(self.constants)
+        new.sections  = {section: list(rows) for section, rows in self.sections.items()}
+        new._section  = dict(self._section)
+        new._free     = list(self._free)
+
+        return new
+
+    def copy_from(self, other, other_row, row, section):
+        """copy the stored parts of other_row in store other to row here, exactly"""
+        self._assign(row, section, other.parts(other_row))
+
+    def remove(self, row):
+        """drop prescription row from the store"""
+        if row not in self._section:
+            return
+        self.sections[self._section.pop(row)].remove(row)
+        if row in self.constants:
+            del self.constants[row]
+        else:
+            self._free.append(self.index.pop(row))
+
+    def parts(self, row):
+        """(logabs, neg, zero) of prescription row"""
+        if row in self.constants:
+            return self.constants[row]
+        j = self.index[row]
+
+        return self.logabs[j], self.neg[j], self.zero[j]
+
+    def curve(self, row):
+        """transmission of prescription row, a float for constants"""
+        logabs, neg, zero = self.parts(row)
+        if row in self.constants:
+            return float(from_log(np.atleast_1d(logabs), np.atleast_1d(neg), np.atleast_1d(zero))[0])
+
+        return from_log(logabs, neg, zero)
+
+    def section_total(self, section, exclude=(), extra=None):
+        """
+        product of the rows in section
+
+        inputs
+        ------
+        section - str
+            section key
+        exclude - list (default: ())
+            prescription rows to leave out of the product
+        extra - tuple (default: None)
+            (logabs, neg, zero) of an additional factor to multiply in
+
+        outputs
+        -------
+        t - array
+            section transmission on the grid
+        """
+        logabs, neg, zero = self.section_logs(section, exclude)
+        if extra is not None:
+            logabs, neg, zero = logabs + extra[0], neg + extra[1], zero + extra[2]
+
+        return from_log(logabs, neg, zero)
+
+    def section_logs(self, section, exclude=()):
+        """summed (logabs, neg, zero) of the rows in section, leaving out exclude"""
+        return self._sum([r for r in self.sections.get(section, []) if r not in exclude])
+
+    def leave_one_out(self, section):
+        """
+        section totals with each row left out in turn
+
+        outputs
+        -------
+        rows - list
+            prescription rows of the section
+        totals - array
+            (rows x wavelength), totals[k] is the section without rows[k]
+        """
+        rows = self.sections.get(section, [])
+        logabs, neg, zero = self._sum(rows)
+        parts = [self.parts(r) for r in rows]
+        totals = np.vstack([from_log(logabs - p[0], neg - p[1], zero - p[2]) for p in parts]) \
+                 if rows else np.ones((0, self.n_wave))
+
+        return rows, totals
+
+    def swap(self, section, row, t):
+        """section total with prescription row replaced by transmission t"""
+        return self.section_total(section, exclude=(row,), extra=to_log(t))
+
+    def _sum(self, rows):
+        """summed log parts of prescription rows"""
+        curves = [self.index[r] for r in rows if r in self.index]
+        logabs = self.logabs[curves].sum(axis=0) if curves else np.zeros(self.n_wave)
+        neg    = self.neg[curves].sum(axis=0, dtype=np.int32) if curves else np.zeros(self.n_wave, dtype=np.int32)
+        zero   = self.zero[curves].sum(axis=0, dtype=np.int32) if curves else np.zeros(self.n_wave, dtype=np.int32)
+        for r in rows:
+            if r in self.constants:
+                c = self.constants[r]
+                logabs, neg, zero = logabs + c[0], neg + c[1], zero + c[2]
+
+        return logabs, neg, zero
+
+    def _assign(self, row, section, parts):
+        self.remove(row)
+        self._section[row] = section
+        self.sections.setdefault(section, []).append(row)
+        self.sections[section].sort()
+
+        logabs, neg, zero = parts
+        if np.ndim(logabs) == 0:
+            self.constants[row] = (float(logabs), int(neg), int(zero))
+            return
+
+        if not self._free:
+            self._grow()
+        j = self._free.pop()
+        self.index[row] = j
+        self.logabs[j], self.neg[j], self.zero[j] = logabs, neg, zero
+
+    def _grow(self):
+        """double the number of curve rows"""
+        n = len(self.logabs)
+        self.logabs = np.vstack((self.logabs, np.zeros_like(self.logabs)))
+        self.neg    = np.vstack((self.neg, np.zeros_like(self.neg)))
+        self.zero   = np.vstack((self.zero, np.zeros_like(self.zero)))
+        self._free  = list(range(n, 2 * n))[::-1] + self._free
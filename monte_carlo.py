@@ -0,0 +1,95 @@
+# Error model for Monte Carlo throughput budgets
+#
+# Each element with an 'Error' entry in the spreadsheet is perturbed by
+# one normal draw per realization, the same draw at every wavelength
+# (a coating that is 1% low is low everywhere) and in every path the
+# element is part of. Two error types are supported, set in the
+# 'Error Type' column:
+# - 'Relative' : t * (1 + Error * z), e.g. 0.01 for a 1% coating spread
+# - 'Absolute' : t + Error * z, e.g. 0.005 for a constant known to +/-0.005
+# Blank 'Error Type' means 'Relative'. Perturbed transmissions are
+# clipped to be at least 0 and at most max(1, t)
+import numpy as np
+
+ERROR_TYPES = ('Relative', 'Absolute')
+
+
+def read_error_model(excel_file):
+    """
+    read the error columns of a prescription spreadsheet
+
+    inputs
+    ------
+    excel_file - str
+        path to and name of excel file to load
+
+    outputs
+    -------
+    errors - dict
+        spreadsheet row -> (error type, 1 sigma error) for the rows with an error
+    """
+    import pandas as pd # only needed when reading from excel
+
+    xl = pd.ExcelFile(excel_file)
+    df = xl.parse(xl.sheet_names[0])
+    if 'Error' not in df:
+        raise ValueError("%s has no 'Error' column, add one (and optionally 'Error Type') "
+                         "or pass errors explicitly" % excel_file)
+
+    types = df['Error Type'] if 'Error Type' in df else [np.nan] * len(df)
+    errors = {}
+    for i, (error, error_type) in enumerate(zip(df['Error'], types)):
+        try:
+            error = float(error)
+        except (TypeError, ValueError):
+            continue
+        if not np.isfinite(error) or error == 0:
+            continue
+        error_type = 'Relative' if not isinstance(error_type, str) else error_type.strip()
+        errors[i] = check_error(error_type, error)
+
+    return errors
+
+
+def check_error(error_type, error):
+    """validate one error model entry, returns (error type, error)"""
+    if error_type not in ERROR_TYPES:
+        raise ValueError('Error Type must be one of %s, not %s' % (ERROR_TYPES, error_type))
+    if error < 0:
+        raise ValueError('Error must be positive, not %s' % error)
+
+    return error_type, float(error)
+
+
+def perturb(t, error_type, error, z, clip=True):
+    """
+    realizations of a perturbed element
+
+    inputs
+    ------
+    t - array or float
+        nominal transmission on (part of) the grid, or a constant
+    error_type - str
+        'Relative' or 'Absolute'
+    error - float
+        1 sigma error
+    z - array
+        standard normal draws, one per realization
+    clip - bool (default: True)
+        keep the perturbed transmission between 0 and max(1, t)
+
+    outputs
+    -------
+    t_draws - array
+        (draws x wavelength), or (draws x 1) for constants
+    """
+    t = np.atleast_1d(np.asarray(t, dtype=float))[None, :]
+    z = np.asarray(z, dtype=float)[:, None]
+    if error_type == 'Relative':
+        out = t * (1 + error * z)
+    else:
+        out = t + error * z
+    if clip:
+        np.clip(out, 0, np.maximum(t, 1), out=out)
+
+    return out
@@ -0,0 +1,215 @@
+# Batch figures of many paths
+#
+# calc_throughput.py used to plot the sections and total of each path one
+# after another at 500 dpi with every grid point on every line, which
+# took longer than computing them. render_report makes the same figure
+# for every path in configs and:
+# - decimates each line to the width of the figure in pixels, keeping the
+#   min and max sample of each pixel column so dichroic edges and narrow
+#   features are drawn where they are
+# - hashes what goes into each figure (curves, labels and plot settings)
+#   and skips figures whose hash matches the one saved with the image
+# - renders the remaining figures in a process pool. Figures are made
+#   with matplotlib.figure.Figure, not pyplot, so no window or global
+#   state is involved
+#
+# example:
+#   done = render_report(ct, configs, './outputs/', workers=4)
+#   done['rendered'], done['skipped']
+import hashlib
+import json
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from cThroughput import yJ, HK
+
+FONT = {'font.size' : 14}
+MANIFEST = '.plot_report.json'
+VERSION = 1 # bump when the figure layout changes so every figure is redrawn
+
+
+def decimate(x, y, n_bins):
+    """
+    keep the first, min, max and last sample of n_bins equal runs of samples
+
+    inputs
+    ------
+    x - array
+        (n,) x values, increasing
+    y - array
+        (n,) y values, nans are kept so gaps stay gaps
+    n_bins - int
+        number of runs, e.g. the width of the plot in pixels
+
+    outputs
+    -------
+    x_dec, y_dec - arrays
+        at most 2 n_bins + 2 samples of x and y, in order
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2 * n_bins + 2:
+        return x, y
+
+    # equal runs of k samples, the last padded with its final value
+    k = int(np.ceil(n / n_bins))
+    y_pad = np.concatenate((y, np.repeat(y[-1:], n_bins * k - n))).reshape(n_bins, k)
+    nan = np.isnan(y_pad)
+    start = np.arange(n_bins) * k
+    i_min = start + np.argmin(np.where(nan, np.inf, y_pad), axis=1)
+    i_max = start + np.argmax(np.where(nan, -np.inf, y_pad), axis=1)
+    i_nan = start + np.argmax(nan, axis=1)
+    keep = np.concatenate(([0, n - 1], i_min, i_max, i_nan[nan.any(axis=1)]))
+    keep = np.unique(np.clip(keep, 0, n - 1))
+
+    return x[keep], y[keep]
+
+
+def path_figures(ct, configs):
+    """
+    what goes into the figure of each path: the sections that are not all
+    ones and the total, as in plot_subsections and plot_total_throughput
+
+    inputs
+    ------
+    ct - CalcThroughput
+        loaded prescription
+    configs - dict
+        path name -> list of section keys, as for run_many
+
+    outputs
+    -------
+    figures - dict
+        path name -> {'label', 'lines': [(label, x, y, style), ...]}
+    """
+    names = list(configs)
+    total = ct.run_many(configs)
+    figures = {}
+    for j, name in enumerate(names):
+        lines = [(key, ct.wave, ct.transmission_dic[key], None) for key in configs[name]
+                 if np.any(ct.transmission_dic[key] != 1)]
+        lines.append(('Total Throughput', ct.output_wave, total[j], 'k'))
+        figures[name] = {'label': name, 'lines': lines}
+
+    return figures
+
+
+def figure_hash(figure, settings):
+    """sha1 of the lines, labels and plot settings of one figure"""
+    h = hashlib.sha1(json.dumps([VERSION, figure['label'], settings], sort_keys=True).encode('utf-8'))
+    for label, x, y, style in figure['lines']:
+        h.update(json.dumps([label, style]).encode('utf-8'))
+        for a in (x, y):
+            a = np.ascontiguousarray(a, dtype=float)
+            h.update(str(a.shape).encode('utf-8'))
+            h.update(a.tobytes())
+
+    return h.hexdigest()
+
+
+def render_report(ct, configs, save_path, workers=None, dpi=500, figsize=(9, 4), n_bins=None,
+                  fmt='png', force=False):
+    """
+    save the section and total throughput figure of every path, skipping
+    figures that have not changed since they were last saved
+
+    inputs
+    ------
+    ct - CalcThroughput
+        loaded prescription
+    configs - dict
+        path name -> list of section keys, as for run_many
+    save_path - str
+        directory for the figures, saved as transmission_total_<path>.<fmt>
+        like plot_total_throughput, with the hashes in .plot_report.json
+    workers - int (default: None)
+        number of processes rendering figures, None renders here
+    dpi - int (default: 500)
+        resolution of the saved figures
+    figsize - tuple (default: (9, 4))
+        figure size in inches
+    n_bins - int (default: None)
+        pixel columns lines are decimated to, None is the figure width
+        in pixels (figsize[0] * dpi)
+    fmt - str (default: 'png')
+        image format passed to savefig
+    force - bool (default: False)
+        render every figure even if its hash is unchanged
+
+    outputs
+    -------
+    done - dict
+        'rendered' and 'skipped' lists of file names
+    """
+    if n_bins is None:
+        n_bins = int(figsize[0] * dpi)
+    settings = {'dpi': dpi, 'figsize': list(figsize), 'n_bins': n_bins, 'fmt': fmt}
+
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+    manifest_file = os.path.join(save_path, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    jobs, skipped = [], []
+    for name, figure in path_figures(ct, configs).items():
+        file_name = os.path.join(save_path, 'transmission_total_%s.%s' % (name, fmt))
+        key = figure_hash(figure, settings)
+        if not force and manifest.get(os.path.basename(file_name)) == key and os.path.exists(file_name):
+            skipped.append(file_name)
+            continue
+        # only the decimated lines go to the workers
+        lines = [(label, *decimate(x, y, n_bins), style) for label, x, y, style in figure['lines']]
+        jobs.append((file_name, key, figure['label'], lines, settings))
+
+    if workers is not None and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            rendered = list(ex.map(_render, jobs))
+    else:
+        rendered = [_render(job) for job in jobs]
+
+    for file_name, key in rendered:
+        manifest[os.path.basename(file_name)] = key
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return {'rendered': [file_name for file_name, key in rendered], 'skipped': skipped}
+
+
+def _render(job):
+    """draw and save one figure, module level so it can run in a process pool"""
+    import matplotlib # only needed to draw
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import MultipleLocator
+
+    file_name, key, label, lines, settings = job
+    with matplotlib.rc_context(FONT):
+        fig = Figure(figsize=settings['figsize'])
+        ax = fig.subplots(1, 1)
+        ax.fill_between(yJ, y1=0, y2=1, facecolor='blue', alpha=0.1, zorder=-100)
+        ax.fill_between(HK, y1=0, y2=1, facecolor='red', alpha=0.1)
+        for line_label, x, y, style in lines:
+            if style is None:
+                ax.plot(x, y, label=line_label)
+            else:
+                ax.plot(x, y, style, label=line_label)
+        ax.set_ylim(0, 1.1)
+        ax.legend(fontsize=7)
+
+        # grids!
+        ax.yaxis.grid(True, which='both', alpha=0.5)
+        ax.yaxis.set_minor_locator(MultipleLocator(0.01))
+        ax.yaxis.set_major_locator(MultipleLocator(0.1))
+
+        ax.set_xlabel('Wavelength (nm)', fontsize=12)
+        ax.set_ylabel('Throughput', fontsize=12)
+        ax.grid()
+        ax.set_title(label)
+        fig.tight_layout()
+        fig.savefig(file_name, dpi=settings['dpi'], format=settings['fmt'])
+
+    return file_name, key
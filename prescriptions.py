@@ -0,0 +1,214 @@
+# Several revisions of a prescription loaded side by side
+#
+# Comparing HISPEC_allsubs.xlsx with HISPEC_gary_version.xlsx (or with
+# older revisions) used to mean one independent CalcThroughput each,
+# every one of them parsing and resampling the same coating files.
+# PrescriptionSet loads any number of spreadsheets against one
+# SharedCurves store (see curve_cache.py), so each unique (datafile,
+# type, value) is parsed and resampled once however many revisions use
+# it, and sections stay lazy so only what is compared is loaded.
+#
+# diff(old, new) lines the two prescriptions up by (section, element,
+# occurrence) like update_from_excel and reports:
+# - elements : rows added, removed or changed (include, type, value, datafile)
+# - sections : sections added, removed or with changed rows, and the band
+#              mean of the changed ones in each revision
+# - paths    : band mean of each path in each revision and the change
+# A path with a datafile that cannot be read (e.g. one not checked in to
+# inputs/) is nan in that revision and the error naming the file is kept
+# in 'errors', the rest of the diff is still made
+#
+# example:
+#   ps = PrescriptionSet(x, {'allsubs': '../HISPEC_allsubs.xlsx',
+#                            'gary': '../HISPEC_gary_version.xlsx'}, data_path='./inputs/')
+#   d = ps.diff('gary', 'allsubs', configs)
+#   d['paths']['delta']  # (paths x bands)
+import os
+import numpy as np
+
+from cThroughput import CalcThroughput, yJ, HK
+from curve_cache import SharedCurves
+
+ROW_FIELDS = ('include', 'type', 'value', 'datafile')
+
+
+class PrescriptionSet():
+    """
+    Prescriptions on one wavelength grid sharing their datafile curves
+
+    """
+    def __init__(self, wave, excel_files, data_path='./data/throughput/hispec_subsystems/',
+                 extrapolate='linear', workers=None, pool='thread', lazy=True):
+        """
+        inputs
+        ------
+        wave - array [nm]
+            wavelength grid every prescription is sampled on
+        excel_files - list or dict
+            excel files, or name -> excel file. Names default to the file
+            name without its extension. Assumes location is data_path
+        data_path - str
+            path to the excel files and the datafiles they point to
+        extrapolate - str (default: 'linear')
+            see CalcThroughput
+        workers, pool - see CalcThroughput
+        lazy - bool (default: True)
+            only load sections when they are used. If False every section
+            of every prescription is loaded now
+        """
+        self.wave = wave
+        self.data_path = data_path
+        self.extrapolate = extrapolate
+        self.workers = workers
+        self.pool = pool
+        self.curves = SharedCurves()
+        self.budgets = {}
+
+        if not isinstance(excel_files, dict):
+            excel_files = {os.path.splitext(os.path.basename(f))[0]: f for f in excel_files}
+        for name, excel_file in excel_files.items():
+            self.add(name, excel_file, lazy=lazy)
+
+    def add(self, name, excel_file, lazy=True):
+        """load another prescription against the shared curves, returns its CalcThroughput"""
+        if name in self.budgets:
+            raise ValueError('there is already a prescription called %s' % name)
+        self.budgets[name] = CalcThroughput(self.wave, excel_file, data_path=self.data_path,
+                                            workers=self.workers, pool=self.pool,
+                                            extrapolate=self.extrapolate, lazy=lazy,
+                                            shared_curves=self.curves)
+        return self.budgets[name]
+
+    def __getitem__(self, name):
+        return self.budgets[name]
+
+    def __iter__(self):
+        return iter(self.budgets)
+
+    def __len__(self):
+        return len(self.budgets)
+
+    def keys(self):
+        return self.budgets.keys()
+
+    def diff(self, old, new, configs=None, bands=None):
+        """
+        structured diff of two prescriptions
+
+        inputs
+        ------
+        old, new - str
+            names of the prescriptions to compare
+        configs - dict (default: None)
+            path name -> list of section keys, as for run_many. Paths using a
+            section one prescription does not have are nan in that one
+        bands - dict (default: None)
+            band name -> [start, end] in nm. Defaults to yJ and HK
+
+        outputs
+        -------
+        diff - dictionary
+            'old' and 'new' names, 'bands' names and
+            'elements' - list of dicts with 'section', 'element', 'occurrence',
+                         'change' ('added', 'removed' or 'changed') and the
+                         'old' and 'new' rows (include, type, value, datafile),
+                         None where the row does not exist
+            'sections' - 'added', 'removed' and 'changed' section keys, and
+                         'old', 'new' and 'delta' (changed x bands) band means
+            'paths'    - if configs is given, 'names' and 'old', 'new' and
+                         'delta' (paths x bands) band means
+            Both 'sections' and 'paths' have 'errors', 'old' and 'new' dicts
+            of path name -> error for paths left nan because a datafile
+            could not be loaded, e.g. a missing file
+        """
+        if bands is None:
+            bands = {'yJ': yJ, 'HK': HK}
+        a, b = self.budgets[old], self.budgets[new]
+
+        # rows lined up by (section, element, occurrence)
+        rows_a, rows_b = a._rowIndex(), b._rowIndex()
+        elements = []
+        for label in list(rows_a) + [label for label in rows_b if label not in rows_a]:
+            row_a = rows_a[label][1] if label in rows_a else None
+            row_b = rows_b[label][1] if label in rows_b else None
+            if row_a == row_b or (row_a or row_b)[1] == 'Note':
+                continue # same row, or the row starting a section
+            change = 'added' if row_a is None else 'removed' if row_b is None else 'changed'
+            elements.append({'section'   : label[0],
+                             'element'   : label[1],
+                             'occurrence': label[2],
+                             'change'    : change,
+                             'old'       : dict(zip(ROW_FIELDS, row_a)) if row_a is not None else None,
+                             'new'       : dict(zip(ROW_FIELDS, row_b)) if row_b is not None else None})
+
+        keys_a, keys_b = list(a.transmission_dic.keys()), list(b.transmission_dic.keys())
+        changed = [key for key in dict.fromkeys(e['section'] for e in elements)
+                   if key in keys_a and key in keys_b]
+        out = {'old'     : old,
+               'new'     : new,
+               'bands'   : list(bands),
+               'elements': elements,
+               'sections': dict({'added'  : [key for key in keys_b if key not in keys_a],
+                                 'removed': [key for key in keys_a if key not in keys_b],
+                                 'changed': changed},
+                                **self._bandDelta(a, b, {key: [key] for key in changed}, bands))}
+
+        if configs is not None:
+            out['paths'] = dict({'names': list(configs)}, **self._bandDelta(a, b, configs, bands))
+
+        return out
+
+    def compare(self, configs=None, bands=None, reference=None):
+        """
+        diff every prescription against one of them
+
+        inputs
+        ------
+        configs, bands - see diff
+        reference - str (default: None)
+            name of the prescription to compare against, None for the first
+
+        outputs
+        -------
+        diffs - dictionary
+            name -> diff(reference, name) for every other prescription
+        """
+        names = list(self.budgets)
+        if reference is None:
+            reference = names[0]
+
+        return {name: self.diff(reference, name, configs, bands) for name in names if name != reference}
+
+    def _bandDelta(self, a, b, configs, bands):
+        """band means of the paths in configs for budgets a and b"""
+        errors = {'old': {}, 'new': {}}
+        means = [self._bandMeans(ct, configs, bands, errors[which]) for ct, which in ((a, 'old'), (b, 'new'))]
+
+        return {'old': means[0], 'new': means[1], 'delta': means[1] - means[0], 'errors': errors}
+
+    def _bandMeans(self, ct, configs, bands, errors):
+        """(paths x bands) band means, nan for paths with a section ct does not
+        have or cannot load. Why a path could not be loaded goes in errors"""
+        means = np.full((len(configs), len(bands)), np.nan)
+        keys = set(ct.transmission_dic.keys())
+        failed = {} # section -> error, so a bad section is only tried once
+        have = {}
+        for name, sections in configs.items():
+            if not set(sections) <= keys:
+                continue
+            for key in sections:
+                if key not in failed:
+                    try:
+                        ct.transmission_dic[key] # loads the section
+                    except OSError as e:
+                        failed[key] = 'section %s: %s' % (key, e)
+                if key in failed:
+                    errors[name] = failed[key]
+                    break
+            else:
+                have[name] = sections
+        if have:
+            rows = [j for j, name in enumerate(configs) if name in have]
+            means[rows] = ct._bandSummary(bands).mean(ct._runMany(have))
+
+        return means
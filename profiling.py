@@ -0,0 +1,377 @@
+# Timing of the stages of loading a prescription
+#
+# When loading is slow it is not obvious whether the excel read, one
+# odd datafile, the delimiter and header detection or the resampling is
+# to blame. A Profiler passed to CalcThroughput records one StageRecord
+# per stage of each element:
+# - 'excel'         : reading the spreadsheet
+# - 'adaptive_grid' : building the adaptive grid, if used
+# - 'cache'         : looking up a resampled curve in the curve cache
+# - 'parse'         : reading and parsing a datafile (header, delimiter,
+#                     units), skipped when the parsed file is reused
+# - 'resample'      : interpolating onto the grid
+# - 'scale'         : thickness or fiber length scaling
+# - 'analytic'      : computing Strehl rows
+# - 'pool'          : the whole pool of a parallel load, whose per file
+#                     'parse' records come from the workers
+# - 'assemble'      : storing the element and multiplying it into its section
+# each with its wall time, the bytes read from disk and the arrays it
+# allocated, keyed by section and 'Element' name. Without a profiler
+# every hook is a shared do-nothing stage
+#
+# example:
+#   ct = CalcThroughput(wave, excel_file, data_path=data_path, profile=True)
+#   ct.load()
+#   print(ct.profile_report())
+#   ct.profile_report().slowest(5)
+import os
+import time
+import tracemalloc
+import numpy as np
+
+
+class StageRecord():
+    """
+    What one stage of one element cost
+
+    """
+    def __init__(self, stage, section=None, element=None, row=None, path=None):
+        """
+        inputs
+        ------
+        stage - str
+            stage name, e.g. 'parse'
+        section - str (default: None)
+            section key of the element, None for stages of the whole load
+        element - str (default: None)
+            'Element' name in the spreadsheet
+        row - int (default: None)
+            spreadsheet row of the element
+        path - str (default: None)
+            datafile the stage worked on
+        """
+        self.stage   = stage
+        self.section = section
+        self.element = element
+        self.row     = row
+        self.path    = path
+        self.time        = 0.0 # s
+        self.bytes_read  = 0
+        self.allocations = 0   # arrays made
+        self.alloc_bytes = 0   # their size
+        self.peak_bytes  = None # traced peak, only with trace_memory
+
+    def __repr__(self):
+        return 'StageRecord(%s, %s/%s, %.3f ms, %s bytes read, %s arrays %s bytes)' % (
+            self.stage, self.section, self.element, 1e3 * self.time, self.bytes_read,
+            self.allocations, self.alloc_bytes)
+
+    def read(self, path):
+        """count the size of file path as read"""
+        self.path = self.path or path
+        self.bytes_read += os.path.getsize(path)
+
+    def alloc(self, *arrays):
+        """count arrays made by the stage, constants are ignored"""
+        for a in arrays:
+            if isinstance(a, np.ndarray):
+                self.allocations += 1
+                self.alloc_bytes += a.nbytes
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class _Stage():
+    """context manager timing one stage into a record"""
+    def __init__(self, profiler, record):
+        self.profiler = profiler
+        self.record = record
+
+    def __enter__(self):
+        if self.profiler.trace_memory:
+            tracemalloc.reset_peak()
+            self._start = tracemalloc.get_traced_memory()[0]
+        self._t0 = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *args):
+        self.record.time = time.perf_counter() - self._t0
+        if self.profiler.trace_memory:
+            self.record.peak_bytes = tracemalloc.get_traced_memory()[1] - self._start
+        self.profiler._add(self.record)
+
+
+class _NullStage():
+    """stage of a disabled profiler, every hook does nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def read(self, path):
+        pass
+
+    def alloc(self, *arrays):
+        pass
+
+
+class _NullElement():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_STAGE = _NullStage()
+NULL_ELEMENT = _NullElement()
+
+
+class Profiler():
+    """
+    Collects StageRecords and passes each one to an optional callback
+
+    """
+    enabled = True
+
+    def __init__(self, callback=None, trace_memory=False):
+        """
+        inputs
+        ------
+        callback - function (default: None)
+            called with each StageRecord as its stage ends, e.g. to log
+            rows slower than some limit as they load
+        trace_memory - bool (default: False)
+            also record the traced peak memory of each stage with
+            tracemalloc. Slows everything down, so off by default
+        """
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.records = []
+        self._element = (None, None, None)
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, stage, path=None):
+        """context manager timing stage for the current element, gives the StageRecord"""
+        section, element, row = self._element
+        return _Stage(self, StageRecord(stage, section, element, row, path))
+
+    def element(self, section, element, row):
+        """context manager making stages inside it belong to one element"""
+        return _Element(self, (section, element, row))
+
+    def add(self, stage, time=0.0, path=None, bytes_read=0, element=None):
+        """record a stage timed elsewhere, e.g. in a pool worker
+
+        inputs
+        ------
+        stage - str
+            stage name
+        time - float [s] (default: 0)
+            wall time of the stage
+        path - str (default: None)
+            datafile the stage worked on
+        bytes_read - int (default: 0)
+            bytes read from disk
+        element - tuple (default: None)
+            (section, element name, row), None for the current element
+        """
+        record = StageRecord(stage, *(element or self._element), path=path)
+        record.time = time
+        record.bytes_read = bytes_read
+        self._add(record)
+
+        return record
+
+    def report(self):
+        """ProfileReport of everything recorded so far"""
+        return ProfileReport(self.records)
+
+    def clear(self):
+        """forget the records"""
+        self.records = []
+
+    def _add(self, record):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+
+class NullProfiler():
+    """
+    Profiler that records nothing, what CalcThroughput uses when profiling is off
+
+    """
+    enabled = False
+    records = ()
+
+    def stage(self, stage, path=None):
+        return NULL_STAGE
+
+    def element(self, section, element, row):
+        return NULL_ELEMENT
+
+    def add(self, *args, **kwargs):
+        pass
+
+    def report(self):
+        return ProfileReport([])
+
+    def clear(self):
+        pass
+
+
+NO_PROFILE = NullProfiler()
+
+
+class _Element():
+    """context manager setting the current element of a profiler"""
+    def __init__(self, profiler, element):
+        self.profiler = profiler
+        self.element = element
+
+    def __enter__(self):
+        self._previous = self.profiler._element
+        self.profiler._element = self.element
+
+    def __exit__(self, *args):
+        self.profiler._element = self._previous
+
+
+def make_profiler(profile):
+    """
+    profiler for the profile option of CalcThroughput
+
+    inputs
+    ------
+    profile - bool, function or Profiler
+        False/None for no profiling, True to profile, a function to
+        profile and call it with each StageRecord, or a Profiler
+
+    outputs
+    -------
+    profiler - Profiler or NullProfiler
+    """
+    if profile is None or profile is False:
+        return NO_PROFILE
+    if profile is True:
+        return Profiler()
+    if isinstance(profile, (Profiler, NullProfiler)):
+        return profile
+    if callable(profile):
+        return Profiler(callback=profile)
+
+    raise ValueError('profile must be a bool, a function or a Profiler, not %s' % type(profile))
+
+
+class ProfileReport():
+    """
+    Summary of StageRecords by stage, by element and by datafile
+
+    """
+    FIELDS = ('time', 'bytes_read', 'allocations', 'alloc_bytes')
+
+    def __init__(self, records):
+        """
+        inputs
+        ------
+        records - list
+            StageRecords, e.g. Profiler.records
+        """
+        self.records = list(records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def total(self):
+        """summed time, bytes read and allocations of every record"""
+        return self._sum(self.records)
+
+    def by_stage(self):
+        """
+        outputs
+        -------
+        stages - dictionary
+            stage -> {'count', 'time', 'bytes_read', 'allocations', 'alloc_bytes'},
+            and the largest 'peak_bytes' when memory was traced
+        """
+        return self._group(lambda r: r.stage)
+
+    def by_element(self):
+        """
+        outputs
+        -------
+        elements - dictionary
+            (section, element, row) -> totals as in by_stage, plus the
+            time of each 'stages'
+        """
+        elements = self._group(lambda r: (r.section, r.element, r.row), skip=lambda r: r.row is None)
+        for key, totals in elements.items():
+            totals['stages'] = {}
+        for r in self.records:
+            if r.row is not None:
+                stages = elements[(r.section, r.element, r.row)]['stages']
+                stages[r.stage] = stages.get(r.stage, 0.0) + r.time
+
+        return elements
+
+    def by_file(self):
+        """totals as in by_stage for each datafile"""
+        return self._group(lambda r: r.path, skip=lambda r: r.path is None)
+
+    def slowest(self, n=10):
+        """
+        the n slowest elements
+
+        outputs
+        -------
+        slowest - list
+            ((section, element, row), totals) sorted by time, slowest first
+        """
+        elements = self.by_element()
+        return sorted(elements.items(), key=lambda kv: kv[1]['time'], reverse=True)[:n]
+
+    def to_dict(self):
+        """JSON serializable summary and records"""
+        return {'total'   : self.total(),
+                'stages'  : self.by_stage(),
+                'elements': [dict(zip(('section', 'element', 'row'), key), **totals)
+                             for key, totals in self.by_element().items()],
+                'records' : [r.to_dict() for r in self.records]}
+
+    def __str__(self):
+        lines = ['%-14s %6s %10s %12s %8s %12s' % ('stage', 'count', 'time (ms)', 'bytes read', 'arrays', 'array bytes')]
+        for stage, t in self.by_stage().items():
+            lines.append('%-14s %6d %10.2f %12d %8d %12d' % (stage, t['count'], 1e3 * t['time'], t['bytes_read'],
+                                                             t['allocations'], t['alloc_bytes']))
+        t = self.total()
+        lines.append('%-14s %6d %10.2f %12d %8d %12d' % ('total', t['count'], 1e3 * t['time'], t['bytes_read'],
+                                                         t['allocations'], t['alloc_bytes']))
+        slowest = self.slowest(5)
+        if slowest:
+            lines.append('slowest elements:')
+            for (section, element, row), t in slowest:
+                lines.append('  %8.2f ms  row %s  %s / %s' % (1e3 * t['time'], row, section, element))
+
+        return '\n'.join(lines)
+
+    def _group(self, key, skip=None):
+        groups = {}
+        for r in self.records:
+            if skip is None or not skip(r):
+                groups.setdefault(key(r), []).append(r)
+
+        return {k: self._sum(records) for k, records in groups.items()}
+
+    def _sum(self, records):
+        totals = {'count': len(records)}
+        for field in self.FIELDS:
+            totals[field] = sum(getattr(r, field) for r in records)
+        peaks = [r.peak_bytes for r in records if r.peak_bytes is not None]
+        if peaks:
+            totals['peak_bytes'] = max(peaks)
+
+        return totals
@@ -0,0 +1,130 @@
+# Linear resampling of datafile curves onto the wavelength grid
+#
+# interp1d sorts the source wavelengths, searches the grid and computes
+# slopes every time it is built. Here the sort order, grid indices and
+# interval widths are worked out once per (source wavelengths, grid)
+# pair and reused for every curve sampled on the same wavelengths,
+# e.g. protected_au.csv used on many mirrors. Each table holds six grid
+# length arrays, so only the max_tables most recently used are kept.
+# Results match interp1d(..., fill_value='extrapolate') for the 'linear'
+# policy
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+EXTRAPOLATE = ('linear', 'clamp', 'constant')
+
+
+class Resampler():
+    """
+    Resamples curves onto a fixed wavelength grid, reusing the
+    interpolation tables for curves that share source wavelengths
+
+    """
+    def __init__(self, wave, extrapolate='linear', fill_value=np.nan, max_tables=8):
+        """
+        inputs
+        ------
+        wave - array [nm]
+            grid to resample onto
+        extrapolate - str (default: 'linear')
+            what to do outside the range of a curve
+            'linear'   - extend the first/last interval (interp1d 'extrapolate')
+            'clamp'    - hold the first/last value
+            'constant' - use fill_value
+        fill_value - float (default: nan)
+            value outside the curve range for extrapolate='constant'
+        max_tables - int (default: 8)
+            number of interpolation tables kept, least recently used
+            first out. Bounds the memory to about 6 x max_tables x grid
+        """
+        if extrapolate not in EXTRAPOLATE:
+            raise ValueError('extrapolate must be one of %s, not %s' % (EXTRAPOLATE, extrapolate))
+
+        self.wave = np.asarray(wave, dtype=float)
+        self.extrapolate = extrapolate
+        self.fill_value = fill_value
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        self._lock = threading.Lock() # the tables are shared by _loadParallel threads
+
+    def __call__(self, x, y):
+        """
+        resample y(x) onto the grid
+
+        inputs
+        ------
+        x - array [nm]
+            source wavelengths, any order
+        y - array
+            source values, the last axis matches x so many curves on
+            the same wavelengths can be resampled in one call
+
+        outputs
+        -------
+        y_new - array
+            y sampled on the grid
+        """
+        order, lo, hi, denom, dx, below, above = self.table(x)
+        y = np.asarray(y, dtype=float)[..., order]
+
+        # same arithmetic as interp1d so results are identical
+        y_lo = y[..., lo]
+        y_new = (y[..., hi] - y_lo) / denom * dx + y_lo
+
+        if self.extrapolate == 'clamp':
+            y_new[..., below] = y[..., :1]
+            y_new[..., above] = y[..., -1:]
+        elif self.extrapolate == 'constant':
+            y_new[..., below | above] = self.fill_value
+
+        return y_new
+
+    def table(self, x):
+        """interpolation table for source wavelengths x, reused while it is
+        among the max_tables most recently used"""
+        x = np.ascontiguousarray(x, dtype=float)
+        key = (x.shape, hashlib.sha1(x.tobytes()).digest())
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                return table
+
+        table = self._build(x)
+        with self._lock:
+            self._tables[key] = table
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+
+        return table
+
+    def __getstate__(self):
+        # locks do not pickle (process pools), and tables are cheaper to rebuild than send
+        state = dict(self.__dict__, _tables=OrderedDict())
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _build(self, x):
+        if x.ndim != 1 or len(x) < 2:
+            raise ValueError('need at least two source wavelengths to interpolate')
+        if not np.all(np.isfinite(x)):
+            raise ValueError('source wavelengths must be finite')
+
+        # stable sort like interp1d so duplicate wavelengths behave the same
+        order = np.argsort(x, kind='mergesort')
+        xs = x[order]
+
+        hi = np.clip(np.searchsorted(xs, self.wave), 1, len(xs) - 1)
+        lo = hi - 1
+        denom = xs[hi] - xs[lo]
+        dx = self.wave - xs[lo]
+        below = self.wave < xs[0]
+        above = self.wave > xs[-1]
+
+        return order, lo, hi, denom, dx, below, above
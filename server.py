@@ -0,0 +1,564 @@
+# Throughput server keeping a loaded budget in memory
+#
+# Scripts and exposure time calculators that ask for a few paths pay for
+# importing everything and loading the whole prescription every time.
+# The server loads a CalcThroughput once and answers queries over HTTP
+# (TCP or a unix socket) in milliseconds. Written with asyncio and the
+# standard library only:
+#   GET  /health                          -> status, sections, reloads
+#   GET  /sections                        -> section keys
+#   GET  /wave                            -> output wavelength grid
+#   GET  /section?key=FEI ATC             -> transmission of one section
+#   GET  /path?sections=AO,FEI COMMON     -> throughput of one path
+#   POST /paths    {"configs": {...}}     -> (paths x wavelength), see run_many
+#   POST /bands    {"configs": {...}, "bands": {"yJ": [980, 1327]}}
+#                                         -> band mean, min, max, percentiles
+# Arrays come back as .npy bytes (application/x-npy, np.load reads them)
+# or as JSON with format=json. Parameters can be given in the query
+# string or as a JSON body. Path names of /paths are in the X-Names header
+#
+# The spreadsheet and the datafiles it uses are checked for changes
+# every watch_interval seconds. A new spreadsheet goes through
+# update_from_excel and changed datafiles through update_datafiles, so
+# only the rows that changed are reloaded. Reloads are made on a copy of
+# the budget while queries carry on, and the copy is swapped in only if
+# it loaded; a spreadsheet saved half way is logged and the previous
+# version is served until the inputs change again. Queries run in worker
+# threads and share a readers/writer lock, so any number are answered at
+# once; the swap waits for running queries and holds off new ones
+#
+# Bad parameters (unknown sections or bands, unparseable percentiles)
+# are answered with 400, anything else going wrong with 500
+#
+# example:
+#   python server.py ../HISPEC_allsubs.xlsx --data-path ./inputs/ --port 8765
+#   from server import query
+#   t = query(('127.0.0.1', 8765), '/path', sections=['TELESCOPE', 'AO', 'FEI COMMON', 'FEI ATC'])
+import argparse
+import asyncio
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import socket
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+
+from cThroughput import CalcThroughput, NO_FILE_TYPES, datafile_path, yJ, HK
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+NPY = 'application/x-npy'
+BANDS = {'yJ': yJ, 'HK': HK} # bands /bands uses by default and knows by name
+
+logger = logging.getLogger(__name__)
+
+
+class HttpError(Exception):
+    """error answered with an HTTP status and a JSON message"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _ReadWriteLock():
+    """
+    asyncio lock held by any number of readers or by one writer. A waiting
+    writer keeps new readers out so reloads are not starved by queries
+
+    """
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writing and self._writers_waiting == 0)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self._condition:
+            self._writers_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writing and self._readers == 0)
+            finally:
+                self._writers_waiting -= 1
+                self._condition.notify_all() # readers wait while a writer does
+            self._writing = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class ThroughputServer():
+    """
+    Answers path, section and band queries from a loaded CalcThroughput
+    and reloads it when its inputs change
+
+    """
+    def __init__(self, ct, watch_interval=1.0):
+        """
+        inputs
+        ------
+        ct - CalcThroughput
+            budget to serve, every section is loaded up front
+        watch_interval - float [s] (default: 1.0)
+            how often the spreadsheet and datafiles are checked for
+            changes, None to never reload
+        """
+        self.ct = ct
+        self.watch_interval = watch_interval
+        self.reloads = 0
+        self._lock = None # made in the running loop, shared by queries, held alone by reloads
+        self.ct.load()
+        self._prepare(self.ct)
+        self._stamps = self._inputStamps(self.ct)
+        self._routes = {'/health'  : self._health,
+                        '/sections': self._sections,
+                        '/wave'    : self._wave,
+                        '/section' : self._section,
+                        '/path'    : self._path,
+                        '/paths'   : self._paths,
+                        '/bands'   : self._bands}
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_socket=None):
+        """
+        accept connections until cancelled
+
+        inputs
+        ------
+        host - str (default: '127.0.0.1')
+            address to listen on
+        port - int (default: 8765)
+            port to listen on
+        unix_socket - str (default: None)
+            path of a unix socket to listen on instead of host and port
+        """
+        self._lock = _ReadWriteLock()
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self._connection, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self._connection, host, port)
+
+        watcher = asyncio.ensure_future(self._watch()) if self.watch_interval else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    def reload(self):
+        """
+        reload whatever changed on disk since the last check. If loading
+        fails the error is raised and the budget is left as it was
+
+        outputs
+        -------
+        changed - list
+            section keys that were recomputed
+        """
+        staged = self._stage()
+        if staged is None:
+            return []
+        self._apply(*staged)
+
+        return staged[2]
+
+    def _stage(self):
+        """
+        load whatever changed on disk since the last check into a copy of
+        the budget, leaving the one being served untouched
+
+        outputs
+        -------
+        staged - tuple
+            (ct, stamps, changed) to pass to _apply, None if nothing changed
+        """
+        stamps = self._inputStamps(self.ct)
+        if stamps == self._stamps:
+            return None
+
+        ct = self.ct.copy()
+        changed = set()
+        excel = ct.data_path + ct.excel_file
+        if stamps.get(excel) != self._stamps.get(excel):
+            changed.update(ct.update_from_excel(ct.excel_file))
+            ct.load()
+            stamps = self._inputStamps(ct) # the new spreadsheet may use other files
+            # rows the spreadsheet did not change keep their old curves, so
+            # datafiles saved since the last check are reloaded too
+            paths = [path for path in stamps if path != excel and path in self._stamps
+                     and stamps[path] != self._stamps[path]]
+        else:
+            paths = [path for path in stamps if path != excel and stamps[path] != self._stamps.get(path)]
+        if paths:
+            changed.update(ct.update_datafiles(paths))
+        self._prepare(ct)
+
+        return ct, stamps, sorted(changed)
+
+    def _apply(self, ct, stamps, changed):
+        """serve the budget made by _stage"""
+        self.ct = ct
+        self._stamps = stamps
+        if changed:
+            self.reloads += 1
+
+    def _prepare(self, ct):
+        """make the section logs run_many reads before ct is served, so
+        concurrent queries only read them"""
+        ct._sectionLogs(list(ct.transmission_dic.keys()))
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        failed = None # inputs that last failed to load, not retried until they change
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            # checking and loading the inputs does not touch the budget
+            # being served, so queries carry on meanwhile
+            stamps = await loop.run_in_executor(None, self._inputStamps, self.ct)
+            if stamps == self._stamps or stamps == failed:
+                continue
+            try:
+                staged = await loop.run_in_executor(None, self._stage)
+            except Exception:
+                # e.g. a spreadsheet saved half way
+                logger.exception('reloading %s failed, still serving the previous version',
+                                 self.ct.excel_file)
+                failed = stamps
+                continue
+            if staged is not None:
+                async with self._lock.write():
+                    self._apply(*staged)
+                logger.info('reloaded %s, changed sections %s', self.ct.excel_file, staged[2])
+
+    def _inputStamps(self, ct):
+        """(size, mtime) of the spreadsheet of ct and of every datafile it uses"""
+        includes, types, values, filenames, elements = ct.prescription
+        paths = [ct.data_path + ct.excel_file]
+        paths += [datafile_path(ct.data_path, filenames[i]) for i in range(len(includes))
+                  if includes[i] == 1 and types[i] not in NO_FILE_TYPES]
+
+        stamps = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                stamps[path] = None
+
+        return stamps
+
+    async def _connection(self, reader, writer):
+        """answer requests on one connection until the client closes it"""
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, content_type, payload, extra = await self._answer(method, target, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(_response(status, content_type, payload, extra, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, method, target, headers, body):
+        """(status, content type, payload bytes, extra headers) for one request"""
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path not in self._routes:
+                raise HttpError(404, 'no endpoint %s, try one of %s' % (url.path, list(self._routes)))
+            if method not in ('GET', 'POST'):
+                raise HttpError(405, 'only GET and POST are supported')
+            if body:
+                try:
+                    params.update(json.loads(body))
+                except ValueError as e:
+                    raise HttpError(400, 'body is not JSON: %s' % e)
+
+            # queries only read the budget
+            async with self._lock.read():
+                result, extra = await asyncio.get_running_loop().run_in_executor(
+                    None, self._routes[url.path], params)
+        except HttpError as e:
+            return e.status, 'application/json', json.dumps({'error': str(e)}).encode(), {}
+        except Exception as e:
+            return 500, 'application/json', json.dumps({'error': repr(e)}).encode(), {}
+
+        binary = params.get('format', 'npy' if NPY in headers.get('accept', NPY) else 'json') == 'npy'
+        if isinstance(result, np.ndarray) and binary:
+            f = io.BytesIO()
+            np.lib.format.write_array(f, result, allow_pickle=False)
+            return 200, NPY, f.getvalue(), extra
+
+        return 200, 'application/json', json.dumps(_jsonable(result)).encode(), extra
+
+    def _health(self, params):
+        return {'status'    : 'ok',
+                'excel_file': self.ct.excel_file,
+                'sections'  : len(self.ct.transmission_dic),
+                'reloads'   : self.reloads}, {}
+
+    def _sections(self, params):
+        return list(self.ct.transmission_dic.keys()), {}
+
+    def _wave(self, params):
+        return np.asarray(self.ct.output_wave, dtype=float), {}
+
+    def _section(self, params):
+        key = params.get('key')
+        self._checkKeys([key])
+        return self.ct.to_output(np.asarray(self.ct.transmission_dic[key], dtype=float)), {}
+
+    def _path(self, params):
+        keys = _key_list(params.get('sections'))
+        self._checkKeys(keys)
+        # same product as ct.run, without changing its last run
+        return self.ct.to_output(self.ct._combineTransmission(self.ct.wave, self.ct.transmission_dic, keys)), {}
+
+    def _paths(self, params):
+        configs = self._configs(params)
+        return self.ct.run_many(configs), {'X-Names': json.dumps(list(configs))}
+
+    def _bands(self, params):
+        configs = self._configs(params)
+        bands = _band_dict(params.get('bands'))
+        percentiles = _percentile_list(params.get('percentiles', (5, 50, 95)))
+        try:
+            band_summary = self.ct._bandSummary(bands)
+        except ValueError as e:
+            raise HttpError(400, str(e)) # e.g. a band with no points on the grid
+
+        names = list(configs)
+        return band_summary.summarize(self.ct._runMany(configs), names, percentiles), {}
+
+    def _configs(self, params):
+        """path name -> section keys from the 'configs' parameter, or one path from 'sections'"""
+        configs = params.get('configs')
+        if configs is None and 'sections' in params:
+            configs = {'path': _key_list(params['sections'])}
+        if not isinstance(configs, dict) or len(configs) == 0:
+            raise HttpError(400, "give 'configs' (path name -> list of section keys) or 'sections'")
+        configs = {name: _key_list(keys) for name, keys in configs.items()}
+        self._checkKeys([key for keys in configs.values() for key in keys])
+
+        return configs
+
+    def _checkKeys(self, keys):
+        missing = [key for key in keys if key not in self.ct.transmission_dic]
+        if missing or len(keys) == 0:
+            raise HttpError(400, 'unknown sections %s, see /sections' % missing)
+
+
+async def _read_request(reader):
+    """(method, target, headers, body) of the next request, None at end of connection"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise ConnectionError('bad request line %r' % line)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    n = int(headers.get('content-length', 0))
+    body = await reader.readexactly(n) if n else b''
+
+    return method.upper(), target, headers, body
+
+
+def _response(status, content_type, payload, extra, keep_alive):
+    head = ['HTTP/1.1 %d %s' % (status, REASONS.get(status, '')),
+            'Content-Type: %s' % content_type,
+            'Content-Length: %d' % len(payload),
+            'Connection: %s' % ('keep-alive' if keep_alive else 'close')]
+    head += ['%s: %s' % item for item in extra.items()]
+
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload
+
+
+def _key_list(keys):
+    """section keys from a list or a comma separated string"""
+    if keys is None:
+        return []
+    if isinstance(keys, str):
+        return [key.strip() for key in keys.split(',') if key.strip()]
+    if not isinstance(keys, (list, tuple)) or not all(isinstance(key, str) for key in keys):
+        raise HttpError(400, 'sections should be a list of section keys or a comma separated string')
+
+    return list(keys)
+
+
+def _band_dict(bands):
+    """band name -> [start, end] from a dict, or from name:start:end or
+    known band names (see BANDS) separated by commas"""
+    if not bands:
+        return dict(BANDS)
+    if isinstance(bands, str):
+        names, bands = bands, {}
+        for band in names.split(','):
+            name, *edges = band.strip().split(':')
+            if not edges and name not in BANDS:
+                raise HttpError(400, 'unknown band %s, give name:start:end or one of %s' % (name, list(BANDS)))
+            bands[name] = edges or BANDS[name]
+    if not isinstance(bands, dict):
+        raise HttpError(400, "bands should be {name: [start, end]} or 'name:start:end,...'")
+
+    try:
+        bands = {name: [float(v) for v in edges] for name, edges in bands.items()}
+    except (TypeError, ValueError):
+        bands = None
+    if bands is None or any(len(edges) != 2 for edges in bands.values()):
+        raise HttpError(400, 'every band needs a start and an end in nm')
+
+    return bands
+
+
+def _percentile_list(percentiles):
+    """percentiles from a list or a comma separated string, each 0 to 100"""
+    if isinstance(percentiles, str):
+        percentiles = percentiles.split(',')
+    try:
+        percentiles = [float(p) for p in percentiles]
+    except (TypeError, ValueError):
+        raise HttpError(400, 'percentiles should be numbers from 0 to 100')
+    if not all(0 <= p <= 100 for p in percentiles):
+        raise HttpError(400, 'percentiles should be numbers from 0 to 100')
+
+    return percentiles
+
+
+def _jsonable(x):
+    if isinstance(x, dict):
+        return {k: _jsonable(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_jsonable(v) for v in x]
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    if isinstance(x, np.generic):
+        return x.item()
+
+    return x
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def connect(address, timeout=60):
+    """
+    connection to a running server, reuse it for many queries
+
+    inputs
+    ------
+    address - tuple or str
+        (host, port), or the path of a unix socket
+    timeout - float [s] (default: 60)
+
+    outputs
+    -------
+    connection - http.client.HTTPConnection
+    """
+    if isinstance(address, str):
+        return _UnixConnection(address, timeout=timeout)
+
+    return http.client.HTTPConnection(*address, timeout=timeout)
+
+
+def query(address, endpoint, connection=None, **params):
+    """
+    ask a running server for something
+
+    inputs
+    ------
+    address - tuple or str
+        (host, port), or the path of a unix socket
+    endpoint - str
+        e.g. '/path', '/paths', '/bands', see the top of this file
+    connection - HTTPConnection (default: None)
+        open connection from connect to reuse, else one is made for this query
+    params
+        parameters of the endpoint, e.g. sections=[...] or configs={...}
+
+    outputs
+    -------
+    result - array, tuple or dict
+        the array for /wave, /section and /path, (path names, array)
+        for /paths, else the decoded JSON
+    """
+    conn = connection or connect(address)
+    try:
+        body = json.dumps(params).encode()
+        conn.request('POST', endpoint, body=body, headers={'Content-Type': 'application/json', 'Accept': NPY})
+        response = conn.getresponse()
+        payload = response.read()
+    finally:
+        if connection is None:
+            conn.close()
+
+    if response.status != 200:
+        raise RuntimeError('%s %s: %s' % (response.status, response.reason, json.loads(payload)['error']))
+    if response.getheader('Content-Type') == NPY:
+        t = np.lib.format.read_array(io.BytesIO(payload), allow_pickle=False)
+        names = response.getheader('X-Names')
+        return (json.loads(names), t) if names is not None else t
+
+    return json.loads(payload)
+
+
+if __name__=='__main__':
+	parser = argparse.ArgumentParser(description='serve throughput queries from a loaded budget')
+	parser.add_argument('excel_file', help='spreadsheet, relative to data_path')
+	parser.add_argument('--data-path', default='./inputs/', help='folder with the datafiles')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--unix-socket', help='listen on this unix socket instead of host and port')
+	parser.add_argument('--wave', type=float, nargs=3, default=(800, 2550, 0.05), help='start stop step [nm]')
+	parser.add_argument('--adaptive-tol', type=float, help='see CalcThroughput')
+	parser.add_argument('--cache-dir', help='see CalcThroughput')
+	parser.add_argument('--watch-interval', type=float, default=1.0, help='seconds between checks for changed inputs, 0 to never reload')
+	args = parser.parse_args()
+
+	ct = CalcThroughput(np.arange(*args.wave), args.excel_file, data_path=args.data_path,
+	                    adaptive_tol=args.adaptive_tol, cache_dir=args.cache_dir)
+	logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+	server = ThroughputServer(ct, watch_interval=args.watch_interval or None)
+	logger.info('serving %s on %s', args.excel_file, args.unix_socket or '%s:%s' % (args.host, args.port))
+	asyncio.run(server.serve(args.host, args.port, args.unix_socket))
@@ -0,0 +1,262 @@
+# Throughput as a spectrograph sees it
+#
+# run and run_many give throughput on the fine, uniform computation
+# grid. SpectralOutput turns (..., wavelength) arrays of any number of
+# paths or sweep samples into what a spectrograph measures:
+# - Convolver : smooths to a resolving power R, a number, an array on the
+#               grid or a function of wavelength. The Gaussian line spread
+#               function (FWHM = wavelength / R) is held constant over
+#               segments where its width changes by less than tol, and
+#               each segment is convolved with an FFT and added into the
+#               result (overlap-add). Dividing by the same convolution of
+#               ones keeps the ends of the grid from being darkened
+# - Rebinner  : averages onto pixels, given by their central wavelengths
+#               or their edges, e.g. a (orders x pixels) wavelength map.
+#               The weights are the overlap of each grid sample with each
+#               pixel, kept as one sparse matrix (flat indices, weights and
+#               pixel offsets) that is built once and applied to any
+#               number of paths with np.add.reduceat
+#
+# example:
+#   out = ct.spectral_output(resolution=100000, pixel_wave=order_map)
+#   pixels = out(ct.run_many(configs))  # (paths, orders, pixels)
+import numpy as np
+
+FWHM_TO_SIGMA = 1 / (2 * np.sqrt(2 * np.log(2)))
+
+
+class Convolver():
+    """
+    Convolves curves on a uniform grid with a Gaussian line spread function
+    of resolving power R, which may change with wavelength
+
+    """
+    def __init__(self, wave, resolution, tol=0.01, n_sigma=5):
+        """
+        inputs
+        ------
+        wave - array [nm]
+            uniform grid the curves are sampled on
+        resolution - float, array or function
+            resolving power lambda / FWHM, a constant, an array on wave or
+            a function of wavelength in nm
+        tol - float (default: 0.01)
+            largest fractional change of the line spread function width
+            within one segment
+        n_sigma - float (default: 5)
+            the kernel is cut off this many sigma from its center
+        """
+        self.wave = np.asarray(wave, dtype=float)
+        step = np.diff(self.wave)
+        if len(self.wave) < 2 or not np.allclose(step, step[0], rtol=1e-6, atol=0):
+            raise ValueError('Convolver needs a uniform wavelength grid, e.g. ct.output_wave')
+        self.step = step[0]
+
+        R = resolution(self.wave) if callable(resolution) else resolution
+        R = np.broadcast_to(np.asarray(R, dtype=float), self.wave.shape)
+        if np.any(~np.isfinite(R)) or np.any(R <= 0):
+            raise ValueError('resolution must be positive')
+        sigma = self.wave / R * FWHM_TO_SIGMA / self.step # in samples
+
+        # segments where the width changes by less than tol
+        self.segments = []
+        i0 = 0
+        while i0 < len(self.wave):
+            i1 = self._segmentEnd(sigma, i0, tol)
+            self.segments.append(self._segment(i0, i1, np.mean(sigma[i0:i1]), n_sigma))
+            i0 = i1
+
+        # response to a flat curve, to undo the loss off the ends of the grid
+        self._norm = self._convolve(np.ones((1, len(self.wave))))[0]
+
+    def __call__(self, t):
+        """
+        inputs
+        ------
+        t - array
+            (..., wavelength) curves on wave
+
+        outputs
+        -------
+        t_conv - array
+            (..., wavelength) convolved curves
+        """
+        t = np.asarray(t, dtype=float)
+        shape = t.shape
+        out = self._convolve(t.reshape(-1, shape[-1])) / self._norm
+
+        return out.reshape(shape)
+
+    def _segmentEnd(self, sigma, i0, tol, chunk=4096):
+        """end of the segment starting at i0, looking chunk samples ahead at a time"""
+        lo = hi = sigma[i0]
+        for j0 in range(i0, len(sigma), chunk):
+            s = sigma[j0:j0 + chunk]
+            lo_run = np.minimum.accumulate(np.minimum(s, lo))
+            hi_run = np.maximum.accumulate(np.maximum(s, hi))
+            wide = np.nonzero(hi_run > (1 + tol) * lo_run)[0]
+            if len(wide):
+                return max(j0 + wide[0], i0 + 1)
+            lo, hi = lo_run[-1], hi_run[-1]
+
+        return len(sigma)
+
+    def _segment(self, i0, i1, sigma, n_sigma):
+        """(i0, i1, half width, nfft, kernel FFT) for grid samples i0:i1"""
+        half = int(np.ceil(n_sigma * sigma))
+        x = np.arange(-half, half + 1)
+        kernel = np.exp(-0.5 * (x / max(sigma, 1e-12))**2)
+        kernel /= kernel.sum()
+        nfft = _fast_size(i1 - i0 + 2 * half)
+
+        return i0, i1, half, nfft, np.fft.rfft(kernel, nfft)
+
+    def _convolve(self, t):
+        """overlap-add of every segment, t is (curves x wavelength)"""
+        n = t.shape[-1]
+        out = np.zeros_like(t)
+        for i0, i1, half, nfft, K in self.segments:
+            y = np.fft.irfft(np.fft.rfft(t[:, i0:i1], nfft, axis=-1) * K, nfft, axis=-1)
+            # y[m] lands on grid sample i0 - half + m
+            o0, o1 = max(0, i0 - half), min(n, i1 + half)
+            out[:, o0:o1] += y[:, o0 - (i0 - half):o1 - (i0 - half)]
+
+        return out
+
+
+class Rebinner():
+    """
+    Averages curves on a grid onto pixels with a sparse overlap matrix
+    built once
+
+    """
+    def __init__(self, wave, pixel_wave, edges=False):
+        """
+        inputs
+        ------
+        wave - array [nm]
+            increasing grid the curves are sampled on, each sample covers
+            the wavelengths half way to its neighbours
+        pixel_wave - array [nm]
+            (..., pixels) increasing central wavelength of each pixel along
+            the last axis, e.g. (orders x pixels). Pixel edges are half way
+            between centers
+        edges - bool (default: False)
+            pixel_wave are the (..., pixels + 1) pixel edges instead
+        """
+        self.wave = np.asarray(wave, dtype=float)
+        pixel_wave = np.asarray(pixel_wave, dtype=float)
+        if pixel_wave.ndim == 0 or pixel_wave.shape[-1] < 2:
+            raise ValueError('need at least two pixel wavelengths (or edges) along the last axis')
+        pixel_edges = pixel_wave if edges else _edges(pixel_wave)
+        self.shape = pixel_edges.shape[:-1] + (pixel_edges.shape[-1] - 1,)
+
+        p0 = pixel_edges[..., :-1].ravel()
+        p1 = pixel_edges[..., 1:].ravel()
+        if np.any(p1 <= p0):
+            raise ValueError('pixel wavelengths must increase along the last axis')
+        cells = _edges(self.wave)
+
+        # grid samples overlapping each pixel, as one flat list of ranges
+        a = np.clip(np.searchsorted(cells, p0, side='right') - 1, 0, len(self.wave) - 1)
+        b = np.clip(np.searchsorted(cells, p1, side='left'), a + 1, len(self.wave))
+        lengths = b - a
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        self.index = np.repeat(a - self.offsets, lengths) + np.arange(lengths.sum())
+
+        pixel = np.repeat(np.arange(len(p0)), lengths)
+        overlap = np.clip(np.minimum(p1[pixel], cells[self.index + 1]) -
+                          np.maximum(p0[pixel], cells[self.index]), 0, None)
+        covered = np.add.reduceat(overlap, self.offsets)
+        # pixels off the grid have nothing to average
+        self.valid = covered > 0
+        self.weights = overlap / np.where(self.valid, covered, 1)[pixel]
+
+    def __call__(self, t):
+        """
+        inputs
+        ------
+        t - array
+            (..., wavelength) curves on wave
+
+        outputs
+        -------
+        t_pixels - array
+            (..., pixel map shape) average of each curve over each pixel,
+            nan for pixels off the grid
+        """
+        t = np.asarray(t, dtype=float)
+        out = np.add.reduceat(t[..., self.index] * self.weights, self.offsets, axis=-1)
+        out[..., ~self.valid] = np.nan
+
+        return out.reshape(t.shape[:-1] + self.shape)
+
+    def to_scipy(self):
+        """the rebinning matrix as a scipy.sparse (pixels x wavelength) csr_matrix"""
+        from scipy import sparse # only needed for this
+
+        indptr = np.concatenate((self.offsets, [len(self.index)]))
+        weights = np.where(np.repeat(self.valid, np.diff(indptr)), self.weights, 0)
+        return sparse.csr_matrix((weights, self.index, indptr), shape=(len(self.offsets), len(self.wave)))
+
+
+class SpectralOutput():
+    """
+    Resolution convolution followed by pixel binning, either can be left out
+
+    """
+    def __init__(self, wave, resolution=None, pixel_wave=None, edges=False, tol=0.01, n_sigma=5):
+        """
+        inputs
+        ------
+        wave - array [nm]
+            uniform grid the curves are sampled on
+        resolution - float, array or function (default: None)
+            resolving power, see Convolver. None to not convolve
+        pixel_wave - array [nm] (default: None)
+            pixel central wavelengths (or edges), see Rebinner. None to stay on wave
+        edges - bool (default: False)
+            pixel_wave are pixel edges
+        tol, n_sigma - float
+            see Convolver
+        """
+        self.wave = np.asarray(wave, dtype=float)
+        self.convolver = Convolver(self.wave, resolution, tol=tol, n_sigma=n_sigma) \
+                         if resolution is not None else None
+        self.rebinner = Rebinner(self.wave, pixel_wave, edges=edges) if pixel_wave is not None else None
+
+    def __call__(self, t):
+        """(..., wavelength) curves on wave -> (..., wavelength or pixel map shape)"""
+        if self.convolver is not None:
+            t = self.convolver(t)
+        if self.rebinner is not None:
+            t = self.rebinner(t)
+
+        return t
+
+
+def _edges(centers):
+    """edges half way between centers along the last axis, extended by half a step at the ends"""
+    centers = np.asarray(centers, dtype=float)
+    mid = 0.5 * (centers[..., 1:] + centers[..., :-1])
+    first = centers[..., :1] - (mid[..., :1] - centers[..., :1])
+    last = centers[..., -1:] + (centers[..., -1:] - mid[..., -1:])
+
+    return np.concatenate((first, mid, last), axis=-1)
+
+
+def _fast_size(n):
+    """smallest 2^a 3^b 5^c at least n, which numpy's FFT is fast for"""
+    best = 2 ** int(np.ceil(np.log2(n)))
+    f5 = 1
+    while f5 < best:
+        f35 = f5
+        while f35 < best:
+            f = f35
+            while f < n:
+                f *= 2
+            best = min(best, f)
+            f35 *= 3
+        f5 *= 5
+
+    return best
@@ -0,0 +1,329 @@
+# Parameter sweeps over a loaded prescription
+#
+# Each axis of a sweep (fiber length, HO WFE, telescope coating age,
+# a dichroic variant, ...) replaces the transmission of some rows of the
+# prescription for each of its values. Every replacement curve is made
+# once per value, and in log space each path of each combination is
+#     path without the swept rows + sum over axes of that axis' rows
+# so the whole Cartesian product is a broadcast sum of small arrays.
+# Sections no axis touches are never recomputed. Blocks of combinations
+# are evaluated in a pool and the result is a single cube of shape
+# (axis 1 values, ..., axis n values, paths, wavelength)
+#
+# example:
+#   axes = [fiber_length(ct, [10, 40, 76]), ho_wfe(ct, [120, 180, 230]),
+#           telescope_age(ct, [1, 2, 3])]
+#   cube = run_sweep(ct, configs, axes, workers=4, save_file='sweep.npz')
+import functools
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cThroughput import calc_strehl
+from logspace import to_log, from_log
+from throughput_output import open_writer, read_output
+
+AGES = {1: 'one', 2: 'two', 3: 'three'}
+
+
+class SweepAxis():
+    """
+    One parameter of a sweep, the prescription rows it changes and how
+
+    """
+    def __init__(self, name, values, rows, curve):
+        """
+        inputs
+        ------
+        name - str
+            axis name, e.g. 'fiber_length'
+        values - list
+            values to sweep over, JSON serializable so they can be saved
+        rows - list
+            (section, row number) of every included row the axis replaces
+        curve - function
+            curve(value, row) -> transmission of row for value, on ct.wave
+            or a constant
+        """
+        self.name   = name
+        self.values = list(values)
+        self.rows   = list(rows)
+        self.curve  = curve
+
+    def __repr__(self):
+        return 'SweepAxis(%s, %s values, %s rows)' % (self.name, len(self.values), len(self.rows))
+
+
+def fiber_length(ct, lengths, sections=('FIBER TRANSMISSION BLUE', 'FIBER TRANSMISSION RED')):
+    """
+    sweep the length of the fibers, the 'Value' of their 'Internal Transmission'
+    or 'Fiber Length Scaled' rows
+
+    inputs
+    ------
+    ct - CalcThroughput
+        loaded prescription
+    lengths - list [m]
+        fiber lengths
+    sections - list (default: both fiber transmission sections)
+        sections whose fiber rows take the length
+
+    outputs
+    -------
+    axis - SweepAxis
+    """
+    includes, types, values, filenames, elements = ct.prescription
+    rows = _rows(ct, sections, lambda i: types[i] in ('Internal Transmission', 'Fiber Length Scaled'))
+
+    def curve(length, i):
+        return ct._setInput(ct.wave, types[i], length, filenames[i], ct.data_path)
+
+    return SweepAxis('fiber_length', lengths, rows, curve)
+
+
+def ho_wfe(ct, wfes, sections=None):
+    """
+    sweep the high order wavefront error of the Strehl rows (Type 'Strehl',
+    or a Strehl datafile), using calc_strehl
+
+    inputs
+    ------
+    ct - CalcThroughput
+        loaded prescription
+    wfes - list [nm]
+        RMS wavefront errors
+    sections - list (default: None)
+        sections to change, None for every section with a Strehl row
+
+    outputs
+    -------
+    axis - SweepAxis
+    """
+    includes, types, values, filenames, elements = ct.prescription
+    rows = _rows(ct, sections, lambda i: types[i] == 'Strehl' or 'strehl' in str(elements[i]).lower())
+
+    def curve(wfe, i):
+        return calc_strehl(wfe, ct.wave)
+
+    return SweepAxis('ho_wfe', wfes, rows, curve)
+
+
+def telescope_age(ct, years, sections=('TELESCOPE',)):
+    """
+    sweep the age of the Keck mirror coatings, swapping between the
+    Keck_refl_data_{one,two,three}_year.csv curves
+
+    inputs
+    ------
+    ct - CalcThroughput
+        loaded prescription
+    years - list
+        coating ages, 1, 2 or 3
+    sections - list (default: ('TELESCOPE',))
+        sections whose Keck_refl_data rows take the age
+
+    outputs
+    -------
+    axis - SweepAxis
+    """
+    includes, types, values, filenames, elements = ct.prescription
+    rows = _rows(ct, sections, lambda i: 'Keck_refl_data_' in str(filenames[i]))
+    for year in years:
+        if year not in AGES:
+            raise ValueError('telescope age must be one of %s, not %s' % (list(AGES), year))
+
+    def curve(year, i):
+        folder = filenames[i].replace('/', '\\').rsplit('\\', 1)[0]
+        return ct._setInput(ct.wave, types[i], values[i],
+                            folder + '\\Keck_refl_data_%s_year.csv' % AGES[year], ct.data_path)
+
+    return SweepAxis('telescope_age', years, rows, curve)
+
+
+def element_variant(ct, section, element, datafiles, name=None):
+    """
+    sweep between datafiles for one element, e.g. dichroic designs
+
+    inputs
+    ------
+    ct - CalcThroughput
+        loaded prescription
+    section - str
+        section the element is in e.g. 'FEI ATC'
+    element - str or int
+        name in the 'Element' column or row number, see update_element
+    datafiles - list
+        datafiles relative to data_path, the element keeps its Type and Value
+    name - str (default: None)
+        axis name, defaults to the element name
+
+    outputs
+    -------
+    axis - SweepAxis
+    """
+    includes, types, values, filenames, elements = ct.prescription
+    row = ct._findRow(section, element)
+    ct.load([section])
+    if row not in ct.store:
+        raise ValueError('element %s of section %s is not included' % (element, section))
+
+    def curve(datafile, i):
+        return ct._setInput(ct.wave, types[i], values[i], datafile, ct.data_path)
+
+    return SweepAxis(name or str(elements[row]), datafiles, [(section, row)], curve)
+
+
+def run_sweep(ct, configs, axes, workers=None, pool='process', max_bytes=250e6,
+              save_file=None, dtype=float):
+    """
+    evaluate every path over the Cartesian product of the axes
+
+    inputs
+    ------
+    ct - CalcThroughput
+        loaded prescription, left unchanged
+    configs - dict
+        path name -> list of section keys, as for run_many
+    axes - list
+        SweepAxis for each parameter, no two may change the same row
+    workers - int (default: None)
+        number of workers evaluating blocks of combinations, None for no pool
+    pool - str (default: 'process')
+        'process' or 'thread'
+    max_bytes - float (default: 250e6)
+        rough size of each block of combinations
+    save_file - str (default: None)
+        file to write the cube to (.npz, .h5 or .txt, see throughput_output.py)
+    dtype - type (default: float)
+        type of the saved cube
+
+    outputs
+    -------
+    sweep - dictionary
+        'axes' (name, values) of each axis, 'names' of the paths, 'wave'
+        (ct.output_wave) and 'throughput', an array of shape
+        (len(values) of each axis, ..., paths, wavelength)
+    """
+    names = list(configs)
+    keys = list(dict.fromkeys(key for name in names for key in configs[name]))
+    ct.load(keys)
+
+    owner = {}
+    for a, axis in enumerate(axes):
+        for section, i in axis.rows:
+            if i in owner:
+                raise ValueError('row %s is changed by both %s and %s' % (i, axes[owner[i]].name, axis.name))
+            owner[i] = a
+
+    # paths without any swept row, once
+    swept = {key: [i for i in ct.store.sections.get(key, []) if i in owner] for key in keys}
+    fixed = {key: ct.store.section_logs(key, exclude=swept[key]) for key in keys}
+    counts = np.array([[configs[name].count(key) for key in keys] for name in names], dtype=float)
+    base = [counts @ np.vstack([fixed[key][k] for key in keys]) for k in range(3)]
+
+    # and what each value of each axis adds to every path
+    contributions = []
+    for axis in axes:
+        c = np.zeros((3, len(axis.values), len(names), len(ct.wave)))
+        for v, value in enumerate(axis.values):
+            for section, i in axis.rows:
+                if section not in keys:
+                    continue
+                parts = to_log(axis.curve(value, i))
+                n = counts[:, keys.index(section)][:, None]
+                for k in range(3):
+                    c[k, v] += n * parts[k]
+        contributions.append(c)
+
+    shape = tuple(len(axis.values) for axis in axes)
+    combos = np.array(list(itertools.product(*[range(n) for n in shape])), dtype=int).reshape(-1, len(axes))
+    block = int(max(1, max_bytes // (4 * 8 * len(names) * len(ct.wave))))
+    blocks = [combos[j:j+block] for j in range(0, len(combos), block)]
+
+    if workers is not None and workers > 1 and pool == 'process':
+        # the arrays are sent to each worker process once, not with every block
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(base, contributions)) as ex:
+            results = list(ex.map(_worker_block, blocks))
+    else:
+        # threads get this sweep's arrays with the function, so sweeps running
+        # at the same time do not see each other's
+        sweep_block = functools.partial(_sweep_block, base, contributions)
+        if workers is not None and workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                results = list(ex.map(sweep_block, blocks))
+        else:
+            results = [sweep_block(b) for b in blocks]
+
+    cube = ct.to_output(np.concatenate(results, axis=0)).reshape(shape + (len(names), -1))
+    sweep = {'axes'      : [(axis.name, axis.values) for axis in axes],
+             'names'     : names,
+             'wave'      : ct.output_wave,
+             'throughput': cube}
+
+    if save_file is not None:
+        save_sweep(ct, sweep, configs, save_file, dtype=dtype)
+
+    return sweep
+
+
+def save_sweep(ct, sweep, configs, file_name, dtype=float):
+    """write a run_sweep result to one file, one row per (combination, path)"""
+    metadata = dict(ct.output_metadata(), sweep={'axes': sweep['axes'], 'paths': sweep['names']})
+    cube = sweep['throughput']
+    shape = cube.shape[:-2]
+    with open_writer(file_name, sweep['wave'], metadata=metadata, dtype=dtype) as w:
+        for idx in np.ndindex(*shape):
+            label = ','.join('%s=%s' % (name, values[j]) for (name, values), j in zip(sweep['axes'], idx))
+            w.write(['%s|%s' % (path, label) for path in sweep['names']], cube[idx],
+                    sections=[configs[path] for path in sweep['names']])
+
+
+def load_sweep(file_name):
+    """read a cube written by save_sweep back into the run_sweep dictionary"""
+    results = read_output(file_name)
+    info = results['metadata']['sweep']
+    shape = tuple(len(values) for name, values in info['axes'])
+
+    return {'axes'      : [tuple(axis) for axis in info['axes']],
+            'names'     : info['paths'],
+            'wave'      : results['wave'],
+            'throughput': results['throughput'].reshape(shape + (len(info['paths']), -1))}
+
+
+def _rows(ct, sections, match):
+    """(section, row) of the included rows in sections (all if None) that match"""
+    sections = list(ct.transmission_dic) if sections is None else sections
+    ct.load(sections)
+    rows = [(key, i) for key in sections for i in ct.store.sections.get(key, []) if match(i)]
+    if len(rows) == 0:
+        raise ValueError('no included rows to sweep in %s' % list(sections))
+
+    return rows
+
+
+# arrays of the sweep a worker process was started for, only ever set in
+# the processes of one run_sweep's pool
+_base, _contributions = None, None
+
+
+def _init_worker(base, contributions):
+    global _base, _contributions
+    _base, _contributions = base, contributions
+
+
+def _worker_block(combos):
+    """_sweep_block in a pool process, with the arrays set by _init_worker"""
+    return _sweep_block(_base, _contributions, combos)
+
+
+def _sweep_block(base, contributions, combos):
+    """(combinations x paths x wavelength) throughput for rows of axis value indices"""
+    parts = []
+    for k in range(3):
+        p = np.repeat(base[k][None], len(combos), axis=0)
+        for a, c in enumerate(contributions):
+            p += c[k][combos[:, a]]
+        parts.append(p)
+
+    return from_log(*parts)
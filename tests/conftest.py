@@ -0,0 +1,66 @@
+# Shared fixtures: small synthetic prescriptions written to a temporary
+# folder, so the tests do not depend on the full inputs/ tree, and the
+# repo's own spreadsheets for the checks that need them
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from cThroughput import CalcThroughput
+
+COLUMNS = ['Include?', 'Type', 'Element', 'Value', 'Datafile']
+ROWS = [(False, 'Note', 'TEL', np.nan, np.nan),
+        (1, 'Coating', 'M1', np.nan, 'flat.csv'),
+        (1, 'Constant', 'Dust Factor', 0.97, np.nan),
+        (1, 'Coating', 'M2', np.nan, 'ramp.csv'),
+        (False, 'Note', 'FEI', np.nan, np.nan),
+        (1, 'Coating', 'Dichroic', np.nan, 'edge.csv'),
+        (0, 'Coating', 'Spare', np.nan, 'flat.csv'),
+        (1, 'Internal Transmission', 'Window', 5, 'glass.csv'),
+        (False, 'Note', 'SPEC', np.nan, np.nan),
+        (1, 'Coating', 'Grating', np.nan, 'ramp.csv'),
+        (1, 'Strehl', 'HO WFE', 120, np.nan)]
+CONFIGS = {'tel': ['TEL'],
+           'fei': ['TEL', 'FEI'],
+           'all': ['TEL', 'FEI', 'SPEC']}
+
+
+def write_sheet(file_name, rows=ROWS):
+    """write a prescription spreadsheet with the columns CalcThroughput reads"""
+    pd.DataFrame(rows, columns=COLUMNS).to_excel(file_name, index=False)
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    """folder with a few datafiles and the spreadsheet 'sheet.xlsx'"""
+    w = np.linspace(800, 2600, 91)
+    curves = {'flat.csv' : np.full_like(w, 0.95),
+              'ramp.csv' : 0.5 + 0.4 * (w - 800) / 1800,
+              'edge.csv' : np.where(w < 1400, 0.05, 0.9)}
+    for name, t in curves.items():
+        np.savetxt(tmp_path / name, np.vstack((w, t)).T, delimiter=',', header='wavelength,transmission')
+    # internal transmission measured at 10 mm
+    np.savetxt(tmp_path / 'glass.csv', np.vstack((w, 0.98 - 0.05 * (w - 800) / 1800, np.full_like(w, 10))).T,
+               delimiter=',', header='wavelength,transmission,thickness')
+    write_sheet(tmp_path / 'sheet.xlsx')
+
+    return str(tmp_path) + '/'
+
+
+@pytest.fixture
+def wave():
+    return np.arange(900, 2500, 1.0)
+
+
+@pytest.fixture
+def ct(wave, data_path):
+    return CalcThroughput(wave, 'sheet.xlsx', data_path=data_path)
+
+
+@pytest.fixture
+def repo_data_path():
+    return os.path.join(REPO, 'inputs') + '/'
@@ -0,0 +1,29 @@
+import numpy as np
+
+from adaptive_grid import adaptive_grid
+from cThroughput import CalcThroughput
+from conftest import CONFIGS
+
+
+def test_grid_is_fine_only_where_curves_change():
+    wave = np.arange(900, 2500, 0.5)
+    x = np.array([900, 1399.5, 1400.5, 2500])
+    idx = adaptive_grid(wave, [(x, np.array([0.1, 0.1, 0.9, 0.9]))], tol=1e-3)
+    nodes = wave[idx]
+
+    assert idx[0] == 0 and idx[-1] == len(wave) - 1 and np.all(np.diff(idx) > 0)
+    assert len(nodes) < len(wave) / 10
+    # the edge is resolved, the flat parts keep the starting spacing
+    assert np.min(np.abs(nodes - 1399.5)) == 0 and np.min(np.abs(nodes - 1400.5)) == 0
+    assert np.all(np.diff(nodes[(nodes > 1000) & (nodes < 1300)]) >= 20)
+
+
+def test_adaptive_results_are_within_tol(wave, data_path):
+    tol = 1e-3
+    uniform = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path)
+    adaptive = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, adaptive_tol=tol)
+
+    assert len(adaptive.wave) < len(wave)
+    assert np.array_equal(adaptive.output_wave, wave)
+    assert np.max(np.abs(adaptive.run_many(CONFIGS) - uniform.run_many(CONFIGS))) <= tol
+    assert np.max(np.abs(adaptive.run(CONFIGS['all']) - uniform.run(CONFIGS['all']))) <= tol
@@ -0,0 +1,26 @@
+import os
+import numpy as np
+
+from cThroughput import CalcThroughput, calc_strehl
+from conftest import write_sheet
+
+
+def test_strehl_rows_need_no_datafile(ct, wave):
+    assert np.allclose(ct.transmission_dic['SPEC'] / ct.store.curve(9), calc_strehl(120, wave))
+    ct.update_element('SPEC', 'HO WFE', value=200)
+    assert np.allclose(ct.store.curve(10), calc_strehl(200, wave))
+
+
+def test_fiber_length_scales_the_reference_curve(wave, data_path):
+    rows = [(False, 'Note', 'FIBER', np.nan, np.nan),
+            (1, 'Fiber Length Scaled', 'Fiber', 20, 'glass.csv'),
+            (False, 'Note', 'RAW', np.nan, np.nan),
+            (1, 'Fiber Length Scaled', 'Fiber', 130, 'ramp.csv')]
+    write_sheet(os.path.join(data_path, 'fiber.xlsx'), rows)
+    ct = CalcThroughput(wave, 'fiber.xlsx', data_path=data_path)
+    plain = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, lazy=False)
+
+    # glass.csv is measured at 10 (third column) and the window is 5 thick,
+    # ramp.csv has no third column so 65 m is the reference
+    assert np.allclose(ct.transmission_dic['FIBER'], plain.store.curve(7) ** 4)
+    assert np.allclose(ct.transmission_dic['RAW'], plain.store.curve(3) ** 2)
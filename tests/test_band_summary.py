@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from band_summary import BandSummary, concat_summaries
+from conftest import CONFIGS
+
+
+def test_band_mean_and_percentiles_on_a_non_uniform_grid():
+    wave = np.r_[np.arange(1000, 1100, 1.0), np.arange(1100, 1300, 4.0)]
+    t = np.vstack((np.full_like(wave, 0.5), np.where(wave < 1100, 0.2, 0.8)))
+    bs = BandSummary(wave, {'all': [1000, 1296], 'red': [1100, 1296]})
+
+    mean = bs.mean(t)
+    assert np.allclose(mean[0], 0.5)
+    # weighted by wavelength, not by sample count
+    assert abs(mean[1, 0] - (0.2 * 100 + 0.8 * 196) / 296) < 0.01
+    assert np.allclose(bs.min(t)[1], [0.2, 0.8])
+    assert np.allclose(bs.percentile(t, [50])[1, :, 0], [0.8, 0.8])
+
+    with pytest.raises(ValueError):
+        BandSummary(wave, {'far': [3000, 3100]})
+
+
+def test_summarize_matches_run_many_and_chunks(ct):
+    bands = {'yJ': [980, 1327], 'HK': [1490, 2460]}
+    out = ct.summarize(CONFIGS, bands=bands, chunk=2)
+    t = ct.run_many(CONFIGS)
+
+    assert out['paths']['names'] == list(CONFIGS)
+    assert np.allclose(out['paths']['mean'], BandSummary(ct.output_wave, bands).mean(t))
+    assert np.allclose(out['paths']['max'], ct.summarize(CONFIGS, bands=bands)['paths']['max'])
+    assert out['sections']['names'] == list(ct.transmission_dic.keys())
+
+
+def test_summarize_with_no_paths(ct):
+    out = ct.summarize({}, percentiles=(5, 95))
+
+    assert out['paths']['names'] == []
+    assert out['paths']['mean'].shape == (0, 2)
+    assert out['paths']['percentile'].shape == (0, 2, 2)
+    # and it joins with other summaries
+    joined = concat_summaries([out['paths'], ct.summarize(CONFIGS, percentiles=(5, 95))['paths']])
+    assert joined['names'] == list(CONFIGS)
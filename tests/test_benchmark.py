@@ -0,0 +1,24 @@
+import copy
+
+from benchmark import STAGES, run_benchmarks, compare, check_import
+
+
+def test_every_stage_is_timed_and_compared(repo_data_path):
+    results = run_benchmarks(excel_files=('HISPEC_gary_version.xlsx',), grid_sizes=(1000,),
+                             data_path=repo_data_path, repeat=1)
+
+    stages = results['results']['HISPEC_gary_version.xlsx']['1000']
+    assert list(stages) == list(STAGES)
+    assert all(s['time'] >= 0 and s['peak_bytes'] >= 0 for s in stages.values())
+    # the gary fiber files are not in inputs/, they are listed rather than failing
+    assert all(isinstance(f, str) for f in results['missing']['HISPEC_gary_version.xlsx'])
+    assert compare(results, results) == []
+
+    slower = copy.deepcopy(results)
+    slower['results']['HISPEC_gary_version.xlsx']['1000']['resample']['time'] += 1
+    assert [r[2:4] for r in compare(results, slower)] == [('resample', 'time')]
+
+
+def test_check_import():
+    assert check_import({'time': 0.1, 'numpy': 0.05, 'heavy': []}) == []
+    assert len(check_import({'time': 1.0, 'numpy': 0.05, 'heavy': ['matplotlib']}, budget=0.5)) == 2
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import pytest
+
+from budget_bundle import read_bundle, write_bundle
+from cThroughput import CalcThroughput
+from conftest import CONFIGS
+
+
+def test_bundle_round_trip(ct, data_path):
+    bundle = os.path.join(data_path, 'sheet.tpb')
+    ct.compile_bundle(bundle)
+    loaded = CalcThroughput.from_bundle(bundle)
+
+    assert list(loaded.transmission_dic.keys()) == list(ct.transmission_dic.keys())
+    assert np.array_equal(loaded.output_wave, ct.output_wave)
+    assert np.allclose(loaded.run_many(CONFIGS), ct.run_many(CONFIGS))
+    # the element logs are rebuilt from the bundled curves
+    assert np.allclose(loaded.leave_one_out('TEL')[1], ct.leave_one_out('TEL')[1])
+
+
+def test_bundle_keeps_the_output_grid_of_adaptive_budgets(wave, data_path):
+    ct = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, adaptive_tol=1e-3)
+    assert len(ct.wave) < len(wave)
+    bundle = os.path.join(data_path, 'sheet.tpb')
+    ct.compile_bundle(bundle)
+    loaded = CalcThroughput.from_bundle(bundle)
+
+    assert loaded.adaptive_tol == 1e-3
+    assert np.array_equal(loaded.output_wave, wave)
+    t = loaded.run_many(CONFIGS)
+    assert t.shape == (len(CONFIGS), len(wave))
+    assert np.allclose(t, ct.run_many(CONFIGS))
+
+
+def test_bundle_file_layout(tmp_path):
+    arrays = np.vstack((np.arange(10.0), np.linspace(0, 1, 10)))
+    bundle = str(tmp_path / 'a.tpb')
+    write_bundle(bundle, {'rows': [], 'sections': [['A', 1]]}, arrays)
+
+    for mmap in (True, False):
+        header, read = read_bundle(bundle, mmap=mmap)
+        assert header['sections'] == [['A', 1]] and header['shape'] == [2, 10]
+        assert np.array_equal(read, arrays)
+
+    with open(bundle, 'r+b') as f:
+        f.write(b'NOTABUND')
+    with pytest.raises(ValueError):
+        read_bundle(bundle)
+
+
+def test_bundle_loads_without_the_spreadsheet_or_datafiles(ct, data_path):
+    ct.load()
+    before = ct.run_many(CONFIGS)
+    bundle = os.path.join(data_path, 'sheet.tpb')
+    ct.compile_bundle(bundle)
+    for name in os.listdir(data_path):
+        if name != 'sheet.tpb':
+            os.remove(os.path.join(data_path, name))
+
+    loaded = CalcThroughput.from_bundle(bundle)
+    assert np.allclose(loaded.run_many(CONFIGS), before)
+    assert list(loaded.prescription[4]) == list(ct.prescription[4])
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+
+from cThroughput import CalcThroughput
+from curve_cache import CurveCache
+from conftest import CONFIGS
+
+
+def test_cached_curves_match_and_skip_parsing(wave, data_path, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, cache_dir=cache_dir, lazy=False)
+    assert len(os.listdir(cache_dir)) > 0
+
+    second = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, cache_dir=cache_dir, lazy=False)
+    assert second.parse_times == {}
+    assert np.array_equal(second.run_many(CONFIGS), first.run_many(CONFIGS))
+    plain = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path)
+    assert np.allclose(second.run_many(CONFIGS), plain.run_many(CONFIGS))
+
+
+def test_keys_follow_file_contents_value_and_grid(data_path, tmp_path):
+    cache = CurveCache(str(tmp_path / 'cache'))
+    wave = np.arange(900, 2500, 1.0)
+    glass = data_path + 'glass.csv'
+    key = cache.make_key(glass, 'Internal Transmission', 5, wave)
+
+    assert cache.make_key(glass, 'Internal Transmission', 5, wave.copy()) == key
+    assert cache.make_key(glass, 'Internal Transmission', 6, wave) != key
+    assert cache.make_key(glass, 'Internal Transmission', 5, wave[:-1]) != key
+    # a coating does not depend on the value column
+    assert cache.make_key(glass, 'Coating', 5, wave) == cache.make_key(glass, 'Coating', 6, wave)
+
+    with open(glass, 'a') as f:
+        f.write('2600,0.5,10\n')
+    assert cache.make_key(glass, 'Internal Transmission', 5, wave) != key
+
+
+def test_size_is_counted_once_and_old_entries_evicted(tmp_path):
+    cache = CurveCache(str(tmp_path / 'cache'), max_bytes=3000)
+    curve = np.ones(200) # 1600 bytes of data
+    cache.put('a', curve)
+    cache.put('a', curve)
+    size = os.path.getsize(cache._path('a'))
+    assert cache._size == size
+
+    os.utime(cache._path('a'), (0, 0)) # least recently used
+    cache.put('b', curve)
+    assert cache.get('a') is None
+    assert np.array_equal(cache.get('b'), curve)
+    assert cache._size == size
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pytest
+
+from cThroughput import CalcThroughput, NO_FILE_TYPES, datafile_path
+from curve_reader import read_curve
+
+
+@pytest.mark.parametrize('text, delimiter', [
+    ('wavelength,transmission\n1000,0.5\n1100,0.6\n,,\n', ','),
+    ('﻿# measured\n# nm\t%\n1000\t50\n1100\t60\n', '\t'),
+    ('"Wavelength\n(nm)";"R"\n1000;0.5\n1100;0.6\n', ';'),
+    ('1.0 0.5\n1.1 0.6\n', None)])
+def test_formats(tmp_path, text, delimiter):
+    file_name = str(tmp_path / 'curve.csv')
+    with open(file_name, 'w', encoding='utf-8') as f:
+        f.write(text)
+    curve = read_curve(file_name)
+
+    assert curve.delimiter == delimiter
+    # microns and percent are converted
+    assert np.allclose(curve.wave, [1000, 1100])
+    assert np.allclose(curve.values, [0.5, 0.6])
+    assert curve.thickness is None
+
+
+def test_thickness_column_and_errors(tmp_path):
+    file_name = str(tmp_path / 'glass.csv')
+    with open(file_name, 'w') as f:
+        f.write('wave,t,thickness\n1000,0.9,10\n1100,0.95,10\n')
+    assert read_curve(file_name).thickness == 10
+
+    with open(file_name, 'w') as f:
+        f.write('no numbers here\n')
+    with pytest.raises(ValueError):
+        read_curve(file_name)
+
+
+def test_every_datafile_of_the_repo_prescriptions_reads(repo_data_path):
+    files = set()
+    for excel_file in ('../HISPEC_allsubs.xlsx', '../HISPEC_gary_version.xlsx'):
+        ct = CalcThroughput(np.arange(900, 2500, 1.0), excel_file, data_path=repo_data_path)
+        includes, types, values, filenames, elements = ct.prescription
+        files.update(datafile_path(repo_data_path, filenames[i]) for i in range(len(types))
+                     if types[i] not in NO_FILE_TYPES and isinstance(filenames[i], str))
+    files = [f for f in files if os.path.exists(f)]
+    assert files
+    for file_name in files:
+        curve = read_curve(file_name)
+        assert len(curve.wave) == len(curve.values) > 1
+        assert np.all(np.isfinite(curve.wave))
@@ -0,0 +1,25 @@
+import os
+import pytest
+
+from benchmark import import_time
+from conftest import CONFIGS
+
+
+@pytest.mark.parametrize('module', ['cThroughput', 'server', 'sweep', 'prescriptions', 'plot_report'])
+def test_computing_imports_no_plotting_or_spreadsheet_packages(module):
+    assert import_time(module, repeat=1)['heavy'] == []
+
+
+def test_plot_methods_still_plot(ct, tmp_path):
+    pytest.importorskip('matplotlib')
+    import matplotlib
+    matplotlib.use('Agg')
+
+    font_size = matplotlib.rcParams['font.size']
+    save_path = str(tmp_path) + '/'
+    ct.run(CONFIGS['all'])
+    ct.plotTotalThroughput(label='all', save_path=save_path)
+    ct.plotSubsections(CONFIGS['all'], save_path=save_path, label='all')
+    assert len(os.listdir(save_path)) >= 2
+    # the plot font is not left set globally
+    assert matplotlib.rcParams['font.size'] == font_size
@@ -0,0 +1,46 @@
+import os
+import numpy as np
+import pytest
+
+from cThroughput import CalcThroughput
+from lazy_sections import LazySections
+from conftest import ROWS, CONFIGS, write_sheet
+
+
+def test_only_used_sections_are_loaded(wave, data_path):
+    rows = list(ROWS)
+    rows[9] = (1, 'Coating', 'Grating', np.nan, 'missing.csv')
+    write_sheet(os.path.join(data_path, 'partial.xlsx'), rows)
+    ct = CalcThroughput(wave, 'partial.xlsx', data_path=data_path)
+
+    assert list(ct.transmission_dic) == ['TEL', 'FEI', 'SPEC']
+    assert not any(ct.transmission_dic.is_loaded(key) for key in ct.transmission_dic)
+    ct.run_many({'fei': CONFIGS['fei']})
+    assert ct.transmission_dic.is_loaded('FEI') and not ct.transmission_dic.is_loaded('SPEC')
+    with pytest.raises(OSError):
+        ct.run(CONFIGS['all'])
+
+    eager = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, lazy=False)
+    assert all(eager.transmission_dic.is_loaded(key) for key in eager.transmission_dic)
+
+
+def test_mapping_behaviour():
+    loads = []
+    def load(key):
+        loads.append(key)
+        return len(key)
+    sections = LazySections(['a', 'bb'], load)
+
+    assert 'a' in sections and len(sections) == 2 and loads == []
+    assert sections['bb'] == 2 and sections['bb'] == 2 and loads == ['bb']
+    with pytest.raises(KeyError):
+        sections['c']
+
+    copy = sections.copy(load)
+    copy['c'] = 5
+    del copy['a']
+    assert list(copy) == ['bb', 'c'] and list(sections) == ['a', 'bb']
+    sections.unload('bb')
+    assert not sections.is_loaded('bb') and copy.is_loaded('bb')
+    sections.set_keys(['bb'])
+    assert dict(sections.items()) == {'bb': 2}
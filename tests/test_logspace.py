@@ -0,0 +1,48 @@
+import numpy as np
+
+from logspace import LogTransmissionStore, to_log, from_log, after_logs
+
+
+def test_log_round_trip_keeps_zeros_and_signs():
+    a = np.array([0.5, 0.0, -0.2, 1.0])
+    b = np.array([0.5, 0.3, -0.5, -1.0])
+    parts = [x + y for x, y in zip(to_log(a), to_log(b))]
+
+    assert np.allclose(from_log(*parts), a * b)
+    assert from_log(*parts)[1] == 0
+
+    stack = np.vstack((a, b, np.full(4, 0.9)))
+    after = after_logs(*[np.vstack(p) for p in zip(*[to_log(t) for t in stack])])
+    assert np.allclose(from_log(*[p[0] for p in after]), b * 0.9)
+    assert np.allclose(from_log(*[p[2] for p in after]), 1)
+
+
+def test_store_sections_leave_one_out_and_swap():
+    n = 5
+    curves = {0: np.linspace(0.5, 1, n), 1: 0.9, 2: np.array([1, 0.5, 0, 0.5, 1.0])}
+    store = LogTransmissionStore(n, capacity=1) # grows as rows are added
+    for row, t in curves.items():
+        store.set(row, 'A', t)
+    store.set(5, 'B', np.full(n, 0.8))
+
+    assert store.sections == {'A': [0, 1, 2], 'B': [5]}
+    assert np.allclose(store.section_total('A'), curves[0] * curves[1] * curves[2])
+    assert store.curve(1) == 0.9 and 1 in store.constants
+
+    rows, totals = store.leave_one_out('A')
+    assert rows == [0, 1, 2]
+    assert np.allclose(totals[2], curves[0] * 0.9) # the zero is not divided out
+    assert np.allclose(store.swap('A', 2, np.ones(n)), totals[2])
+
+    copy = store.copy()
+    copy.remove(0)
+    copy.set(1, 'A', 0.5)
+    assert copy.sections['A'] == [1, 2] and store.sections['A'] == [0, 1, 2]
+    assert np.allclose(store.section_total('A'), curves[0] * curves[1] * curves[2])
+    assert np.allclose(copy.section_total('A'), 0.5 * curves[2])
+
+
+def test_store_matches_the_budget(ct):
+    ct.load()
+    for key in ct.transmission_dic:
+        assert np.allclose(ct.store.section_total(key), ct.transmission_dic[key])
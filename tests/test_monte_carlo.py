@@ -0,0 +1,41 @@
+import os
+import numpy as np
+import pandas as pd
+
+from cThroughput import CalcThroughput
+from conftest import ROWS, COLUMNS, CONFIGS
+
+
+def test_envelopes_bracket_the_nominal(ct):
+    errors = {('TEL', 'M1'): ('Relative', 0.02), ('TEL', 'Dust Factor'): ('Absolute', 0.01)}
+    mc = ct.monte_carlo(CONFIGS, n_draws=2000, errors=errors, percentiles=(16, 50, 84), seed=1)
+
+    assert mc['names'] == list(CONFIGS)
+    assert np.allclose(mc['mean'], mc['nominal'], rtol=0.01)
+    assert np.all(mc['envelope'][:, 0] <= mc['nominal'] + 1e-12)
+    assert np.all(mc['envelope'][:, 2] >= mc['nominal'] - 1e-12)
+    # about a 2.2% spread in total
+    spread = (mc['envelope'][0, 2] - mc['envelope'][0, 0]) / 2 / mc['nominal'][0]
+    assert np.allclose(spread, np.hypot(0.02, 0.01 / 0.97), rtol=0.1)
+
+
+def test_seeded_draws_ignore_rows_the_paths_do_not_use(ct):
+    ct.load() # every row in the store, not only those of the paths
+    configs = {'spec': ['SPEC']}
+    errors = {('SPEC', 'Grating'): ('Relative', 0.05)}
+    mc = ct.monte_carlo(configs, n_draws=50, errors=errors, seed=3)
+
+    errors[('TEL', 'M1')] = ('Relative', 0.05)
+    errors[('FEI', 'Dichroic')] = ('Relative', 0.05)
+    assert np.array_equal(ct.monte_carlo(configs, n_draws=50, errors=errors, seed=3)['envelope'], mc['envelope'])
+
+
+def test_error_columns_are_read_from_the_spreadsheet(wave, data_path):
+    df = pd.DataFrame(ROWS, columns=COLUMNS)
+    df['Error'] = [np.nan, 0.02, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan]
+    df.to_excel(os.path.join(data_path, 'errors.xlsx'), index=False)
+    ct = CalcThroughput(wave, 'errors.xlsx', data_path=data_path)
+
+    from_sheet = ct.monte_carlo(CONFIGS, n_draws=100, seed=2)
+    given = ct.monte_carlo(CONFIGS, n_draws=100, errors={('TEL', 'M1'): ('Relative', 0.02)}, seed=2)
+    assert np.array_equal(from_sheet['envelope'], given['envelope'])
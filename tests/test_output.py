@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import pytest
+
+from throughput_output import open_writer, read_output
+from conftest import CONFIGS
+
+
+@pytest.mark.parametrize('ext', ['.npz', '.txt', '.h5'])
+def test_write_many_round_trip(ct, tmp_path, ext):
+    if ext == '.h5':
+        pytest.importorskip('h5py')
+    file_name = str(tmp_path / ('paths' + ext))
+    assert ct.write_many(CONFIGS, file_name, chunk=2) == list(CONFIGS)
+
+    results = read_output(file_name)
+    assert results['names'] == list(CONFIGS)
+    assert results['sections'] == list(CONFIGS.values())
+    assert np.allclose(results['wave'], ct.output_wave)
+    assert np.allclose(results['throughput'], ct.run_many(CONFIGS))
+    assert results['metadata']['excel_file'] == 'sheet.xlsx'
+
+
+def test_npz_appends_when_reopened(ct, tmp_path):
+    file_name = str(tmp_path / 'runs.npz')
+    for label, keys in CONFIGS.items():
+        with open_writer(file_name, ct.output_wave, metadata=ct.output_metadata(), dtype=np.float32) as w:
+            ct.run(keys, label=label, writer=w)
+
+    results = read_output(file_name)
+    assert results['names'] == list(CONFIGS)
+    assert results['throughput'].dtype == np.float32
+    assert np.allclose(results['throughput'], ct.run_many(CONFIGS), atol=1e-6)
+
+
+def test_run_saves_and_rejects_unknown_formats(ct, tmp_path):
+    save_path = str(tmp_path) + '/'
+    ct.run(CONFIGS['fei'], save_path=save_path, label='fei', fmt='npz')
+    results = read_output(os.path.join(save_path, 'transmission_total_fei.npz'))
+    assert np.allclose(results['throughput'][0], ct.total_throughput)
+
+    with pytest.raises(ValueError):
+        ct.run(CONFIGS['fei'], save_path=save_path, fmt='xlsx')
+    with pytest.raises(ValueError):
+        open_writer(str(tmp_path / 'paths.xlsx'), ct.output_wave)
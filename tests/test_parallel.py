@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from cThroughput import CalcThroughput
+from conftest import CONFIGS
+
+
+@pytest.mark.parametrize('pool', ['thread', 'process'])
+def test_pool_loading_matches_serial(wave, data_path, pool):
+    serial = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, lazy=False)
+    parallel = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, lazy=False, workers=2, pool=pool)
+
+    for key in serial.transmission_dic:
+        assert np.array_equal(parallel.transmission_dic[key], serial.transmission_dic[key])
+    assert np.array_equal(parallel.run_many(CONFIGS), serial.run_many(CONFIGS))
+    # each file parsed once, ramp.csv is used on two rows
+    assert sorted(parallel.parse_times) == sorted(serial.parse_times)
+    assert len(parallel.parse_times) == 4
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pytest
+
+from plot_report import decimate, render_report
+from conftest import CONFIGS
+
+
+def test_decimate_keeps_extremes_and_gaps():
+    x = np.arange(10000.0)
+    y = np.sin(x / 500)
+    y[5000] = 3 # a narrow spike
+    y[7000:7003] = np.nan
+    xd, yd = decimate(x, y, 100)
+
+    assert len(xd) <= 2 * 100 + 2 + 100
+    assert xd[0] == 0 and xd[-1] == 9999 and np.all(np.diff(xd) > 0)
+    assert 3 in yd and np.any(np.isnan(yd))
+    assert np.isclose(np.nanmin(yd), y[~np.isnan(y)].min())
+    # short lines are left alone
+    assert np.array_equal(decimate(x[:50], y[:50], 100)[1], y[:50])
+
+
+def test_unchanged_figures_are_skipped(ct, tmp_path):
+    pytest.importorskip('matplotlib')
+    save_path = str(tmp_path)
+    kwargs = dict(dpi=20, figsize=(4, 2))
+    first = render_report(ct, CONFIGS, save_path, **kwargs)
+    assert len(first['rendered']) == len(CONFIGS) and first['skipped'] == []
+    assert all(os.path.exists(f) for f in first['rendered'])
+
+    assert len(render_report(ct, CONFIGS, save_path, **kwargs)['skipped']) == len(CONFIGS)
+
+    ct.update_element('FEI', 'Dichroic', datafile='flat.csv')
+    again = render_report(ct, CONFIGS, save_path, **kwargs)
+    assert sorted(os.path.basename(f) for f in again['rendered']) == \
+           ['transmission_total_all.png', 'transmission_total_fei.png']
+    assert len(render_report(ct, CONFIGS, save_path, force=True, **kwargs)['rendered']) == len(CONFIGS)
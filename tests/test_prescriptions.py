@@ -0,0 +1,44 @@
+import os
+import numpy as np
+
+from cThroughput import CalcThroughput
+from prescriptions import PrescriptionSet
+from conftest import ROWS, CONFIGS, write_sheet
+
+
+def test_diff_lines_up_rows_and_paths(wave, data_path):
+    rows = list(ROWS)
+    rows[2] = (1, 'Constant', 'Dust Factor', 0.5, np.nan)
+    rows.append((1, 'Coating', 'Slit', np.nan, 'flat.csv'))
+    write_sheet(os.path.join(data_path, 'new.xlsx'), rows)
+
+    ps = PrescriptionSet(wave, {'old': 'sheet.xlsx', 'new': 'new.xlsx'}, data_path=data_path)
+    d = ps.diff('old', 'new', CONFIGS)
+
+    assert [(e['element'], e['change']) for e in d['elements']] == [('Dust Factor', 'changed'), ('Slit', 'added')]
+    assert d['sections']['changed'] == ['TEL', 'SPEC']
+    assert d['paths']['names'] == list(CONFIGS)
+    assert d['paths']['errors'] == {'old': {}, 'new': {}}
+    # the curves of both revisions come from the one store
+    fresh = CalcThroughput(wave, 'new.xlsx', data_path=data_path)
+    mean = fresh._bandSummary({'yJ': [980, 1327], 'HK': [1490, 2460]}).mean(fresh._runMany(CONFIGS))
+    assert np.allclose(d['paths']['new'], mean)
+
+
+def test_diff_of_the_repo_prescriptions(repo_data_path):
+    configs = {'ATC'  : ['TELESCOPE', 'AO', 'FEI COMMON', 'FEI ATC'],
+               'rspec': ['TELESCOPE', 'AO', 'FEI COMMON', 'FEI RED', 'COUPLING NGS',
+                         'FIBER TRANSMISSION RED', 'RSPEC']}
+    ps = PrescriptionSet(np.arange(900, 2500, 1.0), {'allsubs': '../HISPEC_allsubs.xlsx',
+                                                     'gary': '../HISPEC_gary_version.xlsx'},
+                         data_path=repo_data_path)
+    d = ps.diff('gary', 'allsubs', configs)
+
+    assert len(d['elements']) > 0
+    assert np.all(np.isfinite(d['paths']['new']))
+    assert np.all(np.isfinite(d['paths']['old'][0]))
+    coupling = 'fiber/couplingEff_atm1_adc1_PL0_defoc25nmRMS_LO50nmRMS_ttStatic0mas_ttDynamic6masRMS.csv'
+    if not os.path.exists(repo_data_path + coupling):
+        # a gary coupling file is not in inputs/, that path is nan and says why
+        assert np.all(np.isnan(d['paths']['old'][1]))
+        assert coupling in d['paths']['errors']['old']['rspec']
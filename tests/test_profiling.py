@@ -0,0 +1,34 @@
+import json
+import numpy as np
+import pytest
+
+from cThroughput import CalcThroughput
+from conftest import CONFIGS
+
+
+def test_stages_are_recorded_per_element(wave, data_path):
+    seen = []
+    ct = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, profile=seen.append)
+    ct.load()
+    report = ct.profile_report()
+
+    assert len(report) == len(seen) > 0
+    stages = report.by_stage()
+    assert {'excel', 'parse', 'resample', 'scale', 'analytic', 'assemble'} <= set(stages)
+    # ramp.csv is on two rows but only read from disk once
+    ramp = [r for r in report.records if r.stage == 'parse' and r.path == data_path + 'ramp.csv']
+    assert len(ramp) == 2 and sum(r.bytes_read > 0 for r in ramp) == 1
+    assert report.by_file()[data_path + 'ramp.csv']['bytes_read'] == ramp[0].bytes_read + ramp[1].bytes_read
+    assert ('SPEC', 'HO WFE', 10) in report.by_element()
+    assert report.slowest(2)[0][1]['time'] >= report.slowest(2)[1][1]['time']
+    json.dumps(report.to_dict())
+    str(report)
+
+
+def test_profiling_is_off_by_default_and_does_not_change_results(ct, wave, data_path):
+    assert len(ct.profile_report()) == 0
+    profiled = CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, profile=True)
+    assert np.array_equal(profiled.run_many(CONFIGS), ct.run_many(CONFIGS))
+
+    with pytest.raises(ValueError):
+        CalcThroughput(wave, 'sheet.xlsx', data_path=data_path, profile='yes')
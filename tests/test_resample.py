@@ -0,0 +1,46 @@
+import pickle
+import numpy as np
+import pytest
+
+from resample import Resampler
+
+
+def test_linear_matches_interp1d():
+    interpolate = pytest.importorskip('scipy.interpolate')
+    rng = np.random.default_rng(0)
+    x = np.r_[rng.uniform(950, 2400, 50), 1200, 1200] # unsorted, a repeated wavelength
+    y = rng.uniform(0, 1, len(x))
+    wave = np.arange(900, 2500, 0.7)
+
+    expected = interpolate.interp1d(x, y, bounds_error=False, fill_value='extrapolate')(wave)
+    assert np.array_equal(Resampler(wave)(x, y), expected)
+
+
+def test_extrapolation_policies():
+    wave = np.array([0.0, 1.5, 3.0, 5.0])
+    x, y = np.array([1.0, 2.0, 4.0]), np.array([1.0, 2.0, 2.0])
+
+    assert np.allclose(Resampler(wave)(x, y), [0, 1.5, 2, 2])
+    assert np.allclose(Resampler(wave, extrapolate='clamp')(x, y), [1, 1.5, 2, 2])
+    out = Resampler(wave, extrapolate='constant', fill_value=-1)(x, y)
+    assert np.allclose(out, [-1, 1.5, 2, -1])
+    with pytest.raises(ValueError):
+        Resampler(wave, extrapolate='cubic')
+    with pytest.raises(ValueError):
+        Resampler(wave)([1.0], [1.0])
+
+
+def test_tables_are_reused_bounded_and_pickle():
+    r = Resampler(np.linspace(0, 10, 50), max_tables=2)
+    x = np.arange(11.0)
+    assert r.table(x) is r.table(x.copy())
+    # many curves on the same wavelengths in one call
+    assert r(x, np.vstack((x, 2 * x))).shape == (2, 50)
+
+    r.table(x + 0.1)
+    r.table(x + 0.2)
+    assert len(r._tables) == 2
+
+    copy = pickle.loads(pickle.dumps(r))
+    assert len(copy._tables) == 0
+    assert np.array_equal(copy(x, x), r(x, x))
@@ -0,0 +1,23 @@
+import numpy as np
+
+from conftest import CONFIGS
+
+
+def test_run_many_matches_run(ct):
+    t = ct.run_many(CONFIGS)
+
+    assert t.shape == (len(CONFIGS), len(ct.output_wave))
+    for j, keys in enumerate(CONFIGS.values()):
+        assert np.allclose(t[j], ct.run(keys))
+
+
+def test_repeated_sections_and_zeros(ct):
+    # a section listed twice counts twice, like in run
+    t = ct.run_many({'twice': ['TEL', 'TEL'], 'once': ['TEL']})
+    assert np.allclose(t[0], t[1] ** 2)
+
+    ct.update_element('TEL', 'Dust Factor', value=0)
+    assert np.all(ct.run_many(CONFIGS) == 0)
+    ct.update_element('TEL', 'Dust Factor', value=-0.5)
+    assert np.all(ct.run_many({'tel': ['TEL']}) < 0)
+    assert np.allclose(ct.run_many({'tel': ['TEL']})[0], ct.run(['TEL']))
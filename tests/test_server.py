@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import numpy as np
+import pytest
+
+from server import ThroughputServer, _ReadWriteLock, connect, query
+from conftest import ROWS, CONFIGS, write_sheet
+
+
+def answer(server, target, body=None):
+    """status and decoded JSON of one request"""
+    async def ask():
+        server._lock = _ReadWriteLock()
+        return await server._answer('POST' if body else 'GET', target, {'accept': 'application/json'},
+                                    json.dumps(body).encode() if body else b'')
+    status, content_type, payload, extra = asyncio.run(ask())
+
+    return status, json.loads(payload)
+
+
+def save(file_name, rows, stamp):
+    """write a spreadsheet with a modification time the watcher cannot miss"""
+    write_sheet(file_name, rows)
+    os.utime(file_name, ns=(stamp, stamp))
+
+
+def test_writer_waits_for_readers_and_holds_off_new_ones():
+    events = []
+
+    async def reader(lock, name, wait):
+        async with lock.read():
+            events.append(name + ' in')
+            await asyncio.sleep(wait)
+        events.append(name + ' out')
+
+    async def writer(lock):
+        async with lock.write():
+            events.append('write')
+
+    async def main():
+        lock = _ReadWriteLock()
+        first = asyncio.ensure_future(reader(lock, 'a', 0.05))
+        await asyncio.sleep(0.01)
+        write = asyncio.ensure_future(writer(lock))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(reader(lock, 'b', 0))
+        await asyncio.gather(first, write, second)
+
+    asyncio.run(main())
+    assert events == ['a in', 'a out', 'write', 'b in', 'b out']
+
+
+def test_bad_parameters_are_400(ct):
+    server = ThroughputServer(ct, watch_interval=None)
+
+    status, result = answer(server, '/bands?sections=TEL,FEI&bands=yJ')
+    assert status == 200 and result['bands'] == ['yJ']
+    assert answer(server, '/bands?sections=TEL&bands=zz')[0] == 400
+    assert answer(server, '/bands?sections=TEL&bands=far:3000:3100')[0] == 400
+    assert answer(server, '/bands?sections=TEL&percentiles=5,x')[0] == 400
+    assert answer(server, '/bands', {'sections': ['TEL'], 'bands': {'yJ': [980]}})[0] == 400
+    assert answer(server, '/path?sections=TEL,NOPE')[0] == 400
+    assert answer(server, '/paths', {'configs': {'a': 5}})[0] == 400
+    assert answer(server, '/nowhere')[0] == 404
+
+
+def test_failed_reload_keeps_serving_previous_budget(ct, data_path):
+    server = ThroughputServer(ct, watch_interval=None)
+    sheet = os.path.join(data_path, 'sheet.xlsx')
+    before = server.ct.run_many(CONFIGS)
+    stamp = os.stat(sheet).st_mtime_ns
+
+    rows = list(ROWS)
+    rows[2] = (1, 'Constant', 'Dust Factor', 0.5, np.nan)
+    rows[5] = (1, 'Coating', 'Dichroic', np.nan, 'missing.csv')
+    save(sheet, rows, stamp + 10**9)
+    with pytest.raises(OSError):
+        server.reload()
+    assert server.ct is ct and server.reloads == 0
+    assert np.array_equal(server.ct.run_many(CONFIGS), before)
+
+    # the spreadsheet fixed, it is picked up
+    rows[5] = ROWS[5]
+    save(sheet, rows, stamp + 2 * 10**9)
+    assert server.reload() == ['TEL']
+    assert server.reloads == 1
+    assert np.allclose(server.ct.run_many(CONFIGS), before * 0.5 / 0.97)
+    # the budget served before is untouched
+    assert np.array_equal(ct.run_many(CONFIGS), before)
+
+
+def test_watch_swaps_in_only_loaded_budgets(ct, data_path):
+    server = ThroughputServer(ct, watch_interval=0.01)
+    sheet = os.path.join(data_path, 'sheet.xlsx')
+    stamp = os.stat(sheet).st_mtime_ns
+    rows = list(ROWS)
+
+    async def main():
+        server._lock = _ReadWriteLock()
+        watcher = asyncio.ensure_future(server._watch())
+        try:
+            rows[9] = (1, 'Coating', 'Grating', np.nan, 'missing.csv')
+            save(sheet, rows, stamp + 10**9)
+            await asyncio.sleep(0.3)
+            assert server.ct is ct and server.reloads == 0
+
+            rows[9] = (1, 'Coating', 'Grating', np.nan, 'flat.csv')
+            save(sheet, rows, stamp + 2 * 10**9)
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if server.reloads:
+                    break
+        finally:
+            watcher.cancel()
+
+    asyncio.run(main())
+    assert server.reloads == 1 and server.ct is not ct
+    assert server.ct.prescription[3][9] == 'flat.csv'
+
+
+def test_queries_over_a_unix_socket(ct, tmp_path):
+    server = ThroughputServer(ct, watch_interval=None)
+    path = str(tmp_path / 'tp.sock')
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(server.serve(unix_socket=path))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.02)
+        conn = connect(path)
+        assert query(path, '/health', connection=conn)['status'] == 'ok'
+        assert np.allclose(query(path, '/path', connection=conn, sections=CONFIGS['fei']), ct.run(CONFIGS['fei']))
+        names, t = query(path, '/paths', connection=conn, configs=CONFIGS)
+        assert names == list(CONFIGS) and np.allclose(t, ct.run_many(CONFIGS))
+        with pytest.raises(RuntimeError, match='400'):
+            query(path, '/path', connection=conn, sections=['NOPE'])
+        conn.close()
+    finally:
+        async def stop():
+            task.cancel()
+            others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            await asyncio.gather(*others, return_exceptions=True)
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
@@ -0,0 +1,45 @@
+import numpy as np
+
+from spectral_output import Convolver, Rebinner, SpectralOutput
+from conftest import CONFIGS
+
+
+def test_convolution_keeps_flat_curves_and_smooths_to_the_resolution():
+    wave = np.arange(1000, 1400, 0.01)
+    assert np.allclose(Convolver(wave, 5000)(np.full_like(wave, 0.7)), 0.7)
+
+    line = np.zeros_like(wave)
+    line[len(wave) // 2] = 1
+    smoothed = Convolver(wave, 5000)(line)
+    assert np.isclose(smoothed.sum(), 1, atol=1e-6)
+    # FWHM = wavelength / R
+    half = wave[smoothed >= smoothed.max() / 2]
+    assert np.isclose(half[-1] - half[0], wave[len(wave) // 2] / 5000, atol=0.02)
+
+    # a resolving power varying with wavelength gives a wider line where R is low
+    r = Convolver(wave, lambda w: np.where(w < 1200, 2000, 8000))
+    lines = np.zeros((2, len(wave)))
+    lines[0, 10000], lines[1, 30000] = 1, 1
+    out = r(lines)
+    assert out[0].max() < out[1].max()
+
+
+def test_rebinning_averages_onto_pixels():
+    wave = np.arange(1000, 1100, 0.1)
+    t = np.vstack(((wave - 1000) / 100, np.full_like(wave, 0.5)))
+    pixels = np.arange(1010, 1090, 2.0).reshape(2, -1) # two orders
+    binned = Rebinner(wave, pixels)(t)
+
+    assert binned.shape == (2, 2, 20)
+    assert np.allclose(binned[0], (pixels - 1000) / 100, atol=1e-3)
+    assert np.allclose(binned[1], 0.5)
+    edges = Rebinner(wave, np.array([1010.0, 1020.0, 1040.0]), edges=True)(t[0])
+    assert np.allclose(edges, [0.15, 0.3], atol=1e-3)
+
+
+def test_spectral_output_of_a_budget(ct):
+    pixels = np.arange(1000, 2400, 5.0)
+    out = ct.spectral_output(resolution=1000, pixel_wave=pixels)(ct.run_many(CONFIGS))
+    assert out.shape == (len(CONFIGS), len(pixels))
+    assert np.all(np.isfinite(out))
+    assert isinstance(ct.spectral_output(), SpectralOutput)
@@ -0,0 +1,31 @@
+import numpy as np
+
+from cThroughput import CalcThroughput, wave_chunks
+from throughput_output import read_output
+from conftest import CONFIGS
+
+
+def test_chunks_match_the_whole_grid(ct, wave):
+    whole = ct.run_many(CONFIGS)
+    waves, parts = zip(*ct.stream_many(CONFIGS, chunk=300))
+
+    assert all(len(w) <= 300 for w in waves)
+    assert np.array_equal(np.concatenate(waves), wave)
+    assert np.allclose(np.hstack(parts), whole)
+
+
+def test_stream_on_another_grid_from_wave_chunks(ct, wave, data_path):
+    fine = CalcThroughput(np.arange(1000, 1200, 0.01), 'sheet.xlsx', data_path=data_path)
+    chunks = wave_chunks(1000, 1200, 0.01, chunk=5000)
+    t = np.hstack([t for w, t in ct.stream_many(CONFIGS, wave=chunks)])
+    assert np.allclose(t, fine.run_many(CONFIGS))
+
+
+def test_write_stream(ct, tmp_path):
+    file_name = str(tmp_path / 'stream.npz')
+    assert ct.write_stream(CONFIGS, file_name, chunk=500, dtype=np.float32) == len(ct.output_wave)
+
+    results = read_output(file_name)
+    assert results['names'] == list(CONFIGS)
+    assert np.allclose(results['wave'], ct.output_wave)
+    assert np.allclose(results['throughput'], ct.run_many(CONFIGS), atol=1e-6)
@@ -0,0 +1,44 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from sweep import SweepAxis, element_variant, fiber_length, run_sweep, load_sweep
+from conftest import CONFIGS
+
+
+def expected(ct, dichroic, length):
+    staged = ct.copy()
+    staged.update_element('FEI', 'Dichroic', datafile=dichroic)
+    staged.update_element('FEI', 'Window', value=length)
+    return staged.run_many(CONFIGS)
+
+
+def test_sweep_matches_updating_each_combination(ct, data_path):
+    axes = [element_variant(ct, 'FEI', 'Dichroic', ['edge.csv', 'flat.csv']),
+            fiber_length(ct, [5, 20], sections=('FEI',))]
+    file_name = os.path.join(data_path, 'sweep.npz')
+    sweep = run_sweep(ct, CONFIGS, axes, save_file=file_name)
+
+    assert sweep['throughput'].shape == (2, 2, len(CONFIGS), len(ct.output_wave))
+    for a, dichroic in enumerate(['edge.csv', 'flat.csv']):
+        for b, length in enumerate([5, 20]):
+            assert np.allclose(sweep['throughput'][a, b], expected(ct, dichroic, length))
+    # the prescription itself is left as it was
+    assert ct.prescription[3][5] == 'edge.csv'
+    assert np.allclose(load_sweep(file_name)['throughput'], sweep['throughput'])
+
+
+def test_sweeps_in_threads_do_not_share_state(ct):
+    ct.load()
+    axes = [element_variant(ct, 'FEI', 'Dichroic', ['edge.csv', 'flat.csv'])]
+    # an axis that only scales, so the two sweeps differ in every block
+    half = SweepAxis('half', [0.5, 0.25], [('TEL', 2)], lambda value, i: value)
+    serial = [run_sweep(ct, CONFIGS, axes)['throughput'], run_sweep(ct, CONFIGS, [half])['throughput']]
+
+    def sweep(job):
+        return run_sweep(ct, CONFIGS, job, workers=2, pool='thread', max_bytes=1)['throughput']
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        threaded = list(ex.map(sweep, [axes, [half]] * 4))
+
+    for j, t in enumerate(threaded):
+        assert np.array_equal(t, serial[j % 2])
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from thermal import photon_radiance
+from conftest import CONFIGS
+
+
+def test_background_is_emission_times_what_follows(ct, wave):
+    thermal = {('TEL', 'M1'): (0.02, 280), ('FEI', 'Window'): ('auto', None)}
+    out = ct.thermal_background(CONFIGS, temperature=270, thermal=thermal)
+    ct.load()
+    t = {i: ct.store.curve(i) for i in (2, 3, 5, 7)}
+    fei, spec = ct.transmission_dic['FEI'], ct.transmission_dic['SPEC']
+
+    m1 = 0.02 * photon_radiance(wave, 280) * t[2] * t[3]
+    window = np.clip(1 - t[7], 0, 1) * photon_radiance(wave, 270)
+    assert np.allclose(out['sections']['TEL'], m1)
+    assert np.allclose(out['sections']['FEI'], window) # the window is last in FEI
+    assert np.allclose(out['background'][0], m1)
+    assert np.allclose(out['background'][1], m1 * fei + window)
+    assert np.allclose(out['background'][2], (m1 * fei + window) * spec)
+
+
+def test_radiance_and_bad_models(ct):
+    # photon radiance per nm peaks at 3669.7 um K / T
+    wave = np.arange(5000, 20000, 10.0)
+    assert abs(wave[np.argmax(photon_radiance(wave, 300))] - 3.6697e6 / 300) < 10
+
+    with pytest.raises(ValueError):
+        ct.thermal_background(CONFIGS, thermal={('TEL', 'M1'): (1.5, 280)})
+    with pytest.raises(ValueError):
+        ct.thermal_background(CONFIGS, thermal={('TEL', 'M1'): (0.02, None)}) # no temperature
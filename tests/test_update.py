@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import pytest
+
+from cThroughput import CalcThroughput
+from conftest import ROWS, CONFIGS, write_sheet
+
+
+def test_update_element_matches_fresh_load(ct, wave, data_path):
+    before = ct.run(CONFIGS['all'])
+    ct.update_element('TEL', 'Dust Factor', value=0.5)
+    assert np.allclose(ct.run(CONFIGS['all']), before * 0.5 / 0.97)
+
+    ct.update_element('FEI', 'Spare', include=True)
+    i = ct._findRow('FEI', 'Spare')
+    assert ct.prescription[0][i] == 1
+    ct.update_element('FEI', 'Spare', include=False)
+    assert ct.prescription[0][i] == 0 and ct.prescription[0][i] is not False
+
+
+def test_update_from_excel_reloads_only_changed_sections(ct, wave, data_path):
+    ct.load()
+    rows = list(ROWS)
+    rows[9] = (1, 'Coating', 'Grating', np.nan, 'flat.csv')
+    write_sheet(os.path.join(data_path, 'new.xlsx'), rows)
+
+    assert ct.update_from_excel('new.xlsx') == ['SPEC']
+    fresh = CalcThroughput(wave, 'new.xlsx', data_path=data_path)
+    assert np.allclose(ct.run(CONFIGS['all']), fresh.run(CONFIGS['all']))
+
+
+def test_failed_update_from_excel_leaves_budget_unchanged(ct, data_path):
+    ct.load()
+    before = ct.run(CONFIGS['all'])
+    prescription = [list(column) for column in ct.prescription]
+
+    rows = list(ROWS)
+    rows[2] = (1, 'Constant', 'Dust Factor', 0.5, np.nan)
+    rows[5] = (1, 'Coating', 'Dichroic', np.nan, 'missing.csv')
+    write_sheet(os.path.join(data_path, 'bad.xlsx'), rows)
+    with pytest.raises(OSError):
+        ct.update_from_excel('bad.xlsx')
+
+    assert ct.excel_file == 'sheet.xlsx'
+    assert [list(column) for column in ct.prescription] == prescription
+    assert np.array_equal(ct.run(CONFIGS['all']), before)
+    # and the budget can still be updated afterwards
+    assert ct.update_from_excel('sheet.xlsx') == []
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from conftest import CONFIGS
+
+
+def test_variants_match_updating_the_prescription(ct, wave):
+    variants = {'as loaded': [],
+                'flat'     : [('FEI', 'Dichroic', 'flat.csv')],
+                'reflected': [('FEI', 'Dichroic', 'edge.csv', 'reflection'), ('TEL', 'Dust Factor', 0.5)]}
+    out = ct.run_variants(CONFIGS, variants)
+
+    assert out['variants'] == list(variants) and out['names'] == list(CONFIGS)
+    assert out['throughput'].shape == (3, len(CONFIGS), len(wave))
+    assert np.allclose(out['throughput'][0], ct.run_many(CONFIGS))
+
+    flat = ct.copy()
+    flat.update_element('FEI', 'Dichroic', datafile='flat.csv')
+    assert np.allclose(out['throughput'][1], flat.run_many(CONFIGS))
+
+    edge = ct.store.curve(5)
+    reflected = ct.run_many(CONFIGS)
+    reflected[1:] *= (1 - edge) / edge
+    reflected *= 0.5 / 0.97
+    assert np.allclose(out['throughput'][2], reflected)
+    # the budget itself is unchanged
+    assert ct.prescription[3][5] == 'edge.csv'
+
+
+def test_bad_swaps(ct):
+    with pytest.raises(ValueError):
+        ct.run_variants(CONFIGS, {'v': [('FEI', 'Dichroic', 'flat.csv', 'sideways')]})
+    with pytest.raises(ValueError):
+        ct.run_variants(CONFIGS, {'v': [('FEI', 'Dichroic', 'flat.csv'), ('FEI', 'Dichroic', 'edge.csv')]})
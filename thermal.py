@@ -0,0 +1,93 @@
+# Emissivity model for thermal background budgets
+#
+# Each element with an 'Emissivity' entry in the spreadsheet emits
+#     emissivity * B(wavelength, Temperature)
+# where B is the blackbody photon radiance, and that emission is
+# transmitted by every element after it in the path. Two columns are used:
+# - 'Emissivity'  : a number, e.g. 0.02 for a bare gold mirror, or 'auto'
+#                   for 1 - transmission of the element (no scatter)
+# - 'Temperature' : surface temperature in K, blank uses the default
+#                   temperature passed to CalcThroughput.thermal_background
+# Rows with a blank 'Emissivity' do not emit. Backgrounds are photon
+# radiances, photons/s/m^2/sr/nm, so multiply by the etendue (A Omega)
+# of the pixel or fiber and the detector QE for photons/s
+import numpy as np
+
+H = 6.62607015e-34 # J s
+C = 2.99792458e8   # m/s
+K_B = 1.380649e-23 # J/K
+AUTO = 'auto'
+
+
+def read_thermal_model(excel_file):
+    """
+    read the emissivity columns of a prescription spreadsheet
+
+    inputs
+    ------
+    excel_file - str
+        path to and name of excel file to load
+
+    outputs
+    -------
+    thermal - dict
+        spreadsheet row -> (emissivity or 'auto', temperature in K or None)
+        for the rows with an emissivity
+    """
+    import pandas as pd # only needed when reading from excel
+
+    xl = pd.ExcelFile(excel_file)
+    df = xl.parse(xl.sheet_names[0])
+    if 'Emissivity' not in df:
+        raise ValueError("%s has no 'Emissivity' column, add one (and optionally 'Temperature') "
+                         "or pass thermal explicitly" % excel_file)
+
+    temperatures = df['Temperature'] if 'Temperature' in df else [np.nan] * len(df)
+    thermal = {}
+    for i, (emissivity, temperature) in enumerate(zip(df['Emissivity'], temperatures)):
+        if isinstance(emissivity, str) and emissivity.strip().lower() == AUTO:
+            emissivity = AUTO
+        else:
+            try:
+                emissivity = float(emissivity)
+            except (TypeError, ValueError):
+                continue
+            if not np.isfinite(emissivity):
+                continue
+        try:
+            temperature = float(temperature)
+        except (TypeError, ValueError):
+            temperature = np.nan
+        thermal[i] = check_thermal(emissivity, temperature if np.isfinite(temperature) else None)
+
+    return thermal
+
+
+def check_thermal(emissivity, temperature=None):
+    """validate one emissivity model entry, returns (emissivity, temperature)"""
+    if emissivity != AUTO and not 0 <= emissivity <= 1:
+        raise ValueError("Emissivity must be between 0 and 1 or '%s', not %s" % (AUTO, emissivity))
+    if temperature is not None and temperature <= 0:
+        raise ValueError('Temperature must be in K and positive, not %s' % temperature)
+
+    return emissivity, (float(temperature) if temperature is not None else None)
+
+
+def photon_radiance(wave, temperature):
+    """
+    blackbody photon radiance
+
+    inputs
+    ------
+    wave - array [nm]
+        wavelengths
+    temperature - float [K]
+        blackbody temperature
+
+    outputs
+    -------
+    radiance - array [photons/s/m^2/sr/nm]
+    """
+    lam = np.asarray(wave, dtype=float) * 1e-9
+    # 2c/lam^4 / (exp(hc/lam kT) - 1) per m of wavelength, 1e-9 per nm
+    return 2 * C / lam**4 / np.expm1(H * C / (lam * K_B * temperature)) * 1e-9
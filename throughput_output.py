@@ -0,0 +1,419 @@
+# Writers for throughput results
+#
+# np.savetxt writes every number as text, which is slow for the 35000
+# point grid and slow to read back. The writers here take (paths x
+# wavelength) blocks and append them to one file as they are computed,
+# so a sweep over thousands of paths ends up in a single file:
+# - 'npz'  : numpy zip archive, one uncompressed .npy entry per block.
+#            Needs nothing but numpy and loads with np.load. Reopening
+#            an existing file appends to it
+# - 'hdf5' : resizable, chunked datasets, needs h5py
+# - 'text' : comma separated columns like np.savetxt, written on close
+#
+# Every file stores the wavelength grid, the name (and sections) of each
+# path and a metadata dict, e.g. the prescription hash from
+# CalcThroughput.output_metadata. read_output reads any of them back
+#
+# StreamWriter goes the other way for grids too large to hold: the paths
+# are fixed when it is opened and (paths x chunk) blocks of wavelengths
+# are appended, see CalcThroughput.write_stream. hdf5 and text files come
+# out the same as above, npz files hold one entry per wavelength chunk
+import json
+import os
+import zipfile
+import numpy as np
+
+FORMATS = {'.npz': 'npz', '.h5': 'hdf5', '.hdf5': 'hdf5', '.txt': 'text', '.csv': 'text'}
+EXTENSIONS = {'npz': '.npz', 'hdf5': '.h5', 'text': '.txt'}
+
+
+def open_writer(file_name, wave, fmt=None, metadata=None, dtype=float, **kwargs):
+    """
+    open a writer for throughput results
+
+    inputs
+    ------
+    file_name - str
+        file to write, appended to if it exists (npz and hdf5)
+    wave - array [nm]
+        wavelength grid of the results
+    fmt - str (default: None)
+        'npz', 'hdf5' or 'text'. None picks from the file extension
+    metadata - dict (default: None)
+        JSON serializable information to store with the results
+    dtype - type (default: float)
+        type the results are stored as, e.g. np.float32 to halve the size
+    kwargs
+        passed on to the writer, e.g. compress=True for npz
+
+    outputs
+    -------
+    writer - NpzWriter, Hdf5Writer or TextWriter
+        writer with write(names, t, sections=None) and close()
+    """
+    if fmt is None:
+        fmt = FORMATS.get(os.path.splitext(file_name)[1].lower())
+    writers = {'npz': NpzWriter, 'hdf5': Hdf5Writer, 'text': TextWriter}
+    if fmt not in writers:
+        raise ValueError('fmt must be one of %s, not %s' % (list(writers), fmt))
+
+    return writers[fmt](file_name, wave, metadata=metadata, dtype=dtype, **kwargs)
+
+
+class _Writer():
+    """shared parts of the writers, use open_writer to make one"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _block(self, names, t, sections):
+        """check one block of results and give it back as a 2D array"""
+        t = np.atleast_2d(np.asarray(t, dtype=self.dtype))
+        names = [str(name) for name in names]
+        if t.shape != (len(names), len(self.wave)):
+            raise ValueError('expected (%s, %s) results for %s names, got %s'
+                             % (len(names), len(self.wave), len(names), t.shape))
+        if sections is not None and len(sections) != len(names):
+            raise ValueError('need one list of sections per name')
+
+        return names, t
+
+
+class NpzWriter(_Writer):
+    """
+    Appends blocks of results to a numpy zip archive
+
+    """
+    def __init__(self, file_name, wave, metadata=None, dtype=float, compress=False):
+        """
+        inputs
+        ------
+        file_name - str
+            .npz file to write, appended to if it exists
+        wave - array [nm]
+            wavelength grid of the results
+        metadata - dict (default: None)
+            JSON serializable information stored as the 'metadata' entry
+        dtype - type (default: float)
+            type the results are stored as
+        compress - bool (default: False)
+            deflate each entry, smaller but slower to write and read
+        """
+        self.file_name = file_name
+        self.wave  = np.asarray(wave, dtype=float)
+        self.dtype = dtype
+        self._zip  = zipfile.ZipFile(file_name, 'a' if os.path.exists(file_name) else 'w',
+                                     compression=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+                                     allowZip64=True)
+
+        entries = set(self._zip.namelist())
+        self.n_blocks = len([e for e in entries if e.startswith('throughput_')])
+        if 'wave.npy' in entries:
+            with self._zip.open('wave.npy') as f:
+                if not np.array_equal(np.lib.format.read_array(f), self.wave):
+                    self._zip.close()
+                    raise ValueError('%s holds results on a different wavelength grid' % file_name)
+        else:
+            self._put('wave', self.wave)
+            self._put('metadata', np.array(json.dumps(metadata or {})))
+
+    def write(self, names, t, sections=None):
+        """
+        append a block of results
+
+        inputs
+        ------
+        names - list
+            name of each path
+        t - array
+            (paths x wavelength) throughput
+        sections - list (default: None)
+            list of section keys of each path
+        """
+        names, t = self._block(names, t, sections)
+        block = '%06d' % self.n_blocks
+        self._put('throughput_' + block, t)
+        self._put('names_' + block, np.array(names))
+        if sections is not None:
+            self._put('sections_' + block, np.array(json.dumps([list(s) for s in sections])))
+        self.n_blocks += 1
+
+    def close(self):
+        self._zip.close()
+
+    def _put(self, name, array):
+        with self._zip.open(name + '.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+
+class Hdf5Writer(_Writer):
+    """
+    Appends blocks of results to resizable datasets in an HDF5 file
+
+    """
+    def __init__(self, file_name, wave, metadata=None, dtype=float, chunk=64):
+        """
+        inputs
+        ------
+        file_name - str
+            .h5 file to write, appended to if it exists
+        wave - array [nm]
+            wavelength grid of the results
+        metadata - dict (default: None)
+            JSON serializable information stored as the 'metadata' attribute
+        dtype - type (default: float)
+            type the results are stored as
+        chunk - int (default: 64)
+            paths per HDF5 chunk
+        """
+        import h5py # only needed for this format
+
+        self.file_name = file_name
+        self.wave  = np.asarray(wave, dtype=float)
+        self.dtype = dtype
+        self._file = h5py.File(file_name, 'a')
+
+        if 'wave' in self._file:
+            if not np.array_equal(self._file['wave'][:], self.wave):
+                self._file.close()
+                raise ValueError('%s holds results on a different wavelength grid' % file_name)
+            return
+
+        string = h5py.string_dtype()
+        self._file.create_dataset('wave', data=self.wave)
+        self._file.create_dataset('throughput', shape=(0, len(self.wave)), maxshape=(None, len(self.wave)),
+                                  dtype=dtype, chunks=(chunk, len(self.wave)))
+        self._file.create_dataset('names', shape=(0,), maxshape=(None,), dtype=string, chunks=(chunk,))
+        self._file.create_dataset('sections', shape=(0,), maxshape=(None,), dtype=string, chunks=(chunk,))
+        self._file.attrs['metadata'] = json.dumps(metadata or {})
+
+    def write(self, names, t, sections=None):
+        """append a block of results, see NpzWriter.write"""
+        names, t = self._block(names, t, sections)
+        n0 = self._file['names'].shape[0]
+        n1 = n0 + len(names)
+        for key in ('throughput', 'names', 'sections'):
+            self._file[key].resize(n1, axis=0)
+
+        self._file['throughput'][n0:n1] = t
+        self._file['names'][n0:n1] = names
+        self._file['sections'][n0:n1] = [json.dumps(list(s)) for s in sections] \
+                                        if sections is not None else [''] * len(names)
+
+    def close(self):
+        self._file.close()
+
+
+class TextWriter(_Writer):
+    """
+    Comma separated columns, wavelength first then one column per path,
+    like the np.savetxt files. Columns are kept until close
+
+    """
+    def __init__(self, file_name, wave, metadata=None, dtype=float, fmt='%.18e'):
+        """
+        inputs
+        ------
+        file_name - str
+            file to write, overwritten on close
+        wave - array [nm]
+            wavelength grid of the results
+        metadata - dict (default: None)
+            JSON serializable information, written as the first header line
+        dtype - type (default: float)
+            type the results are kept as
+        fmt - str (default: '%.18e')
+            number format passed to np.savetxt
+        """
+        self.file_name = file_name
+        self.wave  = np.asarray(wave, dtype=float)
+        self.dtype = dtype
+        self.fmt   = fmt
+        self.metadata = dict(metadata or {})
+        self.names, self.sections, self._blocks = [], [], []
+
+    def write(self, names, t, sections=None):
+        """add a block of results, see NpzWriter.write"""
+        names, t = self._block(names, t, sections)
+        self.names += names
+        self.sections += [list(s) for s in sections] if sections is not None else [None] * len(names)
+        self._blocks.append(t)
+
+    def close(self):
+        t = np.vstack(self._blocks) if self._blocks else np.zeros((0, len(self.wave)))
+        metadata = dict(self.metadata, path_sections=self.sections)
+        np.savetxt(self.file_name, np.vstack((self.wave, t)).T, delimiter=',', fmt=self.fmt,
+                   header=json.dumps(metadata) + '\n' + ','.join(['wavelength (nm)'] + self.names))
+
+
+class StreamWriter(_Writer):
+    """
+    Appends chunks of wavelengths for a fixed set of paths, so results on
+    a grid too large to hold are written as they are computed
+
+    """
+    def __init__(self, file_name, names, fmt=None, metadata=None, dtype=float, sections=None, fmt_text='%.18e'):
+        """
+        inputs
+        ------
+        file_name - str
+            file to write, overwritten if it exists
+        names - list
+            name of each path
+        fmt - str (default: None)
+            'npz', 'hdf5' or 'text'. None picks from the file extension
+        metadata - dict (default: None)
+            JSON serializable information to store with the results
+        dtype - type (default: float)
+            type the results are stored as, e.g. np.float32 to halve the size
+        sections - list (default: None)
+            list of section keys of each path
+        fmt_text - str (default: '%.18e')
+            number format of text files
+        """
+        if fmt is None:
+            fmt = FORMATS.get(os.path.splitext(file_name)[1].lower())
+        if fmt not in EXTENSIONS:
+            raise ValueError('fmt must be one of %s, not %s' % (list(EXTENSIONS), fmt))
+        if sections is not None and len(sections) != len(names):
+            raise ValueError('need one list of sections per name')
+
+        self.file_name = file_name
+        self.fmt   = fmt
+        self.names = [str(name) for name in names]
+        self.dtype = dtype
+        self.fmt_text = fmt_text
+        self.n_chunks = 0
+        sections = [list(s) for s in sections] if sections is not None else None
+
+        if fmt == 'npz':
+            self._file = zipfile.ZipFile(file_name, 'w', allowZip64=True)
+            self._put('metadata', np.array(json.dumps(metadata or {})))
+            self._put('names_000000', np.array(self.names))
+            if sections is not None:
+                self._put('sections_000000', np.array(json.dumps(sections)))
+        elif fmt == 'hdf5':
+            import h5py # only needed for this format
+
+            string = h5py.string_dtype()
+            self._file = h5py.File(file_name, 'w')
+            self._file.create_dataset('wave', shape=(0,), maxshape=(None,), dtype=float, chunks=True)
+            self._file.create_dataset('throughput', shape=(len(self.names), 0), maxshape=(len(self.names), None),
+                                      dtype=dtype, chunks=True)
+            self._file.create_dataset('names', data=self.names, dtype=string)
+            self._file.create_dataset('sections', data=[json.dumps(s) for s in sections] if sections is not None
+                                      else [''] * len(self.names), dtype=string)
+            self._file.attrs['metadata'] = json.dumps(metadata or {})
+        else:
+            self._file = open(file_name, 'w')
+            header = json.dumps(dict(metadata or {}, path_sections=sections or [None] * len(self.names)))
+            self._file.write('# %s\n# %s\n' % (header, ','.join(['wavelength (nm)'] + self.names)))
+
+    def write(self, wave, t):
+        """
+        append a chunk of wavelengths
+
+        inputs
+        ------
+        wave - array [nm]
+            wavelengths of the chunk, following on from the last chunk
+        t - array
+            (paths x chunk) throughput
+        """
+        wave = np.asarray(wave, dtype=float)
+        t = np.asarray(t, dtype=self.dtype).reshape(len(self.names), -1)
+        if t.shape[1] != len(wave):
+            raise ValueError('expected (%s, %s) results, got %s' % (len(self.names), len(wave), t.shape))
+
+        if self.fmt == 'npz':
+            chunk = '%06d' % self.n_chunks
+            self._put('wave_' + chunk, wave)
+            self._put('throughput_chunk_' + chunk, t)
+        elif self.fmt == 'hdf5':
+            n0 = self._file['wave'].shape[0]
+            n1 = n0 + len(wave)
+            self._file['wave'].resize(n1, axis=0)
+            self._file['throughput'].resize(n1, axis=1)
+            self._file['wave'][n0:n1] = wave
+            self._file['throughput'][:, n0:n1] = t
+        else:
+            np.savetxt(self._file, np.vstack((wave, t)).T, delimiter=',', fmt=self.fmt_text)
+        self.n_chunks += 1
+
+    def close(self):
+        self._file.close()
+
+    def _put(self, name, array):
+        with self._file.open(name + '.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+
+def read_output(file_name, fmt=None):
+    """
+    read results written by any of the writers
+
+    inputs
+    ------
+    file_name - str
+        file to read
+    fmt - str (default: None)
+        'npz', 'hdf5' or 'text'. None picks from the file extension
+
+    outputs
+    -------
+    results - dictionary
+        'wave' grid, 'names' and 'sections' of the paths, 'throughput'
+        (paths x wavelength) array and 'metadata' dict
+    """
+    if fmt is None:
+        fmt = FORMATS.get(os.path.splitext(file_name)[1].lower())
+
+    if fmt == 'npz':
+        with np.load(file_name) as f:
+            chunks = sorted(k[len('wave_'):] for k in f.files if k.startswith('wave_'))
+            if 'wave' not in f.files:
+                # written by StreamWriter, one entry per chunk of wavelengths
+                names = [str(name) for name in f['names_000000']]
+                return {'wave'      : np.concatenate([f['wave_' + c] for c in chunks] or [np.zeros(0)]),
+                        'names'     : names,
+                        'sections'  : json.loads(str(f['sections_000000'])) if 'sections_000000' in f.files
+                                      else [None] * len(names),
+                        'throughput': np.hstack([f['throughput_chunk_' + c] for c in chunks]
+                                                or [np.zeros((len(names), 0))]),
+                        'metadata'  : json.loads(str(f['metadata']))}
+            blocks = sorted(k[len('throughput_'):] for k in f.files if k.startswith('throughput_'))
+            sections = []
+            for b in blocks:
+                n = len(f['names_' + b])
+                sections += json.loads(str(f['sections_' + b])) if 'sections_' + b in f.files else [None] * n
+            return {'wave'      : f['wave'],
+                    'names'     : [str(name) for b in blocks for name in f['names_' + b]],
+                    'sections'  : sections,
+                    'throughput': np.vstack([f['throughput_' + b] for b in blocks]) if blocks
+                                  else np.zeros((0, len(f['wave']))),
+                    'metadata'  : json.loads(str(f['metadata']))}
+
+    if fmt == 'hdf5':
+        import h5py
+        with h5py.File(file_name, 'r') as f:
+            return {'wave'      : f['wave'][:],
+                    'names'     : [n.decode() if isinstance(n, bytes) else n for n in f['names'][:]],
+                    'sections'  : [json.loads(s) if s else None
+                                   for s in (s.decode() if isinstance(s, bytes) else s for s in f['sections'][:])],
+                    'throughput': f['throughput'][:],
+                    'metadata'  : json.loads(f.attrs['metadata'])}
+
+    if fmt == 'text':
+        with open(file_name) as f:
+            header = [f.readline()[2:].strip(), f.readline()[2:].strip()]
+        t = np.loadtxt(file_name, delimiter=',', ndmin=2).T
+        metadata = json.loads(header[0])
+        return {'wave'      : t[0],
+                'names'     : header[1].split(',')[1:],
+                'sections'  : metadata.pop('path_sections'),
+                'throughput': t[1:],
+                'metadata'  : metadata}
+
+    raise ValueError('fmt must be one of %s, not %s' % (sorted(set(FORMATS.values())), fmt))
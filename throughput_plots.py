@@ -0,0 +1,133 @@
+# Plots of CalcThroughput results
+#
+# Kept apart from cThroughput.py so computing throughputs never imports
+# matplotlib. The CalcThroughput plot methods import this module the
+# first time they are called. The 14 pt font the plots were made with is
+# set for each plot with rc_context rather than globally
+import matplotlib.pylab as plt
+import numpy as np
+import os
+from matplotlib.ticker import MultipleLocator
+
+from cThroughput import yJ, HK
+
+FONT = {'font.size' : 14}
+
+
+def plot_total_throughput(ct,label='test',ax=None,save_path=None):
+    """Plot ct.total_throughput
+    inputs
+    -----
+    ct - CalcThroughput
+        budget after ct.run
+    label - str
+			name to label the plot
+    save_path - str (default None)
+			path to save the plot image and the total throughput arrays 
+    """
+    with plt.rc_context(FONT):
+        if ax==None:    fig, ax = plt.subplots(1, 1, figsize=(9,4))
+        ax.fill_between(yJ,y1=0,y2=1,facecolor='blue',alpha=0.1,zorder=-100)
+        ax.fill_between(HK,y1=0,y2=1,facecolor='red',alpha=0.1)
+
+        #ax.text(385.1,0.041,'Requirement',fontsize=9)
+
+        ax.plot(ct.output_wave,ct.total_throughput,'k',label='Total Throughput')
+        ax.legend()
+        #ax.set_ylim(0,np.max(ct.total_throughput) * 1.1)
+
+        # grids!
+        ax.yaxis.grid(True, which='both',alpha=0.5)
+        ax.yaxis.set_minor_locator(MultipleLocator(0.01))
+        ax.yaxis.set_major_locator(MultipleLocator(0.1))
+
+        ax.set_xlabel('Wavelength (nm)',fontsize=12)
+        ax.set_ylabel('Throughput',fontsize=12)
+        ax.grid()
+    
+        plt.title(label)
+    
+        if save_path != None:
+            if not os.path.exists(save_path):
+                os.makedirs(save_path)
+
+            plt.savefig(save_path + '/transmission_total_%s.png'%label,dpi=500)
+
+
+def plot_subsection_components(ct,key_name):
+    """
+    plot subsystem components labeled by key
+
+    inputs
+    -----
+    ct - CalcThroughput
+        budget with section key_name
+    key_name - str
+        section to plot the elements of
+    """
+    with plt.rc_context(FONT):
+        includes, types, values, filenames, elements = ct.prescription
+
+        total = np.ones_like(ct.wave)
+
+        fig, ax = plt.subplots(1, 1, figsize=(8,5))
+        for i, include in enumerate(includes):
+            # start a dictionary entry for new section
+            if types[i] == 'Note':
+                key = elements[i]
+            if key==key_name:
+                if include == 1:
+                    t = ct._elementCurve(i)
+                    if types[i]=='Coating' or types[i]=='coating':
+                        ax.plot(ct.wave,t,label=elements[i])
+                    if types[i]=='Constant' or types[i]=='constant':
+                        ax.plot(ct.wave,ct.wave*0+t,label=elements[i])
+                    total*=t
+
+        ax.fill_between(yJ,y1=0,y2=1,facecolor='blue',alpha=0.1,zorder=-100)
+        ax.fill_between(HK,y1=0,y2=1,facecolor='red',alpha=0.1)
+        ax.set_xlabel('Wavelength [nm]')
+        ax.set_ylabel('Transmission')
+    
+        ax.plot(ct.wave,total,'k',lw=2)
+        plt.legend(fontsize=8)
+        plt.grid()
+
+
+def plot_subsections(ct,keys,ax=None,save_path=None,label='test'):
+    """ plot transmission for each subsystem
+    
+    inputs
+    -----
+    ct - CalcThroughput
+        budget to plot the sections of
+    keys - list
+        list of subsystem keywords to include in the plot e.g. 'AO' or 'FEI COMMON'
+     """
+    with plt.rc_context(FONT):
+        # define specific things
+        if ax==None: fig, ax = plt.subplots(1, 1, figsize=(9,4))
+
+        for k in keys: 
+            # only plot if not ones
+            if np.any(ct.transmission_dic[k]!=1): 
+                ax.plot(ct.wave,ct.transmission_dic[k],label=k) 
+
+        ax.fill_between(yJ,y1=0,y2=1,facecolor='blue',alpha=0.3)
+        ax.fill_between(HK,y1=0,y2=1,facecolor='red',alpha=0.3)
+        ax.set_ylim(0,1.1)
+
+        ax.set_xlabel('Wavelength (nm)',fontsize=12)
+        ax.set_ylabel('Throughput',fontsize=12)
+        plt.title(label)
+    
+        ax.legend(fontsize=7)
+        ax.grid()
+
+        if save_path != None:   
+            if not os.path.exists(save_path):
+                os.makedirs(save_path)
+
+            np.savetxt(save_path + './transmission_%s.png'%label, np.vstack((ct.output_wave,ct.total_throughput)).T,delimiter=',',header='wavelength (nm),transmission (I/F) ')
+
+        return ax